@@ -0,0 +1,103 @@
+import weakref
+import numpy as np
+import pm4py
+
+### graph index of a bpmn, built once per model: integer node ids, node kinds, gateway directions and the arcs as adjacency lists
+### the stages that walk the model (gateway predecessors and successors, execution plan, task names) read the index
+### instead of the pm4py objects (no isinstance chains and no reads of the name-mangled gateway direction on every step)
+
+# node kinds
+TASK = 0
+EXCLUSIVE = 1
+PARALLEL = 2
+END = 3
+OTHER = 4
+START = 5
+# activities that are not tasks (e.g. sub processes)
+ACTIVITY = 6
+
+# gateway directions
+UNSPECIFIED = 0
+DIVERGING = 1
+CONVERGING = 2
+
+DIRECTIONS = {
+    pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING: DIVERGING,
+    pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING: CONVERGING,
+}
+
+# graph index per bpmn (dropped with the model)
+graph_indices = weakref.WeakKeyDictionary()
+
+def node_kind(node):
+    if isinstance(node, pm4py.objects.bpmn.obj.BPMN.Task):
+        return TASK
+    if isinstance(node, pm4py.objects.bpmn.obj.BPMN.Activity):
+        return ACTIVITY
+    if isinstance(node, pm4py.objects.bpmn.obj.BPMN.StartEvent):
+        return START
+    if isinstance(node, pm4py.objects.bpmn.obj.BPMN.EndEvent):
+        return END
+    if isinstance(node, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway):
+        return EXCLUSIVE
+    if isinstance(node, pm4py.objects.bpmn.obj.BPMN.ParallelGateway):
+        return PARALLEL
+    return OTHER
+
+class BpmnGraph:
+
+    def __init__(self, bpmn):
+        # nodes in the order of bpmn.get_nodes(), arcs in the order of the out arcs of the nodes
+        self.nodes = list(bpmn.get_nodes())
+        self.node_ids = {node: index for index, node in enumerate(self.nodes)}
+        self.n_flows = len(bpmn.get_flows())
+        self.names = [node.name for node in self.nodes]
+        self.kind = np.array([node_kind(node) for node in self.nodes], dtype=np.int8)
+        self.direction = np.array([
+            DIRECTIONS.get(node._Gateway__gateway_direction, UNSPECIFIED) if isinstance(node, pm4py.objects.bpmn.obj.BPMN.Gateway) else UNSPECIFIED
+            for node in self.nodes
+        ], dtype=np.int8)
+
+        # per node: arc ids of the out arcs and the in arcs (in the order of pm4py), per arc: source and target node
+        self.arcs = []
+        self.out_arcs = []
+        for node in self.nodes:
+            self.out_arcs.append(list(range(len(self.arcs), len(self.arcs) + len(node.get_out_arcs()))))
+            self.arcs.extend(node.get_out_arcs())
+        self.arc_ids = {arc: index for index, arc in enumerate(self.arcs)}
+        self.arc_source = [self.node_ids[arc.get_source()] for arc in self.arcs]
+        self.arc_target = [self.node_ids[arc.get_target()] for arc in self.arcs]
+        self.in_arcs = [[self.arc_ids[arc] for arc in node.get_in_arcs()] for node in self.nodes]
+
+        # python lists of the kinds and directions for the searches (scalar access to lists is faster than to numpy arrays)
+        self.kind_list = self.kind.tolist()
+        self.direction_list = self.direction.tolist()
+
+    def n_nodes(self):
+        return len(self.nodes)
+
+    def nodes_of_kind(self, kind, direction=None):
+        selected = self.kind == kind
+        if direction is not None:
+            selected &= self.direction == direction
+        return np.flatnonzero(selected).tolist()
+
+    # names of the tasks (without tasks that have no name)
+    def task_names(self):
+        return {self.names[node] for node in self.nodes_of_kind(TASK) if self.names[node]}
+
+    # flags of the nodes that are in the list of nodes (e.g. the new activities of evaluator_simulation.get_new_activities)
+    def node_flags(self, nodes):
+        flags = [False] * self.n_nodes()
+        for node in nodes:
+            if node in self.node_ids:
+                flags[self.node_ids[node]] = True
+        return flags
+
+# graph index of the bpmn, built on first use (again if nodes or flows were added or removed since)
+def get_graph(bpmn):
+    graph = graph_indices.get(bpmn)
+    if graph is None or graph.n_nodes() != len(bpmn.get_nodes()) or graph.n_flows != len(bpmn.get_flows()):
+        graph = BpmnGraph(bpmn)
+        graph_indices[bpmn] = graph
+    return graph
@@ -33,7 +33,7 @@ def get_unknown_costs(bpmn, defined_costs):
 
     return unknown_costs
 
-def request_unknown_costs(unknown_costs, defined_costs):
+def request_unknown_costs(unknown_costs, defined_costs, reasoning_effort=None):
     if len(unknown_costs)>0:
         prompt = cost_prompting.add_prompt_cost(
             json.dumps(defined_costs),
@@ -49,7 +49,7 @@ def request_unknown_costs(unknown_costs, defined_costs):
 
         # request the unknown durations from the LLM
         try:
-            unknown_costs_estimates = json.loads(cost_requests.OpenAI_Call_Costs(prompt))
+            unknown_costs_estimates = json.loads(cost_requests.OpenAI_Call_Costs(prompt, reasoning_effort=reasoning_effort))
         except json.JSONDecodeError:
             print("Failed to parse cost estimates from model response.")
             raise
@@ -76,22 +76,29 @@ def request_unknown_costs(unknown_costs, defined_costs):
 
     return defined_costs, unknown_costs_estimates
 
+# the cost per trace comes from the results if the cost kpi ran with the evaluation (kpi_accumulators.CostKPI),
+# otherwise it is computed from the traces in one vectorized step
 def evaluate_costs(defined_costs, results_df):
 
-    # add new cost column
-    results_df["Cost"] = np.nan
-
-    # sort the columns
+    if "Cost" not in results_df.columns:
+        results_df = results_df.copy()
+        # one row per event, the costs are summed back per trace (empty traces cost 0)
+        events = results_df["Trace"].explode().dropna()
+        unknown_activities = set(events) - set(defined_costs)
+        if unknown_activities:
+            raise KeyError(f"No cost defined for the activities: {sorted(unknown_activities)}")
+        event_costs = events.map(defined_costs).astype(float)
+        results_df["Cost"] = event_costs.groupby(level=0).sum().reindex(results_df.index, fill_value=0.0)
+
+    # sort the columns (further kpi columns stay behind the cost)
     if "Adj. Duration" in results_df.columns:
-        results_df = results_df[["Duration", "Adj. Duration", "Cost", "Percentage", "Trace"]]
+        columns = ["Duration", "Adj. Duration", "Cost"]
     else:
-        results_df = results_df[["Duration", "Cost", "Percentage", "Trace"]]
-
-    for index, row in results_df.iterrows():
-        results_df.at[index, "Cost"] = sum([defined_costs[activity] for activity in row["Trace"]])
+        columns = ["Duration", "Cost"]
+    kpi_columns = [column for column in results_df.columns if column not in columns + ["Percentage", "Trace"]]
+    results_df = results_df[columns + kpi_columns + ["Percentage", "Trace"]]
 
     # calculate the mean costs of the traces
     mean_costs = sum(results_df["Cost"] * (results_df["Percentage"] / 100))
         
     return results_df, mean_costs
-
@@ -3,7 +3,8 @@ from openai import AzureOpenAI
 from config import AZURE_OPENAI_API_KEY, AZURE_OPENAI_API_VERSION, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_MODEL, AZURE_OPENAI_REASONING_EFFORT
 
 
-def OpenAI_Call_Durations(prompt):
+# reasoning_effort: overrides the configured reasoning effort
+def OpenAI_Call_Durations(prompt, reasoning_effort=None):
 
     # define the client
     client = AzureOpenAI(
@@ -18,7 +19,7 @@ def OpenAI_Call_Durations(prompt):
         messages=[
             {"role": "user", "content": prompt}
         ],
-        reasoning_effort=AZURE_OPENAI_REASONING_EFFORT,
+        reasoning_effort=reasoning_effort or AZURE_OPENAI_REASONING_EFFORT,
         response_format={"type": "json_object"},
     )
     return chat_completion.choices[0].message.content
@@ -1,321 +1,357 @@
-import pm4py
+import bisect
+import functools
+import time
 import numpy as np
 import simpy
 import pandas as pd
-import pprint
 
-from evaluator import sim_probabilities, sim_durations
+from evaluator import sim_probabilities, sim_durations, sim_plan, sim_batch, sim_parallel, sim_adaptive, sim_aggregate, sim_random, sim_tracing, sim_analytic, sim_enumeration, bpmn_graph
 
 # get new activities in the bpmn
 def get_new_activities(bpmn, log_activities):
-    new_activities = [node for node in bpmn.get_nodes() if isinstance(node, pm4py.objects.bpmn.obj.BPMN.Activity) and node.name not in log_activities]
+    graph = bpmn_graph.get_graph(bpmn)
+    new_activities = [graph.nodes[node] for node in range(graph.n_nodes()) if graph.kind_list[node] in (bpmn_graph.TASK, bpmn_graph.ACTIVITY) and graph.names[node] not in log_activities]
     return new_activities
 
-# simulation with simpy
-def simulate_process(env, bpmn_graph, gateway_arc_probabilities, new_activities, sim_durations_df):
-
-    def handle_next_node(node, predecessor):
-
-        if isinstance(node, pm4py.objects.bpmn.obj.BPMN.Task):
-            return env.process(task(env, node, predecessor))
-        
-        elif isinstance(node, pm4py.objects.bpmn.obj.BPMN.ParallelGateway):
-            return env.process(parallel_gateway(env, node, predecessor))
-
-        elif isinstance(node, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway):
-            return env.process(exclusive_gateway(node, predecessor))
-
-        elif isinstance(node, pm4py.objects.bpmn.obj.BPMN.EndEvent):
-            debug_log.append("End of process reached at " + str(env.now))
-            # debugging: enable to see the debug log
-            # pprint.pprint(debug_log)
-            return env.timeout(0) # end of process reached
-
-    def task(env, task, predecessor):
-        # get the name of the task
-        task_name = task.name
-        # get the duration of the task
-        task_duration = sim_durations_df[sim_durations_df["activity"] == task_name]["weighted_significant_duration"].values[0]
-
-        debug_log.append("Task '" + task_name + "' started at " + str(env.now))
-        yield env.timeout(task_duration)
-        debug_log.append("Task '" + task_name + "' finished at " + str(env.now))
-
-        # append the task to the visited events
-        trace.append(task)
-
-        # if task is a new activity, the predecessor remains the same
-        if task in new_activities:
-            predecessor = predecessor
-        else:
-            predecessor = task
-            
-        out_arc = task.get_out_arcs()[0]
-        next_node = out_arc.get_target()
-
-        proc = handle_next_node(next_node, predecessor)
-        if proc: # only yield if there is a valid process
-            yield proc
-
-    def exclusive_gateway(gateway, predecessor):
-        if gateway._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING:
-                
-            # increment the gateway encounter (encountering the gateway for the div_exclusive_encounter[gateway] time)
-            div_exclusive_encounter[gateway] += 1
-
-            # iterate through all diverging gateways that have encounter >= 1 and increment the gateways since the last encounter
-            for div_gateway in diverging_exclusive_gateways:
-                if div_exclusive_encounter[div_gateway] >= 1:
-                    # append the list of gateways since the last encounter
-                    div_exclusive_last[div_gateway]["gateways_since_last_encounter"].append(gateway)
-
-            # get the gateways since last encounter for the current gateway
-            gateways_since_last_encounter = div_exclusive_last[gateway]["gateways_since_last_encounter"]
-            # reset the gateways since last encounter for the current gateway
-            div_exclusive_last[gateway]["gateways_since_last_encounter"] = []
-
-            # if the current encounter is in the probabilities, get the probabilities
-            if div_exclusive_encounter[gateway] in gateway_arc_probabilities[gateway][predecessor]:
-                # Get the probabilities of the arcs
-                probabilities = gateway_arc_probabilities[gateway][predecessor][div_exclusive_encounter[gateway]]
-
-            # if there are no probabilities for the current encounter, artificial probabilities are calculated to exit the loop as soon as possible
+# per-case state of the simpy simulation, so that any number of cases can run in one environment
+class CaseState:
+
+    __slots__ = ("case", "uniforms", "traced", "trace", "encounter", "last_arcs", "since_last_encounter", "waiting", "available", "excluded", "join_counter", "counters", "end")
+
+    def __init__(self, plan, case, uniforms, traced):
+        self.case = case
+        self.uniforms = uniforms
+        # tracing: events only for sampled cases, counters (gateway decisions, artificial fallbacks) only with a tracer
+        self.traced = traced
+        self.counters = [0, 0]
+
+        # list for the trace of visited events
+        self.trace = []
+
+        # state of the diverging exclusive gateways: encounters, last taken arc position, first gateway since the last encounter
+        self.encounter = [0] * plan["n_xor"]
+        self.last_arcs = [None] * plan["n_xor"]
+        self.since_last_encounter = [-1] * plan["n_xor"]
+        self.waiting = []
+
+        # artificial probabilities after the last encounter: bitmask of the available arcs and the temporarily excluded arc
+        self.available = plan["full_masks"].tolist()
+        self.excluded = [-1] * plan["n_xor"]
+
+        # counters of the converging parallel gateways (number of incoming arcs)
+        self.join_counter = plan["n_in"][plan["join_nodes"]].tolist()
+
+        # end of the case (simulated time)
+        self.end = 0.0
+
+# build the simpy process of a case over the compiled execution plan: every branch of the case walks the plan in an explicit loop
+# the lookups are prepared once and shared by all cases, everything that changes during a case lives in its CaseState
+# tracer: optional SimulationTracer, without one the cases are simulated without any recording
+def compile_case_process(plan, tracer=None):
+
+    names = plan["names"]
+    labels = plan["labels"]
+    kind = plan["kind"].tolist()
+    diverging = plan["diverging"].tolist()
+    duration = plan["duration"].tolist()
+    is_new = plan["is_new"].tolist()
+    n_out = plan["n_out"].tolist()
+    xor_slot = plan["xor_slot"].tolist()
+    join_slot = plan["join_slot"].tolist()
+    successors = plan["successor_lists"]
+    cumulative_rows = plan["cumulative_rows"]
+    fallback_lists = plan["fallback_lists"]
+    counting = tracer is not None
+    first = int(plan["first"])
+    start = int(plan["start"])
+
+    def branch(env, state, node, predecessor):
+        trace = state.trace
+        encounter = state.encounter
+        last_arcs = state.last_arcs
+        since_last_encounter = state.since_last_encounter
+        waiting = state.waiting
+        available = state.available
+        excluded = state.excluded
+        join_counter = state.join_counter
+        counters = state.counters
+
+        while True:
+
+            if kind[node] == sim_plan.TASK:
+                yield env.timeout(duration[node])
+                if state.traced:
+                    tracer.task(state.case, names[node], env.now - duration[node], env.now)
+
+                # append the task to the visited events
+                trace.append(node)
+
+                # if task is a new activity, the predecessor remains the same
+                if not is_new[node]:
+                    predecessor = node
+                node = successors[node][0]
+
+            elif kind[node] == sim_plan.EXCLUSIVE:
+                slot = xor_slot[node]
+
+                # increment the gateway encounter (encountering the gateway for the encounter[slot] time)
+                if diverging[node]:
+                    encounter[slot] += 1
+                    if since_last_encounter[slot] == -1 and slot not in waiting:
+                        waiting.append(slot)
+
+                # this gateway is the first gateway since the last encounter of all waiting diverging gateways
+                for waiting_slot in waiting:
+                    since_last_encounter[waiting_slot] = node
+                waiting.clear()
+
+                # if it is a converging gateway, we only have one out arc and go to the next node. the current predecessor remains the same
+                if not diverging[node]:
+                    node = successors[node][0]
+                    continue
+
+                # get the first gateway since the last encounter and reset it for the current gateway
+                gateway_following_last_arc = since_last_encounter[slot]
+                since_last_encounter[slot] = -1
+                waiting.append(slot)
+
+                # if the current encounter is in the probabilities, get the precomputed cumulative row of the arc positions
+                cumulative = cumulative_rows.get((node, predecessor, encounter[slot]))
+
+                # if there are no probabilities for the current encounter, artificial probabilities are used to exit the loop as soon as possible
+                # the arcs still available are a bitmask, every mask has a precomputed uniform row
+                if cumulative is None:
+                    last_arc = last_arcs[slot]
+
+                    # check if last arc led into a simple loop --> check direction of the following gateway
+                    if not diverging[gateway_following_last_arc]:
+                        # permanent exclusion: delete the last taken arc from the available arcs
+                        available[slot] &= ~(1 << last_arc)
+                        excluded[slot] = -1
+
+                    elif available[slot].bit_count() > 1:
+                        # temporary exclusion: if > 1 arc left, exclude the last taken arc until the next exclusion
+                        excluded[slot] = last_arc
+
+                    # uniform over the available arcs without the excluded one (marginal case: no arc left --> uniform over the available arcs)
+                    mask = available[slot] & ~(1 << excluded[slot]) if excluded[slot] >= 0 else available[slot]
+                    if mask == 0:
+                        mask = available[slot]
+                    cumulative = fallback_lists[mask] if fallback_lists is not None else sim_plan.uniform_cumulative([mask], len(successors[node]))[0].tolist()
+                    if counting:
+                        counters[1] += 1
+
+                # Based on the probabilities, choose the next node (the predecessor remains the same): first arc whose cumulative probability exceeds the uniform
+                last_arcs[slot] = bisect.bisect_right(cumulative, state.uniforms.draw(node, predecessor, encounter[slot]))
+                if counting:
+                    counters[0] += 1
+                    if state.traced:
+                        tracer.decision(state.case, labels[node], env.now, labels[predecessor], encounter[slot], last_arcs[slot], labels[successors[node][last_arcs[slot]]], (node, predecessor, encounter[slot]) not in cumulative_rows)
+                node = successors[node][last_arcs[slot]]
+
+            elif kind[node] == sim_plan.PARALLEL:
+
+                # converging: access the counter of the gateway and deduct 1, only the last incoming branch continues
+                if not diverging[node]:
+                    join_counter[join_slot[node]] -= 1
+                    if join_counter[join_slot[node]] != 0:
+                        return
+                    # normal converging gateway: continue with the next node
+                    if n_out[node] == 1:
+                        node = successors[node][0]
+                        continue
+
+                # diverging (or converging and diverging at the same time): start all branches and wait for them
+                yield env.all_of([env.process(branch(env, state, target, predecessor)) for target in successors[node]])
+                return
+
             else:
-                debug_log.append("End of encounters for diverging gateway " + str(gateway.name))
-
-                # get the last arc
-                last_arc = div_exclusive_last[gateway]["last_arc"]
-
-                # get the exclusive gateway that followed the last arc first
-                gateway_following_last_arc = gateways_since_last_encounter[0]
-
-                # check if last arc led into a simple loop --> check direction of the following gateway
-                if gateway_following_last_arc._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING:
-                    
-                    # permanent exclusion: delete the key of the last taken arc from the div_exclusive_art_probabilities
-                    debug_log.append("Permanent exclusion of arc leading to loop: " + str(last_arc))
-                    div_exclusive_art_probabilities[gateway].pop(last_arc)
-                    num_remaining_arcs = len(div_exclusive_art_probabilities[gateway])
-                    debug_log.append("Number of remaining arcs: " + str(num_remaining_arcs))
-                    probability_per_arc = 1/num_remaining_arcs
-                    # set all probabilities in div_exclusive_art_probabilities to the probability per arc
-                    for arc in div_exclusive_art_probabilities[gateway]:
-                        div_exclusive_art_probabilities[gateway][arc] = probability_per_arc
-                        
-                elif len(div_exclusive_art_probabilities[gateway]) > 1:
-                        
-                    # temporary exclusion: if > 1 arc left, set the probability of the last taken arc temporarily to 0
-                    debug_log.append("Temporary exclusion of arc leading to loop: " + str(last_arc))
-                    div_exclusive_art_probabilities[gateway][last_arc] = 0
-                    num_remaining_arcs = len(div_exclusive_art_probabilities[gateway]) - 1
-                    debug_log.append("Number of remaining arcs: " + str(num_remaining_arcs))
-                    probability_per_arc = 1/num_remaining_arcs
-                    # set all probabilities in div_exclusive_art_probabilities to the probability per arc
-                    for arc in div_exclusive_art_probabilities[gateway]:
-                        if arc != last_arc:
-                            div_exclusive_art_probabilities[gateway][arc] = probability_per_arc
-           
-                # Get the probabilities of the arcs
-                probabilities = div_exclusive_art_probabilities[gateway]
-
-            debug_log.append("Probabilities for gateway '" + str(gateway.name) + "' coming from predecessor '" + str(predecessor.name) + "' are: " + str(probabilities))
-
-            # check if probabilities are all 0 (for marginal case: predecessor and successors in log, but no successor follows predecessor in the log)
-            if all(prob == 0 for prob in probabilities.values()):
-                # change the probabilities to 1/len(probabilities) for all arcs
-                num_remaining_arcs = len(probabilities)
-                probability_per_arc = 1/num_remaining_arcs
-                for arc in probabilities:
-                    probabilities[arc] = probability_per_arc
-    
-            # Based on the probabilities, choose the next node
-            next_arc = np.random.choice(list(probabilities.keys()), p=list(probabilities.values()))
-
-            # save the next arc as the last taken arc
-            div_exclusive_last[gateway]["last_arc"] = next_arc
-
-            next_node = next_arc.get_target()
-            debug_log.append("Decided for branch that starts with: " + next_node.name)
-            predecessor = predecessor # predecessor remains the same --> we did not encounter new activity yet, just indicated the direction to go
-    
-            proc = handle_next_node(next_node, predecessor)
-            if proc: # only yield if there is a valid process
-                yield proc
-    
-        # if it is a converging gateway, we only have one out arc and go to the next node. the current predecessor remains the same
-        elif gateway._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING:
-
-            # iterate through all diverging gateways that have encounter >= 1 and increment the gateways since the last encounter
-            for div_gateway in diverging_exclusive_gateways:
-                if div_exclusive_encounter[div_gateway] >= 1:
-                    # append the list of gateways since the last encounter
-                    div_exclusive_last[div_gateway]["gateways_since_last_encounter"].append(gateway)            
-
-            next_arc = gateway.get_out_arcs()[0]
-            next_node = next_arc.get_target()
-            predecessor = predecessor # predecessor remains the same
-            
-            proc = handle_next_node(next_node, predecessor)
-            if proc: # only yield if there is a valid process
-                yield proc
-
-    def parallel_gateway(env, gateway, predecessor):
-        if gateway._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING:
-            debug_log.append("Parallelity started")
-
-            # define the starting nodes of the branches
-            starting_arcs = gateway.get_out_arcs()
-            starting_nodes = [arc.get_target() for arc in starting_arcs]
-            predecessor = predecessor
-
-            # Create all branch processes first and store them
-            branch_processes = []
-            for node in starting_nodes:
-                proc = handle_next_node(node, predecessor)
-                if proc:
-                    branch_processes.append(proc)
-
-            # if the gateway is a diverging and a converging gateway at the same time, we need to change the direction of the gateway back to converging (= default)
-            if len(gateway.get_in_arcs()) > 1:
-                gateway._Gateway__gateway_direction = pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING
-                debug_log.append("Gateway " + str(gateway.name) + " changed to converging")
-            
-            # Yield all processes simultaneously
-            yield env.all_of(branch_processes)
-
-        elif gateway._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING:
-
-            # access the counter of the converging gateway and deduct 1
-            conv_parallel_counter[gateway] -= 1
-
-            # check if the counter is 0
-            if conv_parallel_counter[gateway] == 0:
-                debug_log.append("Parallelity ended")
-
-                # predecessor from the last task in the branch
-                predecessor = predecessor
-
-                # check if the current node is a normal converging parallel gateway
-                if len(gateway.get_out_arcs()) == 1:
-                    next_arc = gateway.get_out_arcs()[0]
-                    next_node = next_arc.get_target()
-
-                # check if parallel gateway is converging and diverging at the same time
-                elif len(gateway.get_out_arcs()) > 1:
-                    # change the type of the current gateway to diverging
-                    gateway._Gateway__gateway_direction = pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING
-                    debug_log.append("Gateway " + str(gateway.name) + " changed to diverging")
-                    # next node is the current node
-                    next_node = gateway
-
-                proc = handle_next_node(next_node, predecessor)
-                if proc:
-                    yield proc
-            
-            else: # if the counter is not 0, do nothing
-                yield env.timeout(0)
-    
-    # get the nodes of the bpmn graph
-    nodes = bpmn_graph.get_nodes()
-
-    # create a debug_log for the simulation
-    debug_log = [] 
-
-    # create a list for the trace of visited events
-    trace = []
-    
-    # get the converging parallel gateways and make a dict with the number of incoming arcs
-    converging_parallel_gateways = [node for node in nodes if isinstance(node, pm4py.objects.bpmn.obj.BPMN.ParallelGateway) and node._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING]
-
-    conv_parallel_counter = {}
-    for gateway in converging_parallel_gateways:
-        in_arcs = gateway.get_in_arcs()
-        in_arcs_count = len(in_arcs)
-        conv_parallel_counter[gateway] = in_arcs_count
-
-    # get the diverging exclusive gateways --> count them up (# encounters)
-    diverging_exclusive_gateways = [node for node in nodes if isinstance(node, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway) and node._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING]
-    
-    # dict to count the encounters of the diverging exclusive gateways
-    div_exclusive_encounter = {}
-    for gateway in diverging_exclusive_gateways:
-        div_exclusive_encounter[gateway] = 0
-
-    # dict to save the last taken arc of the diverging exclusive gateways
-    div_exclusive_last = {}
-    for gateway in diverging_exclusive_gateways:
-        div_exclusive_last[gateway] = {}
-        div_exclusive_last[gateway]["last_arc"] = None
-        div_exclusive_last[gateway]["gateways_since_last_encounter"] = []
-
-    # dict for artificial probabilities after last encounter (initialized with 1)
-    div_exclusive_art_probabilities = {}
-    for gateway in diverging_exclusive_gateways:
-        div_exclusive_art_probabilities[gateway] = {}
-        for out_arc in gateway.get_out_arcs():
-            div_exclusive_art_probabilities[gateway][out_arc] = 1
-
-    # get the start node --> assumption: there is only one start node
-    start_node = [node for node in nodes if isinstance(node, pm4py.objects.bpmn.obj.BPMN.StartEvent)][0]
-
-    # get the first arc --> assumption: we have 1 arc going out of the start node
-    start_node_arc = start_node.get_out_arcs()[0]
-    # get the first node
-    first_node = start_node_arc.get_target()
-    # Define the current predecessor
-    predecessor = start_node
-
-    proc = handle_next_node(first_node, predecessor)
-
-    if proc:
-        yield proc
-
-    # change all tasks in the trace to task.name
-    trace = [task.name for task in trace]
+                # end of process reached (or a node the simulation does not handle)
+                return
+
+    def simulate_case(env, state):
+        yield env.process(branch(env, state, first, start))
+        state.end = env.now
+
+        if counting:
+            tracer.count_decisions(*state.counters)
 
+        # change all tasks in the trace to task.name
+        return tuple(names[task] for task in state.trace)
+
+    return simulate_case
+
+# simulate one case in its own environment
+def run_case(simulate_case, state):
+    env = simpy.Environment()
+    trace = env.process(simulate_case(env, state))
+    env.run()
     return trace
 
-def run_simulation(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df):
-    # run the simulation 10000 times, save the results and calculate the mean
-    results = []
-    np.random.seed(42)
-    for i in range(10000):
+# random streams of the cases: with common random numbers the uniforms are keyed by the decision, with case_seed every case gets its own stream
+# (independent of the order in which the cases run), otherwise all cases share rng
+def case_uniforms(rng, case_seed, case, common_random=None, plan=None):
+    if common_random is not None:
+        return sim_random.CaseCommonRandom(common_random, case, plan["decision_keys"])
+    if case_seed is None:
+        return rng
+    return sim_random.UniformBlocks(np.random.default_rng(np.random.SeedSequence(case_seed, spawn_key=(case,))), block_size=64)
+
+# shared_environment: all replications run as processes of one simpy environment instead of one environment per replication
+# the cases then interleave in time, so they need their own random streams (case_streams, always on for the shared environment)
+# with case streams, both modes give identical traces and durations per case
+# common_random: CommonRandomNumbers for paired comparisons of two models (replaces rng)
+def run_simulation(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, n_runs=10000, rng=None, aggregator=None, tracer=None, shared_environment=False, case_streams=False, common_random=None):
+    # run the simulation 10000 times and add every case to the aggregator
+    # without a given random generator, the legacy seed 42 is used (same stream as np.random.seed(42))
+    if aggregator is None:
+        aggregator = sim_aggregate.VariantAggregator(sim_durations_df)
+    if common_random is not None:
+        case_seed = uniforms = None
+    elif shared_environment or case_streams:
+        # the seed of the case streams is 42 or drawn from the given generator (continues across adaptive batches)
+        case_seed = 42 if rng is None else int(rng.random() * 2 ** 53)
+        uniforms = None
+    else:
+        case_seed = None
+        uniforms = sim_random.UniformBlocks(rng if rng is not None else np.random.RandomState(42))
+
+    # compile the bpmn and the case process once, all replications run over the same plan
+    plan = sim_plan.compile_plan(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, canonical_arcs=common_random is not None)
+    simulate_case = compile_case_process(plan, tracer)
+    first_case = tracer.start_cases(n_runs) if tracer is not None else 0
+    first_common_case = common_random.start_cases(n_runs) if common_random is not None else 0
+    states = (CaseState(plan, first_case + i, case_uniforms(uniforms, case_seed, first_common_case + i, common_random, plan), tracer is not None and tracer.samples(first_case + i)) for i in range(n_runs))
+
+    if shared_environment:
         env = simpy.Environment()
-        trace = env.process(simulate_process(env, bpmn, gateway_arc_probabilities, new_activities, sim_durations_df))
+        cases = [(state, env.process(simulate_case(env, state))) for state in states]
         env.run()
-        results.append({"duration": env.now, "trace": trace.value})
-    results_df = pd.DataFrame(results)
-    return results_df
-
-def get_simulation_results(bpmn, log, log_activities, significant_durations_df, sim_durations_df):
+    else:
+        # one environment per case, each case is added right after it finished
+        cases = ((state, run_case(simulate_case, state)) for state in states)
+
+    # cases are added in the order of their ids, so that both modes aggregate identically
+    for state, trace in cases:
+        aggregator.add(state.end, trace.value)
+        if tracer is not None:
+            tracer.count_cases([len(trace.value)])
+    return aggregator
+
+# available simulation engines: "simpy" simulates one case after the other, "simpy_shared" runs all cases in one simpy environment
+# (own random stream per case), "batch" advances all cases together as numpy arrays
+SIMULATION_ENGINES = {
+    "simpy": run_simulation,
+    "simpy_shared": functools.partial(run_simulation, shared_environment=True),
+    "batch": sim_batch.run_batch_simulation,
+}
+
+# run n_runs replications with the chosen engine and add them to the aggregator
+def run_replications(engine, bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, aggregator, n_runs=10000, workers=None, seed=42, rng=None, tracer=None, common_random=None):
+    # with more than one worker, the replications are split across processes and only their aggregates are merged (seed = seed of the worker streams)
+    # the tracer only records replications that run in this process, common random numbers need the cases in one process
+    if workers is not None and workers > 1 and common_random is None:
+        return sim_parallel.run_parallel_simulation(SIMULATION_ENGINES[engine], bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, aggregator, n_runs=n_runs, workers=workers, seed=seed)
+    return SIMULATION_ENGINES[engine](bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, n_runs=n_runs, rng=rng, aggregator=aggregator, tracer=tracer, common_random=common_random)
+
+# relative_tolerance: run batches of replications until the confidence intervals of both means are narrower than relative_tolerance * mean (at most max_runs)
+# trace_file: write a chrome trace of every trace_sample_every-th case to this file (chrome://tracing or ui.perfetto.dev)
+# common_random: CommonRandomNumbers for paired comparisons (see sim_paired), the durations of the cases are kept in case order
+# analytic: compute the exact expected durations without simulating if the model allows it (no variants table), otherwise simulate
+# engine "enumeration": exact variants and probabilities instead of simulated cases (paths below enumeration_min_probability are pruned,
+# enumeration_top_k keeps the most probable variants), falls back to the simpy simulation if the model cannot be enumerated
+# kpis: kpi accumulators (see kpi_accumulators) computed in the same pass, one column per kpi in the results, the means in simulation_info["kpis"]
+# (the analytic evaluation has no variants, with kpis the model is simulated or enumerated)
+# reasoning_effort: reasoning effort of the request for unknown durations (None: as configured)
+# the wall times of the stages (probabilities, durations, simulation) are in simulation_info["stage_seconds"]
+# the hits and misses of the gateway frequency cache (see sim_probabilities.frequency_cache) are in simulation_info["gateway_cache"]
+def get_simulation_results(bpmn, log, log_activities, significant_durations_df, sim_durations_df, engine="simpy", workers=None, seed=42, n_runs=10000, relative_tolerance=None, batch_size=1000, max_runs=100000, confidence=0.95, trace_file=None, trace_sample_every=100, common_random=None, analytic=False, enumeration_min_probability=1e-6, enumeration_top_k=None, kpis=(), reasoning_effort=None):
+    if engine not in SIMULATION_ENGINES and engine != "enumeration":
+        raise ValueError(f"Unknown simulation engine '{engine}'. Choose one of: {', '.join(list(SIMULATION_ENGINES) + ['enumeration'])}")
+
+    stage_started = time.perf_counter()
     new_activities = get_new_activities(bpmn, log_activities)
+    cache_statistics = dict(sim_probabilities.frequency_cache_statistics)
     gateway_arc_probabilities = sim_probabilities.get_gateway_probabilities(bpmn, log, new_activities)
-    sim_durations_df, unknown_durations_estimates = sim_durations.get_sim_durations(bpmn, significant_durations_df, sim_durations_df)
-    results_df = run_simulation(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df)
-
-    # calculate adjusted duration of the process (adjusted duration = duration - duration of first event)
-    results_df["Adj. Duration"] = np.nan
-    for index, row in results_df.iterrows():
-        first_event = row["trace"][0]
-        first_event_duration = sim_durations_df[sim_durations_df["activity"] == first_event]["weighted_significant_duration"].values[0]
-        # Avoid subtracting more than the simulated duration (loops can exaggerate the first activity duration)
-        effective_first_duration = min(first_event_duration, row["duration"])
-        adjusted_duration = row["duration"] - effective_first_duration
-        results_df.at[index, "Adj. Duration"] = adjusted_duration
-
-    # prepare results summary
-    simulation_results_df = results_df.drop_duplicates(subset="duration").reset_index(drop=True)
-    simulation_results_df['Percentage'] = (simulation_results_df['duration'].map(lambda x: len(results_df[results_df['duration'] == x]) / len(results_df))* 100)
-    
-    # prepare the df for the frontend
-    simulation_results_df.columns = ["Duration", "Trace", "Adj. Duration", "Percentage"]
-    simulation_results_df = simulation_results_df[["Duration", "Adj. Duration", "Percentage", "Trace"]]	
-    simulation_results_df = simulation_results_df.sort_values(by='Percentage', ascending=False).reset_index(drop=True)
-
-    # calculate the mean of durations in results_df
-    mean_duration = np.mean(results_df["duration"])
-
-    # calculate the mean of the adjusted durations
-    adjusted_mean_duration = np.mean(results_df["Adj. Duration"])
+    stage_seconds = {"probabilities": time.perf_counter() - stage_started}
+    gateway_cache = {key: sim_probabilities.frequency_cache_statistics[key] - cache_statistics[key] for key in cache_statistics}
+
+    stage_started = time.perf_counter()
+    sim_durations_df, unknown_durations_estimates = sim_durations.get_sim_durations(bpmn, significant_durations_df, sim_durations_df, reasoning_effort=reasoning_effort)
+    stage_seconds["durations"] = time.perf_counter() - stage_started
+    stage_started = time.perf_counter()
+
+    if analytic and not kpis:
+        try:
+            plan = sim_plan.compile_plan(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df)
+            mean_duration, adjusted_mean_duration = sim_analytic.expected_durations(plan)
+            simulation_results_df = pd.DataFrame(columns=["Duration", "Adj. Duration", "Percentage", "Trace"])
+            stage_seconds["simulation"] = time.perf_counter() - stage_started
+            simulation_results_df.attrs["simulation_info"] = {"engine": "analytic", "replications": 0, "stage_seconds": stage_seconds, "gateway_cache": gateway_cache}
+            print("Analytic evaluation: mean duration ", mean_duration, ", adjusted mean duration ", adjusted_mean_duration)
+            return simulation_results_df, mean_duration, adjusted_mean_duration, unknown_durations_estimates, sim_durations_df
+        except sim_analytic.AnalyticUnsupported as error:
+            print(f"Analytic evaluation not possible ({error}), falling back to the simulation")
+
+    if engine == "enumeration":
+        try:
+            plan = sim_plan.compile_plan(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df)
+            simulation_results_df, mean_duration, adjusted_mean_duration, enumeration_info = sim_enumeration.get_enumeration_results(plan, sim_durations_df, min_probability=enumeration_min_probability, top_k=enumeration_top_k, kpis=kpis)
+            stage_seconds["simulation"] = time.perf_counter() - stage_started
+            simulation_results_df.attrs["simulation_info"] = {"engine": "enumeration", "replications": 0, **enumeration_info, "stage_seconds": stage_seconds, "gateway_cache": gateway_cache}
+            print(f"Enumerated {enumeration_info['variants']} variants covering {enumeration_info['covered_probability']} of the probability")
+            return simulation_results_df, mean_duration, adjusted_mean_duration, unknown_durations_estimates, sim_durations_df
+        except sim_analytic.AnalyticUnsupported as error:
+            print(f"Enumeration not possible ({error}), falling back to the simulation")
+            engine = "simpy"
+
+    # the simulated cases are aggregated per variant while they are simulated
+    aggregator = sim_aggregate.VariantAggregator(sim_durations_df, keep_durations=common_random is not None, kpis=kpis)
+
+    tracer = sim_tracing.SimulationTracer(sample_every=trace_sample_every) if trace_file is not None else None
+    if tracer is not None and workers is not None and workers > 1:
+        print("Tracing is only available for replications in this process, the trace of the parallel workers stays empty")
+    if common_random is not None and workers is not None and workers > 1:
+        print("Common random numbers run all replications in this process")
+
+    if relative_tolerance is None:
+        run_replications(engine, bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, aggregator, n_runs=n_runs, workers=workers, seed=seed, tracer=tracer, common_random=common_random)
+        simulation_info = {"replications": aggregator.replications}
+
+    else:
+        # the serial batches continue one random stream, the parallel batches use one seed sequence per batch
+        rng = np.random.default_rng(seed)
+        def run_batch(batch_runs, batch_index):
+            run_replications(engine, bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, aggregator, n_runs=batch_runs, workers=workers, seed=[seed, batch_index], rng=rng, tracer=tracer, common_random=common_random)
+
+        simulation_info = sim_adaptive.run_adaptive_simulation(run_batch, aggregator, relative_tolerance, batch_size=batch_size, max_runs=max_runs, confidence=confidence)
+        print(f"Adaptive simulation used {simulation_info['replications']} replications (converged: {simulation_info['converged']})")
+        print(f"Confidence interval half width mean: {simulation_info['mean_ci_half_width']}, adjusted mean: {simulation_info['adjusted_mean_ci_half_width']}")
+
+    simulation_info["engine"] = engine
+    simulation_info.update(aggregator.quantile_summary())
+    if kpis:
+        simulation_info["kpis"] = aggregator.kpi_means()
+
+    if tracer is not None:
+        tracer.write(trace_file)
+        simulation_info["tracing"] = tracer.summary()
+        print(f"Simulation trace written to {trace_file}")
+
+    # prepare the df for the frontend (one row per variant)
+    simulation_results_df = aggregator.to_results_df()
+
+    # run information (engine, number of replications, confidence intervals, quantiles) travels with the results
+    simulation_results_df.attrs["simulation_info"] = simulation_info
+    if common_random is not None:
+        simulation_results_df.attrs["case_durations"] = aggregator.case_durations()
+
+    stage_seconds["simulation"] = time.perf_counter() - stage_started
+    simulation_info["stage_seconds"] = stage_seconds
+    simulation_info["gateway_cache"] = gateway_cache
+
+    # calculate the mean of the durations and the adjusted durations
+    mean_duration = aggregator.mean_duration()
+    adjusted_mean_duration = aggregator.adjusted_mean_duration()
 
     return simulation_results_df, mean_duration, adjusted_mean_duration, unknown_durations_estimates, sim_durations_df
@@ -1,22 +1,19 @@
 import pm4py
+import numpy as np
 import pandas as pd
-from datetime import datetime
 
-def evaluate_traces(bpmn, log):
+from evaluator import kpi_accumulators, bpmn_graph
+from preparer import log_shared
 
-    # convert bpmn to petri net
-    net, im, fm = pm4py.convert_to_petri_net(bpmn)
-
-    # Keep only log events that map to BPMN tasks when calculating durations
-    bpmn_tasks = {
-        node.name
-        for node in bpmn.get_nodes()
-        if isinstance(node, pm4py.objects.bpmn.obj.BPMN.Task) and node.name
-    }
-
-    # Conformance checking via token-based replay (faster than alignments for fit detection)
+# fit of every variant in variants (indices of the variant table of the log) by token-based replay on the petri net
+# the replay only looks at the activities, so every variant is replayed once and its fit holds for all of its cases
+# also runs in the workers of log_shared.map_chunks, on the log they attached from shared memory
+def replay_fit_variants(log, variants, net, im, fm):
+    variants = np.asarray(variants, dtype=np.int64)
+    if len(variants) == 0:
+        return np.zeros(0, dtype=bool)
     tbr_diagnostics_df = pm4py.conformance_diagnostics_token_based_replay(
-        log,
+        log.variants_to_dataframe(variants),
         net,
         im,
         fm,
@@ -25,37 +22,53 @@ def evaluate_traces(bpmn, log):
         timestamp_key='time:timestamp',
         return_diagnostics_dataframe=True
     )
+    fit_variant_ids = set(tbr_diagnostics_df.loc[tbr_diagnostics_df['is_fit'], 'case_id'])
+    return np.array([str(variant) in fit_variant_ids for variant in variants.tolist()], dtype=bool)
+
+# log: encoded log (see preparer.log_encoding)
+# kpis: kpi accumulators (see kpi_accumulators) computed per fitting variant, one column per kpi in fitting_traces_percentage_df
+# and their means weighted by the frequencies in fitting_traces_percentage_df.attrs["kpis"]
+# workers: replay the variants in that many processes, the log is published once in shared memory (see preparer.log_shared)
+def evaluate_traces(bpmn, log, kpis=(), workers=None):
+
+    # convert bpmn to petri net
+    net, im, fm = pm4py.convert_to_petri_net(bpmn)
+
+    # Keep only log events that map to BPMN tasks when calculating durations
+    bpmn_tasks = bpmn_graph.get_graph(bpmn).task_names()
+    is_bpmn_task = np.array([activity in bpmn_tasks for activity in log.activities], dtype=bool)
+
+    # Conformance checking via token-based replay (faster than alignments for fit detection), once per variant
+    if workers is not None and workers > 1:
+        variant_fits = np.concatenate(log_shared.map_chunks(replay_fit_variants, log, log.n_variants(), args=(net, im, fm), workers=workers))
+    else:
+        variant_fits = replay_fit_variants(log, np.arange(log.n_variants()), net, im, fm)
+    case_fits = variant_fits[log.case_variants]
 
     # keep only traces that perfectly fit the model
-    fit_case_ids = tbr_diagnostics_df.loc[tbr_diagnostics_df['is_fit'], 'case_id']
+    fit_cases = np.flatnonzero(case_fits).tolist()
 
     # quick exit if nothing fits
-    if fit_case_ids.empty:
+    if not fit_cases:
         empty_df = pd.DataFrame(columns=['duration', 'trace', 'frequency'])
         return empty_df, empty_df.copy(), float('nan')
 
-    filtered_log = log[log['case:concept:name'].isin(fit_case_ids)].copy()
+    # fitting cases per variant, variants in order of their first fitting case
+    variant_cases = {}
+    for case in fit_cases:
+        variant_cases.setdefault(int(log.case_variants[case]), []).append(case)
+
+    # duration of every case in hours, consider only events that are part of the BPMN model (nan for cases without such events)
+    durations = log.case_durations(is_bpmn_task[log.activity_codes])
 
     # collect unique fitting variants together with their statistics
     variant_records = []
 
-    # take filtered log and split by variants
-    for variant, subdf in pm4py.split_by_process_variant(filtered_log):
-        # calculate the number of cases in the variant
-        number_of_cases = len(subdf['case:concept:name'].unique())
-        # get the duration of all individual cases in the variant (case:concept:name is the trace id)
-        case_durations = []
-        for case_id, case_df in subdf.groupby('case:concept:name'):
-            # Consider only events that are part of the BPMN model
-            case_events = case_df[case_df['concept:name'].isin(bpmn_tasks)]
-            if case_events.empty:
-                continue
-            timestamps = case_events['time:timestamp']
-            start_ts = timestamps.min()
-            end_ts = timestamps.max()
-            if isinstance(start_ts, datetime) and isinstance(end_ts, datetime) and end_ts >= start_ts:
-                hours = (end_ts - start_ts).total_seconds() / 3600
-                case_durations.append(hours)
+    for variant, cases in variant_cases.items():
+        # get the duration of all individual cases in the variant (in the order of the case ids)
+        cases = sorted(cases, key=lambda case: log.case_ids[case])
+        case_durations = durations[cases]
+        case_durations = case_durations[~np.isnan(case_durations)].tolist()
 
         number_of_cases = len(case_durations)
 
@@ -64,7 +77,7 @@ def evaluate_traces(bpmn, log):
         else:
             mean_variant_duration_h = sum(case_durations) / number_of_cases
         variant_records.append({
-            'trace': variant,
+            'trace': log.variant_activities(variant),
             'duration': mean_variant_duration_h,
             'frequency': number_of_cases
         })
@@ -81,7 +94,14 @@ def evaluate_traces(bpmn, log):
     fitting_traces_percentage_df["duration"] = fitting_traces_percentage_df["duration"].apply(lambda x: round(x, 2))
     fitting_traces_percentage_df.columns = ["Duration", "Trace", "Percentage"]
     fitting_traces_percentage_df = fitting_traces_percentage_df[["Duration", "Percentage", "Trace"]]
+    if kpis:
+        for kpi in kpis:
+            kpi.start(None)
+        kpi_values = kpi_accumulators.variant_kpi_values(kpis, fitting_traces_df['trace'])
+        fitting_traces_percentage_df = kpi_accumulators.insert_kpi_columns(fitting_traces_percentage_df, kpi_values)
     fitting_traces_percentage_df = fitting_traces_percentage_df.sort_values(by='Percentage', ascending=False).reset_index(drop=True)
+    if kpis:
+        fitting_traces_percentage_df.attrs["kpis"] = kpi_accumulators.kpi_means(kpis, kpi_values, fitting_traces_df['frequency'])
 
     # calculate the mean duration of all fitting traces (weighted by the frequency of the traces)
     mean_duration = (fitting_traces_df['duration'] * fitting_traces_df['frequency']).sum() / fitting_traces_df['frequency'].sum()
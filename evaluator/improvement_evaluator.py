@@ -1,17 +1,41 @@
-from evaluator import evaluator_traces, evaluator_simulation
+import time
+
+from evaluator import evaluator_traces, evaluator_simulation, sim_paired, latency_budget, log_sampling
 
 # evaluate the old process
-def evaluate_old_process(input_bpmn, log, log_activities, significant_durations_df, sim_durations_df):
+# kpis: kpi accumulators (e.g. cost) computed in the trace evaluation and the simulation, one column per kpi in the results
+# budget: LatencyBudget, the log sample and the simulation settings are planned against the remaining time (the old and the new model share it)
+# approximation: evaluate on a part of the log (see log_sampling.approximate_log), the error bounds of mean duration and fitting percentage
+# are in fitting_traces_percentage_df.attrs["error_bounds"], those of the gateway probabilities in simulation_results_df.attrs["gateway_error_bounds"]
+def evaluate_old_process(input_bpmn, log, log_activities, significant_durations_df, sim_durations_df, kpis=(), budget=None, approximation=None):
+
+    sampling_info = None
+    if approximation is not None:
+        log, sampling_info = log_sampling.approximate_log(log, approximation)
+
+    settings = {}
+    if budget is not None:
+        settings = budget.plan_evaluation("old_process", len(log), stages_left=2, traces=True)
+        log = latency_budget.sample_log(log, settings.pop("log_fraction"))
     
     # evaluate old model
     # old model traces results
     print("Trace evaluation old model")
-    fitting_traces_df, fitting_traces_percentage_df, mean_duration_traces = evaluator_traces.evaluate_traces(input_bpmn, log)
+    traces_started = time.perf_counter()
+    fitting_traces_df, fitting_traces_percentage_df, mean_duration_traces = evaluator_traces.evaluate_traces(input_bpmn, log, kpis=kpis)
+    traces_seconds = time.perf_counter() - traces_started
     print("Mean traces duration old model: ", mean_duration_traces)
+    if sampling_info is not None:
+        fitting_traces_percentage_df.attrs["error_bounds"] = {**sampling_info, **log_sampling.trace_error_bounds(input_bpmn, log, fitting_traces_df, sampling_info)}
+        print("Approximation error bounds of the traces: ", fitting_traces_percentage_df.attrs["error_bounds"])
 
     # old model simulation results
     print("Simulation evaluation old model")
-    simulation_results_df, mean_duration_simulation, adjusted_mean_duration, unknown_durations_estimates, sim_durations_df = evaluator_simulation.get_simulation_results(input_bpmn, log, log_activities, significant_durations_df, sim_durations_df)
+    simulation_results_df, mean_duration_simulation, adjusted_mean_duration, unknown_durations_estimates, sim_durations_df = evaluator_simulation.get_simulation_results(input_bpmn, log, log_activities, significant_durations_df, sim_durations_df, kpis=kpis, **settings)
+    if budget is not None:
+        budget.record_evaluation("old_process", len(log), simulation_results_df.attrs["simulation_info"], traces_seconds=traces_seconds)
+    if sampling_info is not None:
+        simulation_results_df.attrs["gateway_error_bounds"] = log_sampling.gateway_error_bounds(input_bpmn, log, evaluator_simulation.get_new_activities(input_bpmn, log_activities), sampling_info)
     print("Mean duration simulation old model: ", mean_duration_simulation)
     print("Adjusted mean duration old model: ", adjusted_mean_duration)
 
@@ -21,11 +45,47 @@ def evaluate_old_process(input_bpmn, log, log_activities, significant_durations_
 
     return fitting_traces_percentage_df, mean_duration_traces, simulation_results_df, mean_duration_simulation, adjusted_mean_duration, unknown_durations_estimates, sim_durations_df
 
-def evaluate_new_process(improved_bpmn, log, log_activities, significant_durations_df, sim_durations_df, mean_duration_simulation):
+# paired: simulate the input model and the improved model again with common random numbers (input_bpmn is needed)
+# and compare them case by case, the comparison statistics are in new_simulation_results_df.attrs["paired_comparison"]
+# budget: LatencyBudget, the simulation settings are planned against the remaining time (the paired simulation always simulates)
+# approximation: as for evaluate_old_process, the error bounds of the gateway probabilities are in new_simulation_results_df.attrs["gateway_error_bounds"]
+def evaluate_new_process(improved_bpmn, log, log_activities, significant_durations_df, sim_durations_df, mean_duration_simulation, input_bpmn=None, paired=False, antithetic=True, kpis=(), budget=None, approximation=None):
+
+    sampling_info = None
+    if approximation is not None:
+        log, sampling_info = log_sampling.approximate_log(log, approximation)
+
+    settings = {}
+    if budget is not None:
+        settings = budget.plan_evaluation("new_process", len(log), stages_left=1, traces=False)
+        log = latency_budget.sample_log(log, settings.pop("log_fraction"))
+
+    if paired:
+        print("Paired simulation evaluation old and new model")
+        paired_settings = {key: value for key, value in settings.items() if key in ("engine", "n_runs")}
+        old_results, new_results, paired_info = sim_paired.get_paired_simulation_results(input_bpmn, improved_bpmn, log, log_activities, significant_durations_df, sim_durations_df, antithetic=antithetic, kpis=kpis, **paired_settings)
+        if budget is not None:
+            budget.record_evaluation("new_process", len(log), new_results[0].attrs["simulation_info"])
+        new_simulation_results_df, new_mean_duration, new_adjusted_mean_duration, new_unknown_durations_estimates, sim_durations_df = new_results
+        new_simulation_results_df.attrs["paired_comparison"] = paired_info
+        if sampling_info is not None:
+            new_simulation_results_df.attrs["gateway_error_bounds"] = log_sampling.gateway_error_bounds(improved_bpmn, log, evaluator_simulation.get_new_activities(improved_bpmn, log_activities), sampling_info)
+        print("Mean duration simulation new model: ", new_mean_duration)
+        print("Adjusted mean duration new model: ", new_adjusted_mean_duration)
+
+        # time saved by the improvement from the paired cases
+        time_saved_percentage = paired_info["time_saved_percentage"]
+        print(f"Time saved by the improvement [%]: {time_saved_percentage} +- {paired_info['time_saved_percentage_ci_half_width']}")
+
+        return new_simulation_results_df, new_mean_duration, new_adjusted_mean_duration, new_unknown_durations_estimates, time_saved_percentage
 
     # evaluate new model
     print("Simulation evaluation new model")
-    new_simulation_results_df, new_mean_duration, new_adjusted_mean_duration, new_unknown_durations_estimates, sim_durations_df = evaluator_simulation.get_simulation_results(improved_bpmn, log, log_activities, significant_durations_df, sim_durations_df)
+    new_simulation_results_df, new_mean_duration, new_adjusted_mean_duration, new_unknown_durations_estimates, sim_durations_df = evaluator_simulation.get_simulation_results(improved_bpmn, log, log_activities, significant_durations_df, sim_durations_df, kpis=kpis, **settings)
+    if budget is not None:
+        budget.record_evaluation("new_process", len(log), new_simulation_results_df.attrs["simulation_info"])
+    if sampling_info is not None:
+        new_simulation_results_df.attrs["gateway_error_bounds"] = log_sampling.gateway_error_bounds(improved_bpmn, log, evaluator_simulation.get_new_activities(improved_bpmn, log_activities), sampling_info)
     print("Mean duration simulation new model: ", new_mean_duration)
     print("Adjusted mean duration new model: ", new_adjusted_mean_duration)
 
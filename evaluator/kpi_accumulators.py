@@ -0,0 +1,102 @@
+import numpy as np
+from collections import Counter
+
+# kpis of a case that follow from the tasks it executed (cost, activity counts, ...): every task adds its value when it completes
+# a variant always executes the same tasks, so the value is computed once per variant and weighted with the number of cases of the variant
+# (the simulation aggregator and the trace evaluator update them in the same pass as the durations, no rescan of the results)
+
+# sum of a value per task over the trace (KeyError for tasks without a value)
+class TaskSumKPI:
+
+    def __init__(self, column, task_values=None):
+        self.column = column
+        self.task_values = task_values
+
+    # called once with the durations of the run, before the first case is added
+    def start(self, sim_durations_df):
+        pass
+
+    def variant_value(self, trace):
+        return float(sum(self.task_values[task] for task in trace))
+
+    def mean(self, values, weights):
+        return float(np.dot(np.asarray(values, dtype=np.float64), weights) / weights.sum())
+
+# execution cost of a case
+class CostKPI(TaskSumKPI):
+
+    def __init__(self, defined_costs):
+        super().__init__("Cost", defined_costs)
+
+# summed duration of the executed tasks (work time, unlike the duration it counts parallel tasks twice and has no waiting)
+class DurationKPI(TaskSumKPI):
+
+    def __init__(self, task_durations=None):
+        super().__init__("Work Duration", task_durations)
+        self.task_durations = task_durations
+
+    # without given durations: the durations of the run (first row per activity wins, as in the simulation)
+    # the trace evaluation has no durations per task, there the value is nan
+    def start(self, sim_durations_df):
+        if self.task_durations is None:
+            self.task_values = None if sim_durations_df is None else sim_durations_df.drop_duplicates(subset="activity").set_index("activity")["weighted_significant_duration"].to_dict()
+
+    def variant_value(self, trace):
+        if self.task_values is None:
+            return float('nan')
+        return super().variant_value(trace)
+
+# per activity value of a case as dict activity -> value, the mean is the weighted mean per activity
+class ActivityKPI:
+
+    def __init__(self, column):
+        self.column = column
+
+    def start(self, sim_durations_df):
+        pass
+
+    def mean(self, values, weights):
+        total = Counter()
+        for variant_value, weight in zip(values, weights.tolist()):
+            for activity, value in variant_value.items():
+                total[activity] += value * weight
+        weight_sum = weights.sum()
+        return {activity: float(value / weight_sum) for activity, value in total.items()}
+
+# number of executions of every activity
+class ActivityCountKPI(ActivityKPI):
+
+    def __init__(self):
+        super().__init__("Activity Counts")
+
+    def variant_value(self, trace):
+        return dict(Counter(trace))
+
+# cost of every activity (executions * cost)
+class ActivityCostKPI(ActivityKPI):
+
+    def __init__(self, defined_costs):
+        super().__init__("Activity Costs")
+        self.defined_costs = defined_costs
+
+    def variant_value(self, trace):
+        return {activity: count * self.defined_costs[activity] for activity, count in Counter(trace).items()}
+
+# value of every kpi for the variants: column -> list of values in the order of the traces
+def variant_kpi_values(kpis, traces):
+    return {kpi.column: [kpi.variant_value(tuple(trace)) for trace in traces] for kpi in kpis}
+
+# mean of every kpi over the variants weighted with their frequencies or probabilities: column -> mean
+def kpi_means(kpis, kpi_values, weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.sum() == 0:
+        return {}
+    return {kpi.column: kpi.mean(kpi_values[kpi.column], weights) for kpi in kpis}
+
+# insert the kpi columns of a results df in front of the percentage column
+def insert_kpi_columns(results_df, kpi_values):
+    position = list(results_df.columns).index("Percentage")
+    for column, values in kpi_values.items():
+        results_df.insert(position, column, values)
+        position += 1
+    return results_df
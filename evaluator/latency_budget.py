@@ -0,0 +1,141 @@
+import json
+import os
+import time
+import numpy as np
+from contextlib import contextmanager
+
+from config import AZURE_OPENAI_REASONING_EFFORT
+
+# reasoning efforts of the improvement call, from the most to the least thorough
+REASONING_EFFORTS = ["high", "medium", "low", "minimal"]
+
+# stage costs in seconds before anything was measured, replaced step by step by the measured costs (kept in costs_path across runs)
+DEFAULT_STAGE_COSTS = {
+    "improvement_high": 150.0,
+    "improvement_medium": 60.0,
+    "improvement_low": 25.0,
+    "improvement_minimal": 10.0,
+    # per replication
+    "simulation_run_simpy": 2e-4,
+    "simulation_run_batch": 2e-5,
+    # per event of the log
+    "traces_event": 1e-4,
+    "probabilities_event": 2e-5,
+}
+
+# share of the planned time that is given to a stage (the rest absorbs the error of the cost estimates)
+SAFETY_FACTOR = 0.8
+
+# weight of a new measurement in the running estimate of a stage cost
+LEARNING_RATE = 0.5
+
+# random sample of complete cases of the encoded log, fraction of the cases of the log (the cases keep their order)
+def sample_log(log, fraction, seed=42):
+    if fraction >= 1:
+        return log
+    n_cases = max(1, int(round(log.n_cases() * fraction)))
+    sampled_cases = np.random.default_rng(seed).choice(log.n_cases(), n_cases, replace=False)
+    return log.select_cases(np.sort(sampled_cases))
+
+# latency budget of one run of the pipeline (seconds from its creation): every stage is planned against the remaining time
+# with the measured stage costs and reports the fidelity it ended up with (reasoning effort, engine, replications, log sample)
+class LatencyBudget:
+
+    def __init__(self, seconds, costs_path=None, max_reasoning_effort=AZURE_OPENAI_REASONING_EFFORT, min_runs=1000, max_runs=10000, min_log_fraction=0.1):
+        self.seconds = seconds
+        self.started = time.perf_counter()
+        self.costs_path = costs_path
+        self.efforts = REASONING_EFFORTS[REASONING_EFFORTS.index(max_reasoning_effort):] if max_reasoning_effort in REASONING_EFFORTS else REASONING_EFFORTS
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.min_log_fraction = min_log_fraction
+
+        self.costs = dict(DEFAULT_STAGE_COSTS)
+        if costs_path is not None and os.path.exists(costs_path):
+            with open(costs_path) as file:
+                self.costs.update(json.load(file))
+
+        self.fidelity = {}
+        self.timings = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def remaining(self):
+        return max(0.0, self.seconds - self.elapsed())
+
+    # update the running estimate of a stage cost and keep it for the next runs
+    def learn(self, cost_key, value):
+        self.costs[cost_key] = (1 - LEARNING_RATE) * self.costs[cost_key] + LEARNING_RATE * value
+        if self.costs_path is not None:
+            with open(self.costs_path, "w") as file:
+                json.dump(self.costs, file, indent=2)
+
+    # measure the wall time of a stage, with cost_key the time per unit also updates the cost estimate
+    @contextmanager
+    def timed(self, stage, cost_key=None, units=1):
+        stage_started = time.perf_counter()
+        yield
+        stage_seconds = time.perf_counter() - stage_started
+        self.timings[stage] = stage_seconds
+        if cost_key is not None and units > 0:
+            self.learn(cost_key, stage_seconds / units)
+
+    # seconds of the evaluation at the lowest fidelity (minimum log sample and replications), held back for the evaluation
+    def minimum_evaluation_seconds(self, log_events):
+        log_seconds = self.min_log_fraction * log_events * (self.costs["traces_event"] + 2 * self.costs["probabilities_event"])
+        return log_seconds + 2 * self.min_runs * self.costs["simulation_run_batch"]
+
+    # most thorough reasoning effort whose improvement call still leaves time for the evaluation
+    def plan_reasoning_effort(self, log_events):
+        available = self.remaining() - self.minimum_evaluation_seconds(log_events)
+        reasoning_effort = next((effort for effort in self.efforts if self.costs["improvement_" + effort] <= available * SAFETY_FACTOR), self.efforts[-1])
+        self.fidelity["reasoning_effort"] = reasoning_effort
+        print(f"Latency budget: reasoning effort {reasoning_effort} ({round(self.remaining(), 1)} s left)")
+        return reasoning_effort
+
+    # settings of an evaluation stage in the time share of the remaining stages: log sample first, then the most thorough simulation that fits
+    # (simpy with max_runs as without budget, batch with as many replications as fit, the analytic evaluation if not even min_runs fit)
+    def plan_evaluation(self, stage, log_events, stages_left=1, traces=False):
+        allowance = self.remaining() / stages_left * SAFETY_FACTOR
+        log_seconds = log_events * (self.costs["probabilities_event"] + (self.costs["traces_event"] if traces else 0.0))
+        log_fraction = 1.0 if log_seconds <= allowance / 2 else max(self.min_log_fraction, allowance / 2 / log_seconds)
+        simulation_seconds = allowance - log_fraction * log_seconds
+
+        if simulation_seconds >= self.max_runs * self.costs["simulation_run_simpy"]:
+            settings = {"engine": "simpy", "n_runs": self.max_runs, "analytic": False}
+        elif simulation_seconds >= self.min_runs * self.costs["simulation_run_batch"]:
+            n_runs = min(self.max_runs, int(simulation_seconds / self.costs["simulation_run_batch"]) // 100 * 100)
+            settings = {"engine": "batch", "n_runs": n_runs, "analytic": False}
+        else:
+            settings = {"engine": "batch", "n_runs": self.min_runs, "analytic": True}
+        settings["log_fraction"] = round(log_fraction, 3)
+        # requests for unknown durations use the reasoning effort of the improvement
+        settings["reasoning_effort"] = self.fidelity.get("reasoning_effort")
+
+        self.fidelity[stage] = dict(settings)
+        print(f"Latency budget: {stage} with {settings} ({round(self.remaining(), 1)} s left)")
+        return settings
+
+    # learn the costs of an evaluation stage from its measured times (trace evaluation and the stage times of the simulation)
+    def record_evaluation(self, stage, log_events, simulation_info, traces_seconds=None):
+        stage_seconds = simulation_info.get("stage_seconds", {})
+        if traces_seconds is not None and log_events > 0:
+            self.learn("traces_event", traces_seconds / log_events)
+        if "probabilities" in stage_seconds and log_events > 0:
+            self.learn("probabilities_event", stage_seconds["probabilities"] / log_events)
+        if "simulation" in stage_seconds and simulation_info.get("replications") and simulation_info.get("engine") in ("simpy", "batch"):
+            self.learn("simulation_run_" + simulation_info["engine"], stage_seconds["simulation"] / simulation_info["replications"])
+        self.fidelity[stage]["used_engine"] = simulation_info.get("engine")
+        self.fidelity[stage]["replications"] = simulation_info.get("replications")
+        self.timings[stage] = sum(stage_seconds.values()) + (traces_seconds or 0.0)
+
+    # fidelity settings that were used and where the time went
+    def report(self):
+        return {
+            "budget_seconds": self.seconds,
+            "elapsed_seconds": round(self.elapsed(), 2),
+            "within_budget": self.elapsed() <= self.seconds,
+            "fidelity": self.fidelity,
+            "stage_seconds": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+        }
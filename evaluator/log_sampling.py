@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+from evaluator import sim_probabilities, bpmn_graph
+
+# approximate evaluation of very large logs: the evaluator stages run on a part of the cases and the results get error bounds
+# mode "sample": stratified sample of the cases by variant, every variant keeps fraction of its cases (randomized rounding, so the sample
+# is self-weighting and the stages need no weights), the bounds are confidence interval half widths
+# mode "top_variants": the most frequent variants until they cover coverage of the cases, the bounds are the worst case over the uncovered cases
+
+# stratified case sample: floor(fraction * cases) cases of every variant plus one more with the probability of the remainder
+def stratified_sample_cases(log, fraction, seed=42):
+    rng = np.random.default_rng(seed)
+    expected = log.variant_counts * fraction
+    sample_sizes = np.floor(expected).astype(np.int64) + (rng.random(len(expected)) < expected - np.floor(expected))
+    sampled_cases = []
+    cases_by_variant = np.argsort(log.case_variants, kind="stable")
+    variant_offsets = np.concatenate(([0], np.cumsum(log.variant_counts)))
+    for variant, sample_size in enumerate(sample_sizes.tolist()):
+        if sample_size > 0:
+            sampled_cases.append(rng.choice(cases_by_variant[variant_offsets[variant]:variant_offsets[variant + 1]], sample_size, replace=False))
+    return np.sort(np.concatenate(sampled_cases)) if sampled_cases else np.zeros(0, dtype=np.int64)
+
+# cases of the most frequent variants that together cover at least coverage of the cases
+def top_variant_cases(log, coverage):
+    order = np.argsort(-log.variant_counts, kind="stable")
+    covered = np.cumsum(log.variant_counts[order]) / log.n_cases()
+    kept_variants = order[:int(np.searchsorted(covered, coverage - 1e-12)) + 1]
+    return np.flatnonzero(np.isin(log.case_variants, kept_variants))
+
+# approximate log and the information for the error bounds: {"mode": "sample", "fraction": 0.1} or {"mode": "top_variants", "coverage": 0.9}
+def approximate_log(log, approximation, seed=42):
+    if approximation["mode"] == "sample":
+        cases = stratified_sample_cases(log, approximation["fraction"], seed)
+    elif approximation["mode"] == "top_variants":
+        cases = top_variant_cases(log, approximation["coverage"])
+    else:
+        raise ValueError(f"Unknown approximation mode '{approximation['mode']}'. Choose one of: sample, top_variants")
+    if len(cases) == 0:
+        raise ValueError("The approximation keeps no cases of the log")
+
+    sampled_log = log.select_cases(cases)
+    sampling_info = {
+        **approximation,
+        "cases": log.n_cases(),
+        "sampled_cases": sampled_log.n_cases(),
+        "sampled_variants": sampled_log.n_variants(),
+        "variants": log.n_variants(),
+        "uncovered_share": 0.0 if approximation["mode"] == "sample" else 1 - sampled_log.n_cases() / log.n_cases(),
+    }
+    print(f"Approximate evaluation ({approximation['mode']}): {sampling_info['sampled_cases']} of {sampling_info['cases']} cases, {sampling_info['sampled_variants']} of {sampling_info['variants']} variants")
+    return sampled_log, sampling_info
+
+# error bounds of the trace evaluation on the approximate log: mean duration of the fitting cases and fitting percentage
+# sample: stratified variance (within the variants) plus the variance of the randomized rounding of the sample sizes, with finite population correction
+# top variants: the uncovered cases may all fit or not, and their durations lie in the range of the observed durations
+def trace_error_bounds(bpmn, sampled_log, fitting_traces_df, sampling_info, confidence=0.95):
+    bpmn_tasks = bpmn_graph.get_graph(bpmn).task_names()
+    fitting_variants = set(fitting_traces_df["trace"]) if len(fitting_traces_df) else set()
+    variant_fits = np.array([sampled_log.variant_activities(variant) in fitting_variants for variant in range(sampled_log.n_variants())], dtype=bool)
+    case_fits = variant_fits[sampled_log.case_variants]
+    fitting_share = case_fits.mean()
+
+    is_bpmn_task = np.array([activity in bpmn_tasks for activity in sampled_log.activities], dtype=bool)
+    durations = sampled_log.case_durations(is_bpmn_task[sampled_log.activity_codes])
+    fitting_durations = durations[case_fits & ~np.isnan(durations)]
+    mean_duration = fitting_durations.mean() if len(fitting_durations) else float("nan")
+
+    if sampling_info["mode"] == "top_variants":
+        uncovered = sampling_info["uncovered_share"]
+        covered = 1 - uncovered
+        fitting_percentage_bound = max(uncovered * fitting_share, uncovered * (1 - fitting_share))
+        fitting_upper = covered * fitting_share + uncovered
+        uncovered_fitting_share = uncovered / fitting_upper if fitting_upper > 0 else 0.0
+        duration_range = fitting_durations.max() - fitting_durations.min() if len(fitting_durations) else float("nan")
+        mean_duration_bound = uncovered_fitting_share * duration_range
+        bound_kind = "worst case"
+    else:
+        # the sample size of a variant is off its share by the randomized rounding (variance at most 1/4 per variant),
+        # variants of the log that are not in the sample count with the largest deviation
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        unsampled_variants = sampling_info["variants"] - sampled_log.n_variants()
+        n_sampled = sampled_log.n_cases()
+        rounding_fitting = np.sum((variant_fits - fitting_share) ** 2) + unsampled_variants * max(fitting_share, 1 - fitting_share) ** 2
+        fitting_percentage_bound = z * np.sqrt(rounding_fitting / 4) / n_sampled
+
+        mean_duration_bound = float("nan")
+        if len(fitting_durations) > 1:
+            # stratified variance of the mean (within the variants) with finite population correction plus the rounding of the sample sizes
+            fitting_cases = case_fits & ~np.isnan(durations)
+            variants = sampled_log.case_variants[fitting_cases]
+            counts = np.bincount(variants, minlength=sampled_log.n_variants())
+            sums = np.bincount(variants, weights=durations[fitting_cases], minlength=sampled_log.n_variants())
+            squares = np.bincount(variants, weights=durations[fitting_cases] ** 2, minlength=sampled_log.n_variants())
+            with np.errstate(divide="ignore", invalid="ignore"):
+                variant_means = np.where(counts > 0, sums / counts, mean_duration)
+                within_variances = np.where(counts > 1, np.maximum(squares - counts * variant_means**2, 0.0) / (counts - 1), 0.0)
+            sampling_variance = (1 - sampling_info["fraction"]) * np.sum(counts * within_variances)
+            duration_range = fitting_durations.max() - fitting_durations.min()
+            rounding_duration = np.sum((counts > 0) * (variant_means - mean_duration) ** 2) + unsampled_variants * duration_range**2
+            mean_duration_bound = z * np.sqrt(sampling_variance + rounding_duration / 4) / len(fitting_durations)
+        bound_kind = f"{confidence:.0%} confidence"
+
+    return {
+        "bound": bound_kind,
+        "mean_duration": float(mean_duration),
+        "mean_duration_bound": float(mean_duration_bound),
+        "fitting_percentage": float(fitting_share * 100),
+        "fitting_percentage_bound": float(fitting_percentage_bound * 100),
+    }
+
+# error bounds of the gateway probabilities learned from the approximate log, one row per gateway, predecessor, encounter and arc
+# sample: binomial confidence interval of the share of the arc among the passes of the gateway in the sample, with finite population correction
+# top variants: the uncovered cases (one pass per case) may all take the arc or none
+def gateway_error_bounds(bpmn, sampled_log, new_activities, sampling_info, confidence=0.95):
+    diverging_exclusive_gateways, gateway_predecessors, gateway_arc_successors, _, gateway_path_frequencies = sim_probabilities.get_gateway_path_frequencies(bpmn, sampled_log, new_activities)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    uncovered_cases = sampling_info["cases"] - sampling_info["sampled_cases"]
+
+    records = []
+    for gateway in diverging_exclusive_gateways:
+        for predecessor in gateway_predecessors[gateway]:
+            for encounter, successor_frequencies in gateway_path_frequencies[gateway][predecessor].items():
+                passes = sum(successor_frequencies.values())
+                for arc, successors in gateway_arc_successors[gateway].items():
+                    probability = sum(successor_frequencies.get(successor, 0) for successor in successors) / passes if passes > 0 else 0.0
+                    if sampling_info["mode"] == "top_variants":
+                        bound = uncovered_cases / (passes + uncovered_cases) if passes + uncovered_cases > 0 else 0.0
+                    else:
+                        bound = z * np.sqrt(probability * (1 - probability) / passes * (1 - sampling_info["fraction"])) if passes > 0 else float("nan")
+                    records.append({
+                        "Gateway": gateway.get_name() or gateway.get_id(),
+                        "Predecessor": predecessor.get_name() or predecessor.get_id(),
+                        "Encounter": encounter,
+                        "Arc Target": arc.get_target().get_name() or arc.get_target().get_id(),
+                        "Passes": passes,
+                        "Probability": probability,
+                        "Bound": bound,
+                    })
+    return pd.DataFrame(records, columns=["Gateway", "Predecessor", "Encounter", "Arc Target", "Passes", "Probability", "Bound"])
@@ -0,0 +1,46 @@
+import numpy as np
+from statistics import NormalDist
+
+# half width of the confidence interval of the mean
+def confidence_half_width(moments, confidence):
+    count, mean, m2 = moments
+    if count < 2:
+        return np.inf
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    return z * np.sqrt(m2 / (count - 1) / count)
+
+# half width relative to the mean (0 if there is no variance at all)
+def relative_half_width(moments, confidence):
+    half_width = confidence_half_width(moments, confidence)
+    if half_width == 0:
+        return 0.0
+    if moments[1] == 0:
+        return np.inf
+    return half_width / abs(moments[1])
+
+def run_adaptive_simulation(run_batch, aggregator, relative_tolerance, batch_size=1000, max_runs=100000, confidence=0.95):
+    # run_batch(n_runs, batch_index) adds one batch of replications to the aggregator
+    batch_index = 0
+    converged = False
+
+    # run batches until the confidence intervals of the mean and the adjusted mean are narrow enough (at least 2 batches, at most max_runs replications)
+    while aggregator.replications < max_runs:
+        run_batch(min(batch_size, max_runs - aggregator.replications), batch_index)
+        batch_index += 1
+
+        widths = [relative_half_width(aggregator.moments[column], confidence) for column in aggregator.moments]
+        if batch_index >= 2 and all(width <= relative_tolerance for width in widths):
+            converged = True
+            break
+
+    adaptive_info = {
+        "replications": aggregator.replications,
+        "converged": converged,
+        "confidence": confidence,
+        "relative_tolerance": relative_tolerance,
+        "mean_ci_half_width": float(confidence_half_width(aggregator.moments["duration"], confidence)),
+        "adjusted_mean_ci_half_width": float(confidence_half_width(aggregator.moments["adjusted"], confidence)),
+        "mean_ci_relative_half_width": float(relative_half_width(aggregator.moments["duration"], confidence)),
+        "adjusted_mean_ci_relative_half_width": float(relative_half_width(aggregator.moments["adjusted"], confidence)),
+    }
+    return adaptive_info
@@ -0,0 +1,230 @@
+import math
+import numpy as np
+import pandas as pd
+
+from evaluator import kpi_accumulators
+
+# running (count, mean, sum of squared deviations) of a stream of values, merged batch by batch
+def update_moments(moments, batch_count, batch_mean, batch_m2):
+    count, mean, m2 = moments
+    total_count = count + batch_count
+    if total_count == 0:
+        return moments
+    delta = batch_mean - mean
+    mean = mean + delta * batch_count / total_count
+    m2 = m2 + batch_m2 + delta ** 2 * count * batch_count / total_count
+    return total_count, mean, m2
+
+# moments of one batch of values
+def batch_moments(values):
+    batch_mean = values.mean()
+    batch_m2 = np.sum((values - batch_mean) ** 2)
+    return len(values), batch_mean, batch_m2
+
+# bucket key of values <= 0 in the quantile sketch
+ZERO_BUCKET = np.iinfo(np.int64).min
+
+# mergeable quantile sketch: log-spaced buckets with a bounded relative error, memory only depends on the range of the values
+class QuantileSketch:
+
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    # bucket of every value (ZERO_BUCKET for values <= 0)
+    def bucket_keys(self, values):
+        keys = np.full(len(values), ZERO_BUCKET, dtype=np.int64)
+        positive = values > 0
+        keys[positive] = np.ceil(np.log(values[positive]) / self.log_gamma).astype(np.int64)
+        return keys
+
+    def add_bucket(self, key, count):
+        if key == ZERO_BUCKET:
+            self.zero_count += count
+        else:
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += count
+
+    def add(self, value, count=1):
+        self.add_bucket(ZERO_BUCKET if value <= 0 else math.ceil(math.log(value) / self.log_gamma), count)
+
+    def add_many(self, values):
+        keys, counts = np.unique(self.bucket_keys(values), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.add_bucket(key, count)
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # midpoint of the bucket (relative error <= relative_accuracy)
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+# online aggregation of simulated cases keyed by the interned trace: counts, duration sums and quantiles per variant and overall
+# memory depends on the number of variants, not on the number of replications
+# keep_durations: also keep the duration of every case in case order (needed to pair the cases of two simulations)
+# kpis: kpi accumulators (see kpi_accumulators), their value is computed once per variant when the variant is first simulated
+class VariantAggregator:
+
+    def __init__(self, sim_durations_df, quantiles=(0.5, 0.95), keep_durations=False, kpis=()):
+        # duration of the first event per activity (first row per activity wins), needed for the adjusted duration
+        self.first_event_durations = sim_durations_df.drop_duplicates(subset="activity").set_index("activity")["weighted_significant_duration"].to_dict()
+        self.quantiles = quantiles
+        self.kept_durations = [] if keep_durations else None
+        self.kpis = list(kpis)
+        for kpi in self.kpis:
+            kpi.start(sim_durations_df)
+
+        # per variant
+        self.variant_ids = {}
+        self.traces = []
+        self.first_durations = []
+        self.counts = []
+        self.duration_sums = []
+        self.adjusted_sums = []
+        self.duration_sketches = []
+        self.kpi_values = {kpi.column: [] for kpi in self.kpis}
+
+        # overall
+        self.moments = {"duration": (0, 0.0, 0.0), "adjusted": (0, 0.0, 0.0)}
+        self.duration_sketch = QuantileSketch()
+        self.adjusted_sketch = QuantileSketch()
+
+    def intern(self, trace):
+        variant_id = self.variant_ids.get(trace)
+        if variant_id is None:
+            variant_id = len(self.traces)
+            self.variant_ids[trace] = variant_id
+            self.traces.append(trace)
+            self.first_durations.append(self.first_event_durations[trace[0]] if trace else 0.0)
+            self.counts.append(0)
+            self.duration_sums.append(0.0)
+            self.adjusted_sums.append(0.0)
+            self.duration_sketches.append(QuantileSketch())
+            for kpi in self.kpis:
+                self.kpi_values[kpi.column].append(kpi.variant_value(trace))
+        return variant_id
+
+    # add one simulated case
+    def add(self, duration, trace):
+        variant_id = self.intern(trace)
+        # Avoid subtracting more than the simulated duration (loops can exaggerate the first activity duration)
+        adjusted_duration = duration - min(self.first_durations[variant_id], duration)
+
+        self.counts[variant_id] += 1
+        self.duration_sums[variant_id] += duration
+        self.adjusted_sums[variant_id] += adjusted_duration
+        self.duration_sketches[variant_id].add(duration)
+        self.duration_sketch.add(duration)
+        self.adjusted_sketch.add(adjusted_duration)
+        self.moments["duration"] = update_moments(self.moments["duration"], 1, duration, 0.0)
+        self.moments["adjusted"] = update_moments(self.moments["adjusted"], 1, adjusted_duration, 0.0)
+        if self.kept_durations is not None:
+            self.kept_durations.append(duration)
+
+    # add many simulated cases at once (durations as array, traces as tuples)
+    def add_batch(self, durations, traces):
+        if len(durations) == 0:
+            return
+        durations = np.asarray(durations, dtype=np.float64)
+        ids = np.array([self.intern(trace) for trace in traces], dtype=np.int64)
+        adjusted_durations = durations - np.minimum(np.array(self.first_durations)[ids], durations)
+
+        # update only the variants of the batch
+        touched, inverse = np.unique(ids, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(touched))
+        duration_sums = np.bincount(inverse, weights=durations, minlength=len(touched))
+        adjusted_sums = np.bincount(inverse, weights=adjusted_durations, minlength=len(touched))
+        for position, variant_id in enumerate(touched.tolist()):
+            self.counts[variant_id] += int(counts[position])
+            self.duration_sums[variant_id] += float(duration_sums[position])
+            self.adjusted_sums[variant_id] += float(adjusted_sums[position])
+
+        # quantile buckets per variant: one update per distinct (variant, bucket)
+        pairs, pair_counts = np.unique(np.stack([ids, self.duration_sketch.bucket_keys(durations)]), axis=1, return_counts=True)
+        for variant_id, key, count in zip(pairs[0].tolist(), pairs[1].tolist(), pair_counts.tolist()):
+            self.duration_sketches[variant_id].add_bucket(key, count)
+
+        self.duration_sketch.add_many(durations)
+        self.adjusted_sketch.add_many(adjusted_durations)
+        self.moments["duration"] = update_moments(self.moments["duration"], *batch_moments(durations))
+        self.moments["adjusted"] = update_moments(self.moments["adjusted"], *batch_moments(adjusted_durations))
+        if self.kept_durations is not None:
+            self.kept_durations.extend(durations.tolist())
+
+    # merge the aggregate of another worker or batch
+    def merge(self, other):
+        for other_id, trace in enumerate(other.traces):
+            variant_id = self.intern(trace)
+            self.counts[variant_id] += other.counts[other_id]
+            self.duration_sums[variant_id] += other.duration_sums[other_id]
+            self.adjusted_sums[variant_id] += other.adjusted_sums[other_id]
+            self.duration_sketches[variant_id].merge(other.duration_sketches[other_id])
+        self.duration_sketch.merge(other.duration_sketch)
+        self.adjusted_sketch.merge(other.adjusted_sketch)
+        for column in self.moments:
+            self.moments[column] = update_moments(self.moments[column], *other.moments[column])
+        if self.kept_durations is not None:
+            self.kept_durations.extend(other.kept_durations or [])
+
+    # durations of the cases in case order (only with keep_durations)
+    def case_durations(self):
+        return np.array(self.kept_durations, dtype=np.float64)
+
+    @property
+    def replications(self):
+        return self.moments["duration"][0]
+
+    def mean_duration(self):
+        return sum(self.duration_sums) / self.replications
+
+    def adjusted_mean_duration(self):
+        return sum(self.adjusted_sums) / self.replications
+
+    # mean of every kpi over the cases: column -> mean
+    def kpi_means(self):
+        return kpi_accumulators.kpi_means(self.kpis, self.kpi_values, self.counts)
+
+    # overall quantiles of the duration and the adjusted duration
+    def quantile_summary(self):
+        summary = {}
+        for q in self.quantiles:
+            summary[f"duration_p{round(q * 100)}"] = self.duration_sketch.quantile(q)
+            summary[f"adjusted_duration_p{round(q * 100)}"] = self.adjusted_sketch.quantile(q)
+        return summary
+
+    # quantiles of the duration per variant
+    def variant_quantiles_df(self):
+        variant_quantiles_df = pd.DataFrame({"Trace": [list(trace) for trace in self.traces]})
+        for q in self.quantiles:
+            variant_quantiles_df[f"P{round(q * 100)}"] = [sketch.quantile(q) for sketch in self.duration_sketches]
+        return variant_quantiles_df
+
+    # table for the frontend: one row per variant with its mean durations and share of the replications
+    def to_results_df(self):
+        counts = np.array(self.counts, dtype=np.float64)
+        simulation_results_df = pd.DataFrame({
+            "Duration": np.array(self.duration_sums) / counts,
+            "Adj. Duration": np.array(self.adjusted_sums) / counts,
+            "Percentage": counts / counts.sum() * 100,
+            "Trace": [list(trace) for trace in self.traces],
+        })
+        simulation_results_df = kpi_accumulators.insert_kpi_columns(simulation_results_df, self.kpi_values)
+        simulation_results_df = simulation_results_df.sort_values(by='Percentage', ascending=False, kind="stable").reset_index(drop=True)
+        return simulation_results_df
@@ -0,0 +1,329 @@
+import sys
+import itertools
+import numpy as np
+
+from evaluator.sim_plan import TASK, EXCLUSIVE, PARALLEL
+
+# raised for models (or parts of models) the analytic evaluation cannot handle exactly, the caller falls back to the simulation
+class AnalyticUnsupported(Exception):
+    pass
+
+# python views of the plan for the state walks (scalar access to lists is faster than to numpy arrays)
+def plan_lists(plan):
+    return {
+        "kind": plan["kind"].tolist(),
+        "diverging": plan["diverging"].tolist(),
+        "duration": plan["duration"].tolist(),
+        "is_new": plan["is_new"].tolist(),
+        "n_out": plan["n_out"].tolist(),
+        "xor_slot": plan["xor_slot"].tolist(),
+        "join_slot": plan["join_slot"].tolist(),
+        "successors": plan["successor_lists"],
+        "cumulative_rows": plan["cumulative_rows"],
+    }
+
+# gateway state of a case: encounters, last arcs, first gateway since the last encounter, waiting gateways, available arcs, excluded arc, join counters, first task done
+def initial_state(plan):
+    return (
+        (0,) * plan["n_xor"],
+        (-1,) * plan["n_xor"],
+        (-1,) * plan["n_xor"],
+        (),
+        tuple(plan["full_masks"].tolist()),
+        (-1,) * plan["n_xor"],
+        tuple(plan["n_in"][plan["join_nodes"]].tolist()),
+        False,
+    )
+
+def thaw(state):
+    return [list(part) if isinstance(part, tuple) else part for part in state]
+
+def freeze(state):
+    return tuple(tuple(part) if isinstance(part, list) else part for part in state)
+
+# walk the deterministic part from node on: tasks and converging exclusive gateways, until a decision, a parallel gateway or the end (state is changed in place)
+# returns the stop, the node and predecessor there, the elapsed time, the end time and duration of the first task (if it happened here) and the branch probabilities
+# events: if given, the finished tasks are appended as (end time, task)
+def advance(lists, node, predecessor, state, events=None):
+    kind = lists["kind"]
+    diverging = lists["diverging"]
+    duration = lists["duration"]
+    successors = lists["successors"]
+    encounter, last_arcs, since_last, waiting, available, excluded, join_counter, started = state
+    elapsed = 0.0
+    first_end = None
+    first_duration = 0.0
+    while True:
+        if kind[node] == TASK:
+            elapsed += duration[node]
+            if events is not None:
+                events.append((elapsed, node))
+            if not state[7]:
+                state[7] = True
+                first_end = elapsed
+                first_duration = duration[node]
+            if not lists["is_new"][node]:
+                predecessor = node
+            node = successors[node][0]
+
+        elif kind[node] == EXCLUSIVE:
+            slot = lists["xor_slot"][node]
+            if diverging[node]:
+                encounter[slot] += 1
+                if since_last[slot] == -1 and slot not in waiting:
+                    waiting.append(slot)
+            for waiting_slot in waiting:
+                since_last[waiting_slot] = node
+            waiting.clear()
+            if not diverging[node]:
+                node = successors[node][0]
+                continue
+
+            following = since_last[slot]
+            since_last[slot] = -1
+            waiting.append(slot)
+
+            cumulative = lists["cumulative_rows"].get((node, predecessor, encounter[slot]))
+            if cumulative is not None:
+                probabilities = np.diff(cumulative, prepend=0.0).tolist()
+            else:
+                # artificial probabilities, same rules as the simulation
+                last_arc = last_arcs[slot]
+                if last_arc == -1:
+                    raise AnalyticUnsupported("artificial probabilities without a previous decision")
+                if not diverging[following]:
+                    available[slot] &= ~(1 << last_arc)
+                    excluded[slot] = -1
+                elif available[slot].bit_count() > 1:
+                    excluded[slot] = last_arc
+                mask = available[slot] & ~(1 << excluded[slot]) if excluded[slot] >= 0 else available[slot]
+                if mask == 0:
+                    mask = available[slot]
+                if mask == 0:
+                    raise AnalyticUnsupported("no arc left at an exclusive gateway")
+                probabilities = [(mask >> arc & 1) / mask.bit_count() for arc in range(lists["n_out"][node])]
+            return "decision", node, predecessor, elapsed, first_end, first_duration, probabilities
+
+        elif kind[node] == PARALLEL:
+            return ("split" if diverging[node] else "join"), node, predecessor, elapsed, first_end, first_duration, None
+
+        else:
+            return "end", node, predecessor, elapsed, first_end, first_duration, None
+
+# states of the branches after a decision: (probability, first node of the branch, state)
+def decision_states(lists, node, state, probabilities):
+    for arc, probability in enumerate(probabilities):
+        if probability > 0:
+            branch_state = thaw(state)
+            branch_state[1][lists["xor_slot"][node]] = arc
+            yield probability, lists["successors"][node][arc], freeze(branch_state)
+
+# exact expected duration and adjusted duration of the simulation over the compiled execution plan, without simulating
+# the evaluation follows the rules of the simpy simulation (encounter-dependent probabilities, artificial probabilities, parallel joins):
+# sequences add up, exclusive gateways mix their branches with the branch probabilities, loops expand over the encounters,
+# parallel blocks take the maximum over the joint outcomes of their branches
+# the states (node, predecessor, gateway state) are memoized, so every state is evaluated once
+def expected_durations(plan, max_states=200000):
+
+    lists = plan_lists(plan)
+    n_out = lists["n_out"]
+    join_slot = lists["join_slot"]
+    successors = lists["successors"]
+
+    expected_memo = {}
+    outcomes_memo = {}
+
+    def check_size():
+        if len(expected_memo) + len(outcomes_memo) > max_states:
+            raise AnalyticUnsupported(f"more than {max_states} states")
+
+    # expected remaining duration and expected duration of the first task (if it is still ahead) of the case from this state on
+    def expected(node, predecessor, state_key):
+        key = (node, predecessor, state_key)
+        if key in expected_memo:
+            return expected_memo[key]
+        check_size()
+
+        state = thaw(state_key)
+        stop, node, predecessor, elapsed, first_end, first_duration, probabilities = advance(lists, node, predecessor, state)
+        remaining = 0.0
+        first = 0.0
+
+        if stop == "decision":
+            for probability, target, branch_state in decision_states(lists, node, freeze(state), probabilities):
+                branch_remaining, branch_first = expected(target, predecessor, branch_state)
+                remaining += probability * branch_remaining
+                first += probability * branch_first
+
+        elif stop == "split":
+            remaining, first = expected_block(node, predecessor, freeze(state))
+
+        elif stop == "join":
+            # only one token: the join fires if this is its last missing arrival, otherwise the case ends here
+            slot = join_slot[node]
+            state[6][slot] -= 1
+            if state[6][slot] == 0:
+                remaining, first = expected_after_join(node, predecessor, freeze(state))
+
+        if first_end is not None:
+            first = first_duration
+        result = (elapsed + remaining, first)
+        expected_memo[key] = result
+        return result
+
+    def expected_after_join(join, predecessor, state_key):
+        if n_out[join] == 1:
+            return expected(successors[join][0], predecessor, state_key)
+        return expected_block(join, predecessor, state_key)
+
+    def expected_block(split, predecessor, state_key):
+        remaining = 0.0
+        first = 0.0
+        for probability, block_time, continuation, first_duration in block_outcomes(split, predecessor, state_key):
+            outcome_remaining = block_time
+            outcome_first = first_duration
+            if continuation is not None:
+                continuation_remaining, continuation_first = expected_after_join(*continuation)
+                outcome_remaining += continuation_remaining
+                if first_duration is None:
+                    outcome_first = continuation_first
+            remaining += probability * outcome_remaining
+            first += probability * (outcome_first or 0.0)
+        return remaining, first
+
+    # all outcomes of a branch until it arrives at a converging parallel gateway or ends:
+    # (probability, time, join node or -1, predecessor, state, end time of the first task or None, duration of the first task)
+    def branch_outcomes(node, predecessor, state_key):
+        key = (node, predecessor, state_key)
+        if key in outcomes_memo:
+            return outcomes_memo[key]
+        check_size()
+
+        state = thaw(state_key)
+        stop, node, predecessor, elapsed, first_end, first_duration, probabilities = advance(lists, node, predecessor, state)
+        outcomes = []
+
+        def add(probability, time, stop_node, stop_predecessor, stop_state, sub_first_end, sub_first_duration):
+            if first_end is not None:
+                outcomes.append((probability, elapsed + time, stop_node, stop_predecessor, stop_state, first_end, first_duration))
+            else:
+                outcomes.append((probability, elapsed + time, stop_node, stop_predecessor, stop_state, None if sub_first_end is None else elapsed + sub_first_end, sub_first_duration))
+
+        if stop == "decision":
+            for probability, target, branch_state in decision_states(lists, node, freeze(state), probabilities):
+                for outcome in branch_outcomes(target, predecessor, branch_state):
+                    add(probability * outcome[0], *outcome[1:])
+
+        elif stop == "split":
+            for probability, block_time, continuation, block_first_duration, block_first_end, block_state in block_outcomes(split=node, predecessor=predecessor, state_key=freeze(state), detailed=True):
+                if continuation is None:
+                    add(probability, block_time, -1, predecessor, block_state, block_first_end, block_first_duration)
+                else:
+                    join, join_predecessor, join_state = continuation
+                    for outcome in continuation_outcomes(join, join_predecessor, join_state):
+                        sub_first_end = block_first_end if block_first_end is not None else (None if outcome[5] is None else block_time + outcome[5])
+                        sub_first_duration = block_first_duration if block_first_end is not None else outcome[6]
+                        add(probability * outcome[0], block_time + outcome[1], outcome[2], outcome[3], outcome[4], sub_first_end, sub_first_duration)
+
+        elif stop == "join":
+            add(1.0, 0.0, node, predecessor, freeze(state), None, 0.0)
+
+        else:
+            add(1.0, 0.0, -1, predecessor, freeze(state), None, 0.0)
+
+        if len(outcomes) > max_states:
+            raise AnalyticUnsupported(f"more than {max_states} branch outcomes")
+        outcomes_memo[key] = outcomes
+        return outcomes
+
+    def continuation_outcomes(join, predecessor, state_key):
+        if n_out[join] == 1:
+            return branch_outcomes(successors[join][0], predecessor, state_key)
+        # converging and diverging at the same time: the continuation is another parallel block
+        outcomes = []
+        for probability, block_time, continuation, block_first_duration, block_first_end, block_state in block_outcomes(join, predecessor, state_key, detailed=True):
+            if continuation is None:
+                outcomes.append((probability, block_time, -1, predecessor, block_state, block_first_end, block_first_duration))
+            else:
+                for outcome in continuation_outcomes(*continuation):
+                    first_end = block_first_end if block_first_end is not None else (None if outcome[5] is None else block_time + outcome[5])
+                    first_duration = block_first_duration if block_first_end is not None else outcome[6]
+                    outcomes.append((probability * outcome[0], block_time + outcome[1], outcome[2], outcome[3], outcome[4], first_end, first_duration))
+        return outcomes
+
+    # joint outcomes of the branches of a parallel block: (probability, time until the join fired or all branches ended, continuation (join, predecessor, state) or None, duration of the first task or None)
+    # detailed: additionally the end time of the first task and the state after the block
+    def block_outcomes(split, predecessor, state_key, detailed=False):
+        branches = [branch_outcomes(target, predecessor, state_key) for target in successors[split]]
+
+        # the branches share the state of the exclusive gateways (first gateway since the last encounter depends on the timing across branches),
+        # so only one branch may decide at exclusive gateways
+        xor_state = state_key[:6]
+        varying = [branch for branch in branches if len(branch) > 1 or branch[0][4][:6] != xor_state]
+        if len(varying) > 1:
+            raise AnalyticUnsupported("more than one parallel branch with exclusive gateways")
+
+        results = []
+        for combination in itertools.product(*branches):
+            probability = float(np.prod([outcome[0] for outcome in combination]))
+
+            # combine the states: exclusive gateways from the deciding branch, join counters from all branches
+            base = thaw(state_key)
+            deciding = [outcome for outcome in combination if outcome[4][:6] != xor_state]
+            state = thaw(deciding[0][4]) if deciding else base
+            state[6] = [counter + sum(outcome[4][6][slot] - counter for outcome in combination) for slot, counter in enumerate(base[6])]
+            state[7] = base[7] or any(outcome[4][7] for outcome in combination)
+
+            # first task of the case (the one that finishes first)
+            first_end = None
+            first_duration = None
+            if not base[7]:
+                firsts = [(outcome[5], outcome[6]) for outcome in combination if outcome[5] is not None]
+                if firsts:
+                    first_end = min(end for end, _ in firsts)
+                    if len({task_duration for end, task_duration in firsts if end == first_end}) > 1:
+                        raise AnalyticUnsupported("first task of the case depends on the event order")
+                    first_duration = [task_duration for end, task_duration in firsts if end == first_end][0]
+
+            block_time = max(outcome[1] for outcome in combination)
+            stops = {outcome[2] for outcome in combination}
+            continuation = None
+
+            if stops == {-1}:
+                pass
+            elif len(stops) == 1:
+                join = stops.pop()
+                slot = join_slot[join]
+                arrivals = len(combination)
+                if state[6][slot] == arrivals:
+                    # the last arrival fires the join and continues with its predecessor
+                    last_predecessors = {outcome[3] for outcome in combination if outcome[1] == block_time}
+                    if len(last_predecessors) > 1:
+                        raise AnalyticUnsupported("predecessor after a parallel join depends on the event order")
+                    state[6][slot] = 0
+                    continuation = (join, last_predecessors.pop(), freeze(state))
+                elif state[6][slot] <= 0 or state[6][slot] > arrivals:
+                    # the join does not fire (already fired before or waits for arrivals that do not come), the branches end here
+                    state[6][slot] -= arrivals
+                else:
+                    raise AnalyticUnsupported("parallel join fires before all branches arrived")
+            else:
+                raise AnalyticUnsupported("branches of a parallel block end at different nodes")
+
+            if detailed:
+                results.append((probability, block_time, continuation, first_duration, first_end, freeze(state)))
+            else:
+                results.append((probability, block_time, continuation, first_duration))
+        return results
+
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 20000))
+    try:
+        mean_duration, first_duration = expected(int(plan["first"]), int(plan["start"]), initial_state(plan))
+    except RecursionError:
+        raise AnalyticUnsupported("model too deep for the analytic evaluation")
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    # adjusted duration: the duration of the first event is not part of the case duration in the log
+    return mean_duration, mean_duration - first_duration
@@ -0,0 +1,230 @@
+import numpy as np
+
+from evaluator import sim_plan, sim_aggregate, sim_random
+from evaluator.sim_plan import TASK, EXCLUSIVE, PARALLEL, END, OTHER
+
+# find the probability rows of the (gateway, predecessor, encounter) contexts of many tokens at once
+def lookup_probability_rows(plan, gateway, predecessors, encounters):
+    keys = (gateway * len(plan["kind"]) + predecessors) * (plan["max_encounter"] + 1) + encounters
+    probability_keys = plan["probability_keys"]
+    if len(probability_keys) == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    rows = np.minimum(np.searchsorted(probability_keys, keys), len(probability_keys) - 1)
+    known = (encounters <= plan["max_encounter"]) & (probability_keys[rows] == keys)
+    return rows, known
+
+# one token per outgoing arc of every given gateway
+def spawn_branches(successors, gateways, cases, predecessors, clocks):
+    branch_rows, branch_positions = np.nonzero(successors[gateways] >= 0)
+    return successors[gateways[branch_rows], branch_positions], cases[branch_rows], predecessors[branch_rows], clocks[branch_rows]
+
+# artificial cumulative rows once the encounters of a gateway are exhausted (same rules as in the simpy simulation)
+# the arcs still available per case are a bitmask, the rows come from the precomputed fallback table
+def artificial_rows(plan, slots, cases, first_since, last_arc, available, excluded):
+
+    last = last_arc[cases, slots]
+    has_last = last >= 0
+
+    # last arc led into a simple loop (first gateway since the last encounter is converging) --> permanent exclusion
+    following = first_since[cases, slots]
+    permanent = has_last & (following >= 0) & ~plan["diverging"][np.maximum(following, 0)]
+    available[cases[permanent], slots[permanent]] &= ~(1 << last[permanent])
+    excluded[cases[permanent], slots[permanent]] = -1
+
+    # otherwise temporary exclusion of the last arc, if more than one arc is left
+    masks = available[cases, slots]
+    temporary = has_last & ~permanent & (np.bitwise_count(masks) > 1)
+    excluded[cases[temporary], slots[temporary]] = last[temporary]
+
+    # uniform over the available arcs that are not temporarily excluded
+    exclusion = excluded[cases, slots]
+    candidates = np.where(exclusion >= 0, masks & ~(1 << np.maximum(exclusion, 0)), masks)
+    candidates = np.where(candidates == 0, masks, candidates)
+    return sim_plan.fallback_rows(plan, candidates)
+
+# simulate all cases at once: every token of every case advances one node per step
+# tracer: optional SimulationTracer, counters for all cases and events for the sampled ones
+# common_random: CommonRandomNumbers, the uniforms are keyed by (case, decision context, encounter) instead of drawn from rng
+# scenarios: number of scenarios of a sweep plan (see sim_scenarios), n_runs cases per scenario, case i of every scenario takes the same uniforms
+def simulate_batch(plan, n_runs, rng, tracer=None, common_random=None, scenarios=1):
+
+    kind = plan["kind"]
+    diverging = plan["diverging"]
+    successors = plan["successors"]
+    xor_slot = plan["xor_slot"]
+    join_slot = plan["join_slot"]
+    max_out = successors.shape[1]
+
+    # durations and probability rows per scenario (a plain plan is one scenario)
+    duration_table = plan.get("scenario_duration", plan["duration"][None])
+    cumulative_tables = plan.get("scenario_cumulative", plan["cumulative_table"][None])
+    case_scenario = np.repeat(np.arange(scenarios), n_runs)
+    runs_per_scenario = n_runs
+    n_runs = n_runs * scenarios
+
+    # per-case state
+    case_end = np.zeros(n_runs, dtype=np.float64)
+    encounter = np.zeros((n_runs, plan["n_xor"]), dtype=np.int64)
+    last_arc = np.full((n_runs, plan["n_xor"]), -1, dtype=np.int64)
+    first_since = np.full((n_runs, plan["n_xor"]), -1, dtype=np.int64)
+    available = np.tile(plan["full_masks"], (n_runs, 1))
+    excluded = np.full((n_runs, plan["n_xor"]), -1, dtype=np.int64)
+    join_counter = np.tile(plan["n_in"][plan["join_nodes"]], (n_runs, 1))
+    join_clock = np.zeros((n_runs, plan["n_join"]), dtype=np.float64)
+    join_predecessor = np.zeros((n_runs, plan["n_join"]), dtype=np.int64)
+
+    # tokens
+    token_node = np.full(n_runs, plan["first"], dtype=np.int64)
+    token_case = np.arange(n_runs, dtype=np.int64)
+    token_predecessor = np.full(n_runs, plan["start"], dtype=np.int64)
+    token_clock = np.zeros(n_runs, dtype=np.float64)
+
+    # completed tasks (case, time, order of completion, task)
+    events = []
+    step = 0
+
+    if common_random is not None:
+        first_common_case = common_random.start_cases(runs_per_scenario)
+        decision_keys = np.array(plan["decision_keys"], dtype=np.uint64)
+
+    # cases of this batch that are traced
+    if tracer is not None:
+        first_case = tracer.start_cases(n_runs)
+        traced = np.zeros(n_runs, dtype=bool)
+        traced[tracer.sample_batch(first_case, n_runs) - first_case] = True
+
+    while len(token_node) > 0:
+        step += 1
+        token_kind = kind[token_node]
+        next_node = np.full(len(token_node), -1, dtype=np.int64)
+        spawned = []
+
+        # tasks: advance the clock and record the task in the trace
+        tasks = np.flatnonzero(token_kind == TASK)
+        if len(tasks):
+            nodes = token_node[tasks]
+            token_clock[tasks] += duration_table[case_scenario[token_case[tasks]], nodes]
+            events.append((token_case[tasks], token_clock[tasks], np.full(len(tasks), step), nodes))
+            token_predecessor[tasks] = np.where(plan["is_new"][nodes], token_predecessor[tasks], nodes)
+            next_node[tasks] = successors[nodes, 0]
+
+        # exclusive gateways: every visit counts as a gateway since the last encounter of the started diverging gateways
+        exclusive = np.flatnonzero(token_kind == EXCLUSIVE)
+        if len(exclusive):
+            nodes = token_node[exclusive]
+            cases = token_case[exclusive]
+            splits = diverging[nodes]
+            encounter[cases[splits], xor_slot[nodes[splits]]] += 1
+            pending = (encounter[cases] >= 1) & (first_since[cases] == -1)
+            first_since[cases] = np.where(pending, nodes[:, None], first_since[cases])
+            next_node[exclusive[~splits]] = successors[nodes[~splits], 0]
+
+            for gateway in np.unique(nodes[splits]):
+                members = exclusive[splits][nodes[splits] == gateway]
+                member_cases = token_case[members]
+                slots = np.full(len(members), xor_slot[gateway])
+                member_encounter = encounter[member_cases, slots]
+
+                # look up the cumulative rows of the (gateway, predecessor, encounter) context, unknown contexts fall back to artificial rows
+                rows, known = lookup_probability_rows(plan, gateway, token_predecessor[members], member_encounter)
+                cumulative = np.ones((len(members), max_out), dtype=np.float64)
+                cumulative[known] = cumulative_tables[case_scenario[member_cases[known]], rows[known]]
+                if not known.all():
+                    cumulative[~known] = artificial_rows(plan, slots[~known], member_cases[~known], first_since, last_arc, available, excluded)
+                first_since[member_cases, slots] = -1
+
+                # draw all branch decisions of this gateway in bulk: first arc whose cumulative probability exceeds the uniform
+                if common_random is not None:
+                    contexts = decision_keys[gateway] ^ sim_random.mix64_array(decision_keys[token_predecessor[members]])
+                    draws = common_random.uniforms(first_common_case + member_cases % runs_per_scenario, contexts, member_encounter)
+                else:
+                    draws = rng.random(len(members))
+                chosen = np.minimum((cumulative <= draws[:, None]).sum(axis=1), plan["n_out"][gateway] - 1)
+                last_arc[member_cases, slots] = chosen
+                next_node[members] = successors[gateway, chosen]
+
+                if tracer is not None:
+                    tracer.count_decisions(len(members), np.count_nonzero(~known))
+                    for member in np.flatnonzero(traced[member_cases]).tolist():
+                        tracer.decision(first_case + member_cases[member], plan["labels"][gateway], token_clock[members[member]], plan["labels"][token_predecessor[members[member]]], member_encounter[member], chosen[member], plan["labels"][next_node[members[member]]], not known[member])
+
+        # parallel gateways: diverging gateways spawn one token per branch, converging gateways wait for all incoming branches
+        parallel = np.flatnonzero(token_kind == PARALLEL)
+        if len(parallel):
+            nodes = token_node[parallel]
+            splits = parallel[diverging[nodes]]
+            joins = parallel[~diverging[nodes]]
+
+            if len(joins):
+                cases = token_case[joins]
+                slots = join_slot[token_node[joins]]
+                np.subtract.at(join_counter, (cases, slots), 1)
+                np.maximum.at(case_end, cases, token_clock[joins])
+
+                # the predecessor after the join is the one of the branch that arrived last
+                order = np.lexsort((token_clock[joins], slots, cases))
+                last = np.ones(len(order), dtype=bool)
+                last[:-1] = (cases[order][1:] != cases[order][:-1]) | (slots[order][1:] != slots[order][:-1])
+                arrivals = joins[order][last]
+                arrival_cases = token_case[arrivals]
+                arrival_slots = join_slot[token_node[arrivals]]
+                later = token_clock[arrivals] >= join_clock[arrival_cases, arrival_slots]
+                join_clock[arrival_cases[later], arrival_slots[later]] = token_clock[arrivals[later]]
+                join_predecessor[arrival_cases[later], arrival_slots[later]] = token_predecessor[arrivals[later]]
+
+                # a join fires once, when its counter reaches 0 (converging and diverging gateways split right after)
+                fired = arrivals[join_counter[arrival_cases, arrival_slots] == 0]
+                fired_cases = token_case[fired]
+                fired_slots = join_slot[token_node[fired]]
+                spawned.append(spawn_branches(successors, token_node[fired], fired_cases, join_predecessor[fired_cases, fired_slots], join_clock[fired_cases, fired_slots]))
+
+            if len(splits):
+                spawned.append(spawn_branches(successors, token_node[splits], token_case[splits], token_predecessor[splits], token_clock[splits]))
+
+        # end events and unsupported nodes terminate the token
+        finished = np.flatnonzero((token_kind == END) | (token_kind == OTHER))
+        np.maximum.at(case_end, token_case[finished], token_clock[finished])
+
+        # keep the tokens that moved on and add the spawned branch tokens
+        moving = next_node >= 0
+        token_node = next_node[moving]
+        token_case = token_case[moving]
+        token_predecessor = token_predecessor[moving]
+        token_clock = token_clock[moving]
+        for branch_node, branch_case, branch_predecessor, branch_clock in spawned:
+            token_node = np.concatenate([token_node, branch_node])
+            token_case = np.concatenate([token_case, branch_case])
+            token_predecessor = np.concatenate([token_predecessor, branch_predecessor])
+            token_clock = np.concatenate([token_clock, branch_clock])
+
+    # build the traces in the order in which the tasks finished
+    if events:
+        event_case, event_time, event_step, event_task = (np.concatenate(column) for column in zip(*events))
+    else:
+        event_case = event_time = event_step = event_task = np.zeros(0, dtype=np.int64)
+    np.maximum.at(case_end, event_case, event_time)
+    order = np.lexsort((event_step, event_time, event_case))
+    event_names = plan["names"][event_task[order]]
+    bounds = np.searchsorted(event_case[order], np.arange(n_runs + 1))
+    traces = [tuple(event_names[bounds[case]:bounds[case + 1]]) for case in range(n_runs)]
+
+    if tracer is not None:
+        tracer.count_cases(np.diff(bounds))
+        for case in np.flatnonzero(traced).tolist():
+            for position in range(bounds[case], bounds[case + 1]):
+                task = event_task[order[position]]
+                end = event_time[order[position]]
+                tracer.task(first_case + case, plan["names"][task], end - duration_table[case_scenario[case], task], end)
+
+    return case_end, traces
+
+def run_batch_simulation(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, n_runs=10000, rng=None, aggregator=None, tracer=None, common_random=None):
+    # run all replications at once and add them to the aggregator
+    if rng is None:
+        rng = np.random.default_rng(42)
+    if aggregator is None:
+        aggregator = sim_aggregate.VariantAggregator(sim_durations_df)
+    plan = sim_plan.compile_plan(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, canonical_arcs=common_random is not None)
+    durations, traces = simulate_batch(plan, n_runs, rng, tracer, common_random)
+    aggregator.add_batch(durations, traces)
+    return aggregator
@@ -29,7 +29,7 @@ def check_for_unknown_durations(bpmn, sim_durations_df):
 
     return unknown_durations, sim_durations_df
 
-def request_missing_durations(unknown_durations, significant_durations_df, sim_durations_df):
+def request_missing_durations(unknown_durations, significant_durations_df, sim_durations_df, reasoning_effort=None):
 
     if len(unknown_durations) > 0:
 
@@ -53,7 +53,7 @@ def request_missing_durations(unknown_durations, significant_durations_df, sim_d
         print(known_durations)
 
         # request the unknown durations from the LLM
-        response = evaluator_requests.OpenAI_Call_Durations(prompt)
+        response = evaluator_requests.OpenAI_Call_Durations(prompt, reasoning_effort=reasoning_effort)
 
         try:
             unknown_durations_estimates = json.loads(response)
@@ -79,7 +79,7 @@ def request_missing_durations(unknown_durations, significant_durations_df, sim_d
 
     return sim_durations_df, unknown_durations_estimates
 
-def get_sim_durations(bpmn, significant_durations_df, sim_durations_df):
+def get_sim_durations(bpmn, significant_durations_df, sim_durations_df, reasoning_effort=None):
     unknown_durations, sim_durations_df = check_for_unknown_durations(bpmn, sim_durations_df)
-    sim_durations_df, unknown_durations_estimates = request_missing_durations(unknown_durations, significant_durations_df, sim_durations_df)
+    sim_durations_df, unknown_durations_estimates = request_missing_durations(unknown_durations, significant_durations_df, sim_durations_df, reasoning_effort=reasoning_effort)
     return sim_durations_df, unknown_durations_estimates
\ No newline at end of file
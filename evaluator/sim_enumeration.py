@@ -0,0 +1,247 @@
+import heapq
+import itertools
+import numpy as np
+import pandas as pd
+
+from evaluator import sim_analytic, kpi_accumulators
+from evaluator.sim_analytic import AnalyticUnsupported, advance, decision_states, thaw, freeze
+
+# exact trace variants of the simulation over the compiled plan: the branching structure is walked with the exact probabilities
+# (same rules as the simulation), paths below min_probability are pruned, with top_k the walk stops as soon as the top_k variants are certain
+# the paths are expanded most probable first, so the remaining probability mass bounds every variant that is not found yet
+def enumerate_variants(plan, min_probability=1e-6, top_k=None, max_paths=1000000):
+
+    lists = sim_analytic.plan_lists(plan)
+    names = plan["names"]
+    duration = lists["duration"]
+    n_out = lists["n_out"]
+    join_slot = lists["join_slot"]
+    successors = lists["successors"]
+
+    pruned = [0.0]
+    expanded = [0]
+
+    def count_path():
+        expanded[0] += 1
+        if expanded[0] > max_paths:
+            raise AnalyticUnsupported(f"more than {max_paths} paths")
+
+    # all paths of a parallel branch until it arrives at a converging parallel gateway or ends:
+    # (probability, time, join node or -1, predecessor, state, events relative to the start of the branch)
+    def branch_paths(node, predecessor, state_key, probability):
+        count_path()
+        state = thaw(state_key)
+        events = []
+        stop, node, predecessor, elapsed, first_end, first_duration, probabilities = advance(lists, node, predecessor, state, events)
+        paths = []
+
+        def add(path_probability, time, stop_node, stop_predecessor, stop_state, path_events):
+            paths.append((path_probability, elapsed + time, stop_node, stop_predecessor, stop_state, events + [(elapsed + event_time, task) for event_time, task in path_events]))
+
+        if stop == "decision":
+            for arc_probability, target, branch_state in decision_states(lists, node, freeze(state), probabilities):
+                if probability * arc_probability < min_probability:
+                    pruned[0] += probability * arc_probability
+                    continue
+                for path in branch_paths(target, predecessor, branch_state, probability * arc_probability):
+                    add(arc_probability * path[0], *path[1:])
+
+        elif stop == "split":
+            for block_probability, block_time, continuation, block_state, block_events in block_paths(node, predecessor, freeze(state), probability):
+                if continuation is None:
+                    add(block_probability, block_time, -1, predecessor, block_state, block_events)
+                else:
+                    for path in continuation_paths(*continuation, probability * block_probability):
+                        add(block_probability * path[0], block_time + path[1], path[2], path[3], path[4], block_events + [(block_time + event_time, task) for event_time, task in path[5]])
+
+        else:
+            add(1.0, 0.0, node if stop == "join" else -1, predecessor, freeze(state), [])
+        return paths
+
+    def continuation_paths(join, predecessor, state_key, probability):
+        if n_out[join] == 1:
+            return branch_paths(successors[join][0], predecessor, state_key, probability)
+        paths = []
+        for block_probability, block_time, continuation, block_state, block_events in block_paths(join, predecessor, state_key, probability):
+            if continuation is None:
+                paths.append((block_probability, block_time, -1, predecessor, block_state, block_events))
+            else:
+                for path in continuation_paths(*continuation, probability * block_probability):
+                    paths.append((block_probability * path[0], block_time + path[1], path[2], path[3], path[4], block_events + [(block_time + event_time, task) for event_time, task in path[5]]))
+        return paths
+
+    # joint outcomes of the branches of a parallel block: (probability, time, continuation (join, predecessor, state) or None, state, events)
+    # same join rules as the analytic evaluation
+    def block_paths(split, predecessor, state_key, probability):
+        branches = [branch_paths(target, predecessor, state_key, probability) for target in successors[split]]
+        xor_state = state_key[:6]
+        if len([branch for branch in branches if len(branch) > 1 or branch[0][4][:6] != xor_state]) > 1:
+            raise AnalyticUnsupported("more than one parallel branch with exclusive gateways")
+
+        results = []
+        for combination in itertools.product(*branches):
+            combination_probability = float(np.prod([path[0] for path in combination]))
+            base = thaw(state_key)
+            deciding = [path for path in combination if path[4][:6] != xor_state]
+            state = thaw(deciding[0][4]) if deciding else base
+            state[6] = [counter + sum(path[4][6][slot] - counter for path in combination) for slot, counter in enumerate(base[6])]
+            state[7] = base[7] or any(path[4][7] for path in combination)
+
+            # events of all branches in the order in which they finish (ties in the order of the branches)
+            events = sorted((event for path in combination for event in path[5]), key=lambda event: event[0])
+            block_time = max(path[1] for path in combination)
+            stops = {path[2] for path in combination}
+            continuation = None
+
+            if stops == {-1}:
+                pass
+            elif len(stops) == 1:
+                join = stops.pop()
+                slot = join_slot[join]
+                if state[6][slot] == len(combination):
+                    last_predecessors = {path[3] for path in combination if path[1] == block_time}
+                    if len(last_predecessors) > 1:
+                        raise AnalyticUnsupported("predecessor after a parallel join depends on the event order")
+                    state[6][slot] = 0
+                    continuation = (join, last_predecessors.pop(), freeze(state))
+                elif state[6][slot] <= 0 or state[6][slot] > len(combination):
+                    state[6][slot] -= len(combination)
+                else:
+                    raise AnalyticUnsupported("parallel join fires before all branches arrived")
+            else:
+                raise AnalyticUnsupported("branches of a parallel block end at different nodes")
+
+            results.append((combination_probability, block_time, continuation, freeze(state), events))
+        return results
+
+    # variants found so far: trace -> [probability, probability-weighted duration]
+    variants = {}
+
+    def finish(probability, time, events):
+        trace = tuple(names[task] for event_time, task in events)
+        variant = variants.setdefault(trace, [0.0, 0.0])
+        variant[0] += probability
+        variant[1] += probability * time
+
+    # frontier of partial paths, most probable first: (-probability, tie breaker, node, predecessor, state, time, events, resume after this join)
+    tie_breaker = itertools.count()
+    frontier = [(-1.0, next(tie_breaker), int(plan["first"]), int(plan["start"]), sim_analytic.initial_state(plan), 0.0, (), None)]
+    frontier_mass = 1.0
+
+    def push(probability, node, predecessor, state_key, time, events, resume=None):
+        nonlocal frontier_mass
+        if probability < min_probability:
+            pruned[0] += probability
+            return
+        frontier_mass += probability
+        heapq.heappush(frontier, (-probability, next(tie_breaker), node, predecessor, state_key, time, events, resume))
+
+    def push_block(probability, split, predecessor, state_key, time, events):
+        for block_probability, block_time, continuation, block_state, block_events in block_paths(split, predecessor, state_key, probability):
+            block_events = events + tuple((time + event_time, task) for event_time, task in block_events)
+            if continuation is None:
+                if probability * block_probability < min_probability:
+                    pruned[0] += probability * block_probability
+                else:
+                    finish(probability * block_probability, time + block_time, block_events)
+            else:
+                join, join_predecessor, join_state = continuation
+                push(probability * block_probability, join, join_predecessor, join_state, time + block_time, block_events, resume=join)
+
+    while frontier:
+        # stop once the top_k variants cannot change anymore: the unexplored paths may all end in the (k+1)-th variant (found or not),
+        # so it has to stay below the k-th probability even with all of them (the (k+1)-th probability is 0 if there are only k variants)
+        if top_k is not None and len(variants) >= top_k:
+            largest = heapq.nlargest(top_k + 1, (variant[0] for variant in variants.values()))
+            next_probability = largest[top_k] if len(largest) > top_k else 0.0
+            if next_probability + frontier_mass < largest[top_k - 1]:
+                break
+
+        negative_probability, _, node, predecessor, state_key, time, events, resume = heapq.heappop(frontier)
+        probability = -negative_probability
+        frontier_mass -= probability
+        count_path()
+
+        # the join of a parallel block fired: continue after it (or with the next parallel block)
+        if resume is not None:
+            if n_out[resume] > 1:
+                push_block(probability, resume, predecessor, state_key, time, events)
+                continue
+            node = successors[resume][0]
+
+        state = thaw(state_key)
+        step_events = []
+        stop, node, predecessor, elapsed, first_end, first_duration, probabilities = advance(lists, node, predecessor, state, step_events)
+        events = events + tuple((time + event_time, task) for event_time, task in step_events)
+        time += elapsed
+
+        if stop == "decision":
+            for arc_probability, target, branch_state in decision_states(lists, node, freeze(state), probabilities):
+                push(probability * arc_probability, target, predecessor, branch_state, time, events)
+
+        elif stop == "split":
+            push_block(probability, node, predecessor, freeze(state), time, events)
+
+        elif stop == "join":
+            # only one token: the join fires if this is its last missing arrival, otherwise the case ends here
+            state[6][join_slot[node]] -= 1
+            if state[6][join_slot[node]] == 0:
+                push(probability, node, predecessor, freeze(state), time, events, resume=node)
+            else:
+                finish(probability, time, events)
+
+        else:
+            finish(probability, time, events)
+
+    enumeration_info = {
+        "variants": len(variants),
+        "covered_probability": float(sum(variant[0] for variant in variants.values())),
+        "pruned_probability": float(pruned[0]),
+        "unexplored_probability": float(max(frontier_mass, 0.0)),
+        "min_probability": min_probability,
+        "top_k": top_k,
+    }
+    return variants, enumeration_info
+
+# results in the same form as the simulation: one row per variant with its exact mean durations and probability, plus the mean durations over the covered probability
+# top_k: only the top_k most probable variants are rows, the mean durations are those of the whole model (sim_analytic.expected_durations)
+# kpis: one column per kpi, their means over the covered probability are in info["kpis"]
+def get_enumeration_results(plan, sim_durations_df, min_probability=1e-6, top_k=None, kpis=()):
+    variants, enumeration_info = enumerate_variants(plan, min_probability=min_probability, top_k=top_k)
+    if not variants:
+        raise AnalyticUnsupported("no variant above the minimum probability")
+
+    first_event_durations = sim_durations_df.drop_duplicates(subset="activity").set_index("activity")["weighted_significant_duration"].to_dict()
+    traces = list(variants)
+    probabilities = np.array([variants[trace][0] for trace in traces])
+    durations = np.array([variants[trace][1] for trace in traces]) / probabilities
+    # Avoid subtracting more than the duration (loops can exaggerate the first activity duration)
+    first_durations = np.array([first_event_durations[trace[0]] if trace else 0.0 for trace in traces])
+    adjusted_durations = durations - np.minimum(first_durations, durations)
+
+    if top_k is None:
+        covered_probability = probabilities.sum()
+        mean_duration = float((probabilities * durations).sum() / covered_probability)
+        adjusted_mean_duration = float((probabilities * adjusted_durations).sum() / covered_probability)
+    else:
+        # the walk stopped as soon as the top_k variants were certain, the variants found do not cover the model
+        # --> top_k only limits the rows, the means are the exact expected durations of the model (AnalyticUnsupported falls back to the simulation)
+        mean_duration, adjusted_mean_duration = sim_analytic.expected_durations(plan)
+
+    simulation_results_df = pd.DataFrame({
+        "Duration": durations,
+        "Adj. Duration": adjusted_durations,
+        "Percentage": probabilities * 100,
+        "Trace": [list(trace) for trace in traces],
+    })
+    if kpis:
+        for kpi in kpis:
+            kpi.start(sim_durations_df)
+        kpi_values = kpi_accumulators.variant_kpi_values(kpis, traces)
+        simulation_results_df = kpi_accumulators.insert_kpi_columns(simulation_results_df, kpi_values)
+        enumeration_info["kpis"] = kpi_accumulators.kpi_means(kpis, kpi_values, probabilities)
+    simulation_results_df = simulation_results_df.sort_values(by='Percentage', ascending=False, kind="stable").reset_index(drop=True)
+    if top_k is not None:
+        simulation_results_df = simulation_results_df.head(top_k)
+
+    return simulation_results_df, mean_duration, adjusted_mean_duration, enumeration_info
@@ -0,0 +1,55 @@
+import numpy as np
+from statistics import NormalDist
+
+from evaluator import evaluator_simulation, sim_random
+
+# statistics of the paired differences old - new of the cases (antithetic pairs of cases are one sampling unit)
+def paired_difference_stats(old_durations, new_durations, antithetic=False, confidence=0.95):
+    differences = old_durations - new_durations
+    if antithetic:
+        units = len(differences) // 2 * 2
+        differences = differences[:units].reshape(-1, 2).mean(axis=1)
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    old_mean = old_durations.mean()
+    mean_difference = differences.mean()
+
+    # variance of the mean difference with paired cases, and with two independent simulations of the same size for comparison
+    variance_of_difference = differences.var(ddof=1) if len(differences) > 1 else np.inf
+    mean_difference_variance = variance_of_difference / len(differences)
+    independent_variance = (old_durations.var(ddof=1) + new_durations.var(ddof=1)) / len(old_durations) if len(old_durations) > 1 else np.inf
+
+    paired_info = {
+        "replications": len(old_durations),
+        "antithetic": antithetic,
+        "confidence": confidence,
+        "mean_difference": float(mean_difference),
+        "variance_of_difference": float(variance_of_difference),
+        "mean_difference_variance": float(mean_difference_variance),
+        "mean_difference_ci_half_width": float(z * np.sqrt(mean_difference_variance)),
+        "independent_mean_difference_variance": float(independent_variance),
+        # how many times more replications two independent simulations need for the same confidence interval
+        "variance_reduction_factor": float(independent_variance / mean_difference_variance) if mean_difference_variance > 0 else np.inf,
+        "time_saved_percentage": float(mean_difference / old_mean),
+        "time_saved_percentage_ci_half_width": float(z * np.sqrt(mean_difference_variance) / old_mean),
+    }
+    return paired_info
+
+# simulate the old and the new model with common random numbers: case i of both models takes the same decision wherever the models share
+# a (gateway, predecessor) context, so the difference of the means has a much smaller variance than with two independent simulations
+def get_paired_simulation_results(old_bpmn, new_bpmn, log, log_activities, significant_durations_df, sim_durations_df, engine="simpy", seed=42, n_runs=10000, antithetic=True, confidence=0.95, kpis=()):
+
+    print("Paired simulation old model")
+    old_results = evaluator_simulation.get_simulation_results(old_bpmn, log, log_activities, significant_durations_df, sim_durations_df, engine=engine, seed=seed, n_runs=n_runs, common_random=sim_random.CommonRandomNumbers(seed, antithetic), kpis=kpis)
+    print("Paired simulation new model")
+    new_results = evaluator_simulation.get_simulation_results(new_bpmn, log, log_activities, significant_durations_df, old_results[4], engine=engine, seed=seed, n_runs=n_runs, common_random=sim_random.CommonRandomNumbers(seed, antithetic), kpis=kpis)
+
+    # the case durations are only needed for the pairing, they do not stay with the results
+    old_durations = old_results[0].attrs.pop("case_durations")
+    new_durations = new_results[0].attrs.pop("case_durations")
+
+    paired_info = paired_difference_stats(old_durations, new_durations, antithetic=antithetic, confidence=confidence)
+    print(f"Paired mean difference: {paired_info['mean_difference']} +- {paired_info['mean_difference_ci_half_width']}")
+    print(f"Variance of the mean difference: {paired_info['mean_difference_variance']} (independent simulations: {paired_info['independent_mean_difference_variance']}, reduction factor: {paired_info['variance_reduction_factor']})")
+
+    return old_results, new_results, paired_info
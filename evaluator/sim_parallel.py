@@ -0,0 +1,32 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# split the replications as evenly as possible across the workers
+def split_replications(n_runs, workers):
+    return [n_runs // workers + (1 if worker < n_runs % workers else 0) for worker in range(workers)]
+
+# runs in the worker process: simulate a share of the replications with the worker's own random stream, only the aggregate is sent back
+def simulate_share(engine, bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, n_runs, seed_sequence):
+    rng = np.random.default_rng(seed_sequence)
+    return engine(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, n_runs=n_runs, rng=rng)
+
+def run_parallel_simulation(engine, bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, aggregator, n_runs=10000, workers=None, seed=42):
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # every worker gets its own child stream of the seed --> results only depend on the seed and the number of workers
+    seed_sequences = np.random.SeedSequence(seed).spawn(workers)
+    shares = split_replications(n_runs, workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(simulate_share, engine, bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, share, seed_sequence)
+            for share, seed_sequence in zip(shares, seed_sequences)
+            if share > 0
+        ]
+        # merge in submission order, so that the result does not depend on which worker finishes first
+        for future in futures:
+            aggregator.merge(future.result())
+
+    return aggregator
@@ -0,0 +1,153 @@
+import numpy as np
+
+from evaluator import sim_random, bpmn_graph
+
+# node kinds of the execution plan (the kinds of the graph index, starts and other activities are OTHER)
+TASK = bpmn_graph.TASK
+EXCLUSIVE = bpmn_graph.EXCLUSIVE
+PARALLEL = bpmn_graph.PARALLEL
+END = bpmn_graph.END
+OTHER = bpmn_graph.OTHER
+
+# exclusive gateways with up to this many out arcs get a precomputed table of all artificial fallback rows
+FALLBACK_TABLE_WIDTH = 12
+
+# cumulative distribution of a probability row, normalized like np.random.choice does it (draw = number of entries <= uniform)
+def cumulative_row(probabilities):
+    cumulative = np.cumsum(probabilities, axis=-1)
+    return cumulative / cumulative[..., -1:]
+
+# cumulative rows of the uniform distribution over the arcs whose bit is set in the mask (artificial probabilities)
+def uniform_cumulative(masks, width):
+    bits = (np.asarray(masks, dtype=np.int64)[:, None] >> np.arange(width)) & 1
+    counts = bits.sum(axis=1, keepdims=True)
+    # an empty mask has no arc left, it falls back to the first arc
+    probabilities = np.where(counts > 0, bits / np.maximum(counts, 1), np.eye(1, width))
+    return cumulative_row(probabilities)
+
+# cumulative fallback rows of the given arc masks, from the table if the gateways are small enough
+def fallback_rows(plan, masks):
+    if plan["fallback_cumulative"] is not None:
+        return plan["fallback_cumulative"][masks]
+    return uniform_cumulative(masks, plan["successors"].shape[1])
+
+# stable signature of a node that does not depend on the generated node ids: task name, or the signatures of what follows a gateway
+# used to recognize the same decision in two versions of a model (common random numbers)
+# (node as id of the graph index)
+def node_signature(graph, node, depth=3):
+    kind = graph.kind_list[node]
+    if kind == bpmn_graph.TASK:
+        return graph.names[node]
+    if kind == bpmn_graph.START:
+        return "<start>"
+    if kind == bpmn_graph.END:
+        return "<end>"
+    if depth == 0:
+        return "<...>"
+    return "(" + ",".join(sorted(node_signature(graph, graph.arc_target[arc], depth - 1) for arc in graph.out_arcs[node])) + ")"
+
+# compile the bpmn once into an execution plan: integer node ids and flat arrays, so that the simulations do not touch pm4py objects or dataframes
+# canonical_arcs: order the out arcs of every node by the signature of their target instead of the model order
+# (two versions of a model then map the same uniform to the same branch, needed for common random numbers)
+def compile_plan(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, canonical_arcs=False):
+
+    graph = bpmn_graph.get_graph(bpmn)
+    nodes = graph.nodes
+    node_ids = graph.node_ids
+    n_nodes = graph.n_nodes()
+
+    # first row per activity wins (same lookup as sim_durations_df[...].values[0])
+    durations = sim_durations_df.drop_duplicates(subset="activity").set_index("activity")["weighted_significant_duration"].to_dict()
+
+    kind = np.where(np.isin(graph.kind, [TASK, EXCLUSIVE, PARALLEL, END]), graph.kind, OTHER).astype(np.int8)
+    diverging = graph.direction == bpmn_graph.DIVERGING
+    n_out = np.array([len(arcs) for arcs in graph.out_arcs], dtype=np.int64)
+    n_in = np.array([len(arcs) for arcs in graph.in_arcs], dtype=np.int64)
+    tasks = graph.nodes_of_kind(bpmn_graph.TASK)
+    duration = np.zeros(n_nodes, dtype=np.float64)
+    duration[tasks] = [durations[graph.names[task]] for task in tasks]
+    is_new = np.array(graph.node_flags(new_activities), dtype=bool) & (kind == TASK)
+
+    signatures = [node_signature(graph, node) for node in range(n_nodes)]
+
+    # successor table: row = node, column = position of the out arc
+    max_out = max(1, int(n_out.max()))
+    successors = np.full((n_nodes, max_out), -1, dtype=np.int64)
+    out_arcs = {}
+    for index in range(n_nodes):
+        arcs = graph.out_arcs[index]
+        if canonical_arcs:
+            arcs = sorted(arcs, key=lambda arc: signatures[graph.arc_target[arc]])
+        for position, arc in enumerate(arcs):
+            successors[index, position] = graph.arc_target[arc]
+            out_arcs[graph.arcs[arc]] = position
+
+    # slots for the per-case state of diverging exclusive gateways and converging parallel gateways
+    xor_slot = np.full(n_nodes, -1, dtype=np.int64)
+    xor_nodes = np.flatnonzero((kind == EXCLUSIVE) & diverging)
+    xor_slot[xor_nodes] = np.arange(len(xor_nodes))
+
+    join_slot = np.full(n_nodes, -1, dtype=np.int64)
+    join_nodes = np.flatnonzero((kind == PARALLEL) & ~diverging)
+    join_slot[join_nodes] = np.arange(len(join_nodes))
+
+    # probability table: one cumulative row per (gateway, predecessor, encounter), columns = out arc positions
+    # the contexts are encoded as sorted integer keys, so that the rows of many tokens are found with one searchsorted
+    # every branch decision is then one uniform number compared against a precomputed row
+    max_encounter = max([encounter for gateway in gateway_arc_probabilities for predecessor in gateway_arc_probabilities[gateway] for encounter in gateway_arc_probabilities[gateway][predecessor]], default=0)
+    cumulative_rows = {}
+    probability_keys = []
+    cumulative_table = []
+    for gateway in gateway_arc_probabilities:
+        for predecessor in gateway_arc_probabilities[gateway]:
+            for encounter, arc_probabilities in gateway_arc_probabilities[gateway][predecessor].items():
+                row = np.zeros(max_out, dtype=np.float64)
+                for arc, probability in arc_probabilities.items():
+                    row[out_arcs[arc]] = probability
+                # marginal case: no successor follows the predecessor in the log --> uniform over all arcs
+                if row.sum() == 0:
+                    row[:n_out[node_ids[gateway]]] = 1 / n_out[node_ids[gateway]]
+                row = cumulative_row(row[:n_out[node_ids[gateway]]])
+                cumulative_rows[(node_ids[gateway], node_ids[predecessor], encounter)] = row.tolist()
+                probability_keys.append((node_ids[gateway] * n_nodes + node_ids[predecessor]) * (max_encounter + 1) + encounter)
+                # padding with 1 keeps the arcs beyond n_out from being drawn
+                cumulative_table.append(np.concatenate([row, np.ones(max_out - len(row))]))
+    probability_keys = np.array(probability_keys, dtype=np.int64)
+    order = np.argsort(probability_keys)
+
+    # artificial fallback: the arcs still available at a gateway are a bitmask, every mask maps to the uniform row over its arcs
+    fallback_cumulative = uniform_cumulative(np.arange(2 ** max_out), max_out) if max_out <= FALLBACK_TABLE_WIDTH else None
+
+    start_node = nodes[graph.nodes_of_kind(bpmn_graph.START)[0]]
+
+    return {
+        "names": np.array([node.name for node in nodes], dtype=object),
+        # readable node labels for tracing (gateways usually have no name)
+        "labels": np.array([node.name or node.get_id() for node in nodes], dtype=object),
+        "kind": kind,
+        "diverging": diverging,
+        "duration": duration,
+        "is_new": is_new,
+        "n_in": n_in,
+        "n_out": n_out,
+        "successors": successors,
+        "xor_slot": xor_slot,
+        "join_slot": join_slot,
+        "n_xor": len(xor_nodes),
+        "n_join": len(join_nodes),
+        "xor_nodes": xor_nodes,
+        "join_nodes": join_nodes,
+        "max_encounter": max_encounter,
+        "probability_keys": probability_keys[order],
+        "cumulative_table": np.array(cumulative_table, dtype=np.float64).reshape(-1, max_out)[order],
+        "fallback_cumulative": fallback_cumulative,
+        "full_masks": (1 << n_out[xor_nodes]) - 1,
+        # python views for the case-by-case simulation (scalar access to lists is faster than to numpy arrays)
+        "cumulative_rows": cumulative_rows,
+        "fallback_lists": fallback_cumulative.tolist() if fallback_cumulative is not None else None,
+        "successor_lists": [[target for target in row if target >= 0] for row in successors.tolist()],
+        # stable keys of the decision contexts (predecessor and gateway signatures) for common random numbers
+        "decision_keys": [sim_random.string_key(signature) for signature in signatures],
+        "start": node_ids[start_node],
+        "first": successors[node_ids[start_node], 0],
+    }
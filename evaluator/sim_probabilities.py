@@ -1,53 +1,54 @@
 import pm4py
 
+from evaluator import bpmn_graph
+
 ### functions to get gateway probabilities
 
+# counted frequencies of gateways by their signature (see gateway_signature), shared by the original model, the improved model and later candidates
+# signature -> per predecessor (in order of first occurrence): encounter -> [(position of the successor in the successor list, frequency)]
+frequency_cache = {}
+FREQUENCY_CACHE_SIZE = 10000
+frequency_cache_statistics = {"hits": 0, "misses": 0}
+
 def get_diverging_exclusive_gateways(bpmn):
-    exclusive_gateways = [node for node in bpmn.get_nodes() if isinstance(node, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway)]
-    diverging_exclusive_gateways = [gateway for gateway in exclusive_gateways if gateway._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING]
-    return diverging_exclusive_gateways
-
-# get predecessors of a gateway
-def get_predecessors(gateway, new_activities):
-
-    def follow_up_predecessors(node, visited=None, parallel_gateway_opened=False):
-        
-        if visited is None:
-            visited = set()
-            
+    graph = bpmn_graph.get_graph(bpmn)
+    return [graph.nodes[node] for node in graph.nodes_of_kind(bpmn_graph.EXCLUSIVE, bpmn_graph.DIVERGING)]
+
+# get predecessors of a gateway (searched backwards on the graph index, is_new: flag per node of the graph whether it is a new activity)
+def get_predecessors(graph, gateway, is_new):
+
+    def follow_up_predecessors(node, visited, parallel_gateway_opened=False):
+
         predecessors = []
         if node in visited:
             return predecessors
-        
+
         visited.add(node)
-        in_arcs = node.get_in_arcs()
-        
-        for arc in in_arcs:
-            source = arc.get_source()
 
-            if isinstance(source, pm4py.objects.bpmn.obj.BPMN.Activity):
+        for arc in graph.in_arcs[node]:
+            source = graph.arc_source[arc]
+            kind = graph.kind_list[source]
+
+            if kind == bpmn_graph.TASK or kind == bpmn_graph.ACTIVITY:
                 # if source is a new activity, continue the search
-                if source in new_activities:
+                if is_new[source]:
                     predecessors.extend(follow_up_predecessors(source, visited))
                 # if source is not a new activity, add it to the predecessors
                 else:
                     predecessors.append(source)
 
-            elif isinstance(source, pm4py.objects.bpmn.obj.BPMN.StartEvent):
+            elif kind == bpmn_graph.START:
                 predecessors.append(source)
 
-            elif isinstance(source, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway):
-                if parallel_gateway_opened:
-                    predecessors.extend(follow_up_predecessors(source, visited, parallel_gateway_opened))
-                else:
-                    predecessors.extend(follow_up_predecessors(source, visited))
+            elif kind == bpmn_graph.EXCLUSIVE:
+                predecessors.extend(follow_up_predecessors(source, visited, parallel_gateway_opened))
 
-            elif isinstance(source, pm4py.objects.bpmn.obj.BPMN.ParallelGateway):
+            elif kind == bpmn_graph.PARALLEL:
                 # check if it is converging or diverging
-                if source._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING:
+                if graph.direction_list[source] == bpmn_graph.CONVERGING:
                     parallel_gateway_opened = True # When we see a converging gateway while going backwards, we set the flag
                     predecessors.extend(follow_up_predecessors(source, visited, parallel_gateway_opened))
-                elif source._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING:
+                elif graph.direction_list[source] == bpmn_graph.DIVERGING:
                     if parallel_gateway_opened:
                         # If we see a diverging gateway and we previously saw its converging pair, we stop the search in this direction
                         return predecessors
@@ -56,56 +57,50 @@ def get_predecessors(gateway, new_activities):
                         predecessors.extend(follow_up_predecessors(source, visited))
         return predecessors
 
-    predecessors = follow_up_predecessors(gateway)
-    return predecessors
+    predecessors = follow_up_predecessors(graph.node_ids[gateway], set())
+    return [graph.nodes[predecessor] for predecessor in predecessors]
 
-def get_predecessors_all_gateways(diverging_exclusive_gateways, new_activities):
+def get_predecessors_all_gateways(graph, diverging_exclusive_gateways, is_new):
     # # find all predecessors of the gateways
     gateway_predecessors = {}
     for gateway in diverging_exclusive_gateways:
-        gateway_predecessors[gateway] = get_predecessors(gateway, new_activities)
+        gateway_predecessors[gateway] = get_predecessors(graph, gateway, is_new)
     return gateway_predecessors
 
 
-# get task successors of individual gateways
-def get_successors(gateway, new_activities):
+# get task successors of individual gateways (searched forwards on the graph index)
+def get_successors(graph, gateway, is_new):
 
-    def follow_up_successors(node, visited=None, parallel_gateway_opened=False):
+    def follow_up_successors(node, visited, parallel_gateway_opened=False):
 
-        if visited is None:
-            visited = set()
-            
         successors = []
         if node in visited:
             return successors
-        
+
         visited.add(node)
-        out_arcs = node.get_out_arcs()
-        
-        for arc in out_arcs:
-            target = arc.get_target()
 
-            if isinstance(target, pm4py.objects.bpmn.obj.BPMN.Activity):
+        for arc in graph.out_arcs[node]:
+            target = graph.arc_target[arc]
+            kind = graph.kind_list[target]
+
+            if kind == bpmn_graph.TASK or kind == bpmn_graph.ACTIVITY:
                 # check if target is a new activity
-                if target in new_activities:
+                if is_new[target]:
                     successors.extend(follow_up_successors(target, visited))
                 else:
                     successors.append(target)
 
-            elif isinstance(target, pm4py.objects.bpmn.obj.BPMN.EndEvent):
+            elif kind == bpmn_graph.END:
                 successors.append(target)
 
-            elif isinstance(target, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway):
-                if parallel_gateway_opened:
-                    successors.extend(follow_up_successors(target, visited, parallel_gateway_opened))
-                else:	
-                    successors.extend(follow_up_successors(target, visited))
+            elif kind == bpmn_graph.EXCLUSIVE:
+                successors.extend(follow_up_successors(target, visited, parallel_gateway_opened))
 
-            elif isinstance(target, pm4py.objects.bpmn.obj.BPMN.ParallelGateway):
-                if target._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING:
+            elif kind == bpmn_graph.PARALLEL:
+                if graph.direction_list[target] == bpmn_graph.DIVERGING:
                     parallel_gateway_opened = True
                     successors.extend(follow_up_successors(target, visited, parallel_gateway_opened))
-                elif target._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING:
+                elif graph.direction_list[target] == bpmn_graph.CONVERGING:
                     if parallel_gateway_opened:
                         return successors
                     else:
@@ -113,54 +108,52 @@ def get_successors(gateway, new_activities):
 
         return successors
 
-    gateway_out_arcs = gateway.get_out_arcs()
     gateway_arc_successors = {}
 
+    # the visited nodes are shared by the out arcs of the gateway
     visited = set()
 
-    for arc in gateway_out_arcs:
-        parallel_gateway_opened = False
-        target = arc.get_target()
-        
-        if isinstance(target, pm4py.objects.bpmn.obj.BPMN.Activity):
+    for arc in graph.out_arcs[graph.node_ids[gateway]]:
+        target = graph.arc_target[arc]
+        kind = graph.kind_list[target]
+
+        if kind == bpmn_graph.TASK or kind == bpmn_graph.ACTIVITY:
             # check if target is a new activity
-            if target in new_activities:
-                gateway_arc_successors[arc] = follow_up_successors(target, visited)
+            if is_new[target]:
+                successors = follow_up_successors(target, visited)
             else:
-                gateway_arc_successors[arc] = [target]
-
-        elif isinstance(target, pm4py.objects.bpmn.obj.BPMN.EndEvent):
-            gateway_arc_successors[arc] = [target]
-
-        elif isinstance(target, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway):
-            if parallel_gateway_opened == True:
-                gateway_arc_successors[arc] = follow_up_successors(target, visited, parallel_gateway_opened)
-            else:	
-                gateway_arc_successors[arc] = follow_up_successors(target, visited)
-
-        elif isinstance(target, pm4py.objects.bpmn.obj.BPMN.ParallelGateway):
-            if target._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.DIVERGING:
-                parallel_gateway_opened = True
-                gateway_arc_successors[arc] = follow_up_successors(target, visited, parallel_gateway_opened)
-            elif target._Gateway__gateway_direction == pm4py.objects.bpmn.obj.BPMN.Gateway.Direction.CONVERGING:
-                if parallel_gateway_opened:
-                    return gateway_arc_successors
-                else:
-                    gateway_arc_successors[arc] = follow_up_successors(target, visited)
+                successors = [target]
+
+        elif kind == bpmn_graph.END:
+            successors = [target]
+
+        elif kind == bpmn_graph.EXCLUSIVE:
+            successors = follow_up_successors(target, visited)
+
+        elif kind == bpmn_graph.PARALLEL and graph.direction_list[target] == bpmn_graph.DIVERGING:
+            successors = follow_up_successors(target, visited, True)
+
+        elif kind == bpmn_graph.PARALLEL and graph.direction_list[target] == bpmn_graph.CONVERGING:
+            successors = follow_up_successors(target, visited)
+
+        else:
+            continue
+
+        gateway_arc_successors[graph.arcs[arc]] = [graph.nodes[successor] for successor in successors]
 
     return gateway_arc_successors
 
-def get_successors_all_gateways(diverging_exclusive_gateways, new_activities):
+def get_successors_all_gateways(graph, diverging_exclusive_gateways, is_new):
     gateway_arc_successors = {}
     for gateway in diverging_exclusive_gateways:
-        gateway_arc_successors[gateway] = get_successors(gateway, new_activities)
+        gateway_arc_successors[gateway] = get_successors(graph, gateway, is_new)
     return gateway_arc_successors
 
 # allocate frequencies to the successors of the gateways depending on the predecessors
 def prepare_successor_counting(log, diverging_exclusive_gateways, gateway_arc_successors, gateway_predecessors):
 
     # get start events
-    start_events = pm4py.get_start_activities(log, activity_key='concept:name', case_id_key='case:concept:name', timestamp_key='time:timestamp') # returns dict with key = start event, value = count
+    start_events = log.get_start_activities() # returns dict with key = start event, value = count
 
     # map successors directly to gateways (needed for frequency allocation)
     gateway_successors = {}
@@ -182,64 +175,8 @@ def prepare_successor_counting(log, diverging_exclusive_gateways, gateway_arc_su
     return start_events, gateway_path_frequencies, gateway_successors
 
 
-def filter_log_count_successors(log, predecessor, successors, gateway_path_frequencies, start_events, gateway):
-
-    def check_suffix(suffix_variant, suffix_variant_frequency, predecessor, task_successors, end_successor, gateway_encounter):
-
-        # initialize dict frequencies for current gateway encounter and every successor
-        if gateway_encounter not in gateway_path_frequencies[gateway][predecessor]:
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter] = {}
-        for successor in task_successors:
-            if successor not in gateway_path_frequencies[gateway][predecessor][gateway_encounter]:
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter][successor] = 0
-        if end_successor:
-            if end_successor not in gateway_path_frequencies[gateway][predecessor][gateway_encounter]:
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter][end_successor] = 0
-
-        # check if trace only consists of the predecessor --> then we attribute the frequency to the end event
-        if len(suffix_variant) == 1 and suffix_variant[0] == predecessor.name:
-            if end_successor:
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter][end_successor] += suffix_variant_frequency
-
-        else:
-            # remove the predecessor from the suffix
-            suffix_variant = suffix_variant[1:]
-
-            # initialize variable to check if any task successor is in the suffix variant
-            successors_in_suffix = [task_successor for task_successor in task_successors if task_successor.name in suffix_variant]
-
-            if successors_in_suffix:
-
-                # find the indices of all successors that are activities in the suffix and check which one comes first
-                successors_in_suffix_index = {}
-                for successor in successors_in_suffix:
-                    successors_in_suffix_index[successor] = suffix_variant.index(successor.name)
-
-                # get the successor that comes first in the suffix
-                first_successor = min(successors_in_suffix_index, key=successors_in_suffix_index.get)
-
-                # increment the frequency of the successor that comes first by the frequency of the suffix variant
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter][first_successor] += suffix_variant_frequency
-
-                # cut the suffix right after the occurrence of the first successor (take suffix but do not keep first successor, because of simple loops)
-                cutted_suffix_variant_successor = suffix_variant[suffix_variant.index(first_successor.name)+1:]
-                
-                # check if further checks on suffix variant are needed: check if the predecessor is again in the suffix
-                if predecessor.name in cutted_suffix_variant_successor:
-                    # cut the suffix variant right before the first occurrence of the predecessor --> trace a b c d e c d and predecessor is c --> keep cdecd
-                    cutted_suffix_variant = cutted_suffix_variant_successor[cutted_suffix_variant_successor.index(predecessor.name):]
-                    # initiate the recursive function with the cutted suffix variant
-                    gateway_encounter += 1
-                    check_suffix(cutted_suffix_variant, suffix_variant_frequency, predecessor, task_successors, end_successor, gateway_encounter)
-
-            if not successors_in_suffix and end_successor and len(suffix_variant) > 0:
-                # if no other successor is in the trace, increment the frequency of the end event by the frequency of the suffix variant
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter][end_successor] += suffix_variant_frequency
-
-    # initialize the gateway encounter
-    gateway_encounter = 1
-
-    # make a list to identify the kind of successor
+# task successors of a gateway and its end event successor (the last one, if there are several)
+def split_successors(successors):
     task_successors = []
     end_successor = None
     for successor in successors:
@@ -247,62 +184,128 @@ def filter_log_count_successors(log, predecessor, successors, gateway_path_frequ
             end_successor = successor
         else:
             task_successors.append(successor)
+    return task_successors, end_successor
+
+# successor that occurs first in the variant after the position (ties go to the earlier successor in the list), with its position
+def first_successor_after(variant_index, variant, task_successor_codes, after):
+    first_successor, first_position = None, None
+    for successor, code in task_successor_codes:
+        position = variant_index.next_position(variant, code, after)
+        if position is not None and (first_position is None or position < first_position):
+            first_successor, first_position = successor, position
+    return first_successor, first_position
+
+# count the successors of a task predecessor in one variant
+# from the first occurrence of the predecessor, the first task successor after it gets the frequency of the variant (the end event if there is none);
+# if the predecessor occurs again after that successor, this is the next encounter of the gateway (e.g. trace a b c d e c d and predecessor c)
+def count_task_predecessor(variant_index, variant, frequencies, predecessor_code, task_successors, task_successor_codes, end_successor):
+    variant_frequency = variant_index.variant_counts[variant]
+    predecessor_position = variant_index.next_position(variant, predecessor_code)
+    gateway_encounter = 1
+    while predecessor_position is not None:
 
-    # common case: predecessor is a task
-    if isinstance(predecessor, pm4py.objects.bpmn.obj.BPMN.Task):
-
-        # from the log, keep only the suffixes of predecessor (strict = False --> keeps the predecessor in the suffix)
-        filtered_log_suffixes = pm4py.filter_suffixes(log, predecessor.name, strict=False)
-        # get the variants of the filtered log suffixes --> dict with key = variant, value = count
-        suffix_variants = pm4py.get_variants(filtered_log_suffixes)
-
-        # iterate through all suffix variants and check the suffixes for the eventually follows relations of the successors with the predecessor
-        for suffix_variant in suffix_variants:
-            suffix_variant_frequency = suffix_variants[suffix_variant]
-            check_suffix(suffix_variant, suffix_variant_frequency, predecessor, task_successors, end_successor, gateway_encounter)
-
-    # exeptional case: predecessor is a start event
-    # frequency allocation if predecessor = start event can happen outside of the function because this always happens only once & we do not need to check suffixes but the whole variants of the log
-    elif isinstance(predecessor, pm4py.objects.bpmn.obj.BPMN.StartEvent):
-
-        # initialize dict frequencies for gateway encounter and every successor
-        if gateway_encounter not in gateway_path_frequencies[gateway][predecessor]:
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter] = {}
-        for successor in successors:
-            if successor not in gateway_path_frequencies[gateway][predecessor][gateway_encounter]:
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter][successor] = 0
-        
-        # get the process variants of the complete log and count frequencies of task successors in every variant
-        process_variants = pm4py.get_variants(log)
-        for variant in process_variants:
-            # get the frequency of the variant
-            variant_frequency = process_variants[variant]
-            # initialize variable to check if any task successor is in the suffix variant
-            successors_in_variant = [task_successor for task_successor in task_successors if task_successor.name in variant] # we do not count successors that are end events in this case, because: frequency of path start -> end is always 0, because process never happened
-
-            if successors_in_variant:
-                # find the indices of all successors that are activities in the trace and check which one comes first
-                successors_in_variant_index = {}
-                for successor in successors_in_variant:
-                    successors_in_variant_index[successor] = variant.index(successor.name)
-                # get the successor that comes first in the trace
-                first_successor = min(successors_in_variant_index, key=successors_in_variant_index.get)
-                # increment the frequency of the successor that comes first by the frequency of the variant
-                gateway_path_frequencies[gateway][predecessor][gateway_encounter][first_successor] += variant_frequency
-
-    return gateway_path_frequencies
+        # initialize dict frequencies for current gateway encounter and every successor
+        encounter_frequencies = frequencies.setdefault(gateway_encounter, {})
+        for successor in task_successors + ([end_successor] if end_successor else []):
+            encounter_frequencies.setdefault(successor, 0)
 
+        first_successor, first_position = first_successor_after(variant_index, variant, task_successor_codes, predecessor_position)
+        if first_successor is None:
+            # if no other successor follows, the frequency goes to the end event
+            if end_successor:
+                encounter_frequencies[end_successor] += variant_frequency
+            return
+
+        encounter_frequencies[first_successor] += variant_frequency
+        # next occurrence of the predecessor after the successor (not before it, because of simple loops)
+        predecessor_position = variant_index.next_position(variant, predecessor_code, first_position)
+        gateway_encounter += 1
+
+# count the successors of a start event predecessor in one variant: the task successor that comes first in the variant gets its frequency
+# (we do not count successors that are end events in this case, because: frequency of path start -> end is always 0, because process never happened)
+def count_start_predecessor(variant_index, variant, frequencies, task_successor_codes):
+    first_successor, _ = first_successor_after(variant_index, variant, task_successor_codes, -1)
+    if first_successor is not None:
+        frequencies[1][first_successor] += variant_index.variant_counts[variant]
+
+# nodes of a list as (kind, name, position of the first occurrence of the node in the list)
+# a node that is found twice counts twice as predecessor and once as successor, so the repetitions are part of the signature
+def node_list_signature(nodes):
+    first_positions = {}
+    return tuple((bpmn_graph.node_kind(node), node.name, first_positions.setdefault(node, position)) for position, node in enumerate(nodes))
+
+# everything the counting of a gateway depends on: the log (its variant table) and the task-level predecessors and successors
+# the new activities are skipped by the searches, so they enter through the predecessors and successors
+# --> a decision point that an improvement leaves unchanged has the same signature in the original and the improved model
+def gateway_signature(variant_index, predecessors, successors):
+    return (variant_index.fingerprint, node_list_signature(predecessors), node_list_signature(successors))
+
+# frequencies of a gateway in the form of the cache (positions instead of the nodes of the model)
+def frequencies_to_cache(frequencies, predecessors, successors):
+    successor_positions = {}
+    for position, successor in enumerate(successors):
+        successor_positions.setdefault(successor, position)
+    return [
+        {encounter: [(successor_positions[successor], frequency) for successor, frequency in successor_frequencies.items()] for encounter, successor_frequencies in frequencies[predecessor].items()}
+        for predecessor in dict.fromkeys(predecessors)
+    ]
+
+def frequencies_from_cache(cached_frequencies, frequencies, predecessors, successors):
+    for predecessor, predecessor_frequencies in zip(dict.fromkeys(predecessors), cached_frequencies):
+        for encounter, successor_frequencies in predecessor_frequencies.items():
+            frequencies[predecessor][encounter] = {successors[position]: frequency for position, frequency in successor_frequencies}
+
+# we check the variants for all eventually follows relations of the successors with the predecessors of all gateways in one pass over the variants of the log
+# special handling: successor = end event --> for current encounter: we count traces where no other successor is in the trace (& no next encounter happens, but this is implicitly the case, as a next encounter can only happen if there is a task-successor in the trace)
+# gateways whose signature was counted before (e.g. in the original model) take the frequencies from the cache
 def get_gateway_successor_frequencies(diverging_exclusive_gateways, log, gateway_predecessors, gateway_successors, start_events, gateway_path_frequencies):
 
+    variant_index = log.variant_index()
+
+    # one counting per gateway and predecessor, the activities as codes of the log (None if they are not in the log)
+    countings = []
+    counted_gateways = []
+    hits = 0
     for gateway in diverging_exclusive_gateways:
-    
-        predecessors = gateway_predecessors[gateway]
-        successors = gateway_successors[gateway]
+        signature = gateway_signature(variant_index, gateway_predecessors[gateway], gateway_successors[gateway])
+        if signature in frequency_cache:
+            frequencies_from_cache(frequency_cache[signature], gateway_path_frequencies[gateway], gateway_predecessors[gateway], gateway_successors[gateway])
+            hits += 1
+            continue
+        counted_gateways.append((gateway, signature))
 
-        for predecessor in predecessors:
-            # we check the suffixes for all eventually follows relations of the successors with the predecessor
-            # special handling: successor = end event --> for current encounter: we count traces where no other successor is in the trace (& no next encounter happens, but this is implicitly the case, as a next encounter can only happen if there is a task-successor in the trace)
-            gateway_path_frequencies = filter_log_count_successors(log, predecessor, successors, gateway_path_frequencies, start_events, gateway)
+        task_successors, end_successor = split_successors(gateway_successors[gateway])
+        task_successor_codes = [(successor, variant_index.activity_codes.get(successor.name)) for successor in task_successors]
+
+        for predecessor in gateway_predecessors[gateway]:
+            frequencies = gateway_path_frequencies[gateway][predecessor]
+            if isinstance(predecessor, pm4py.objects.bpmn.obj.BPMN.Task):
+                predecessor_code = variant_index.activity_codes.get(predecessor.name)
+                if predecessor_code is not None:
+                    countings.append((count_task_predecessor, frequencies, predecessor_code, task_successors, task_successor_codes, end_successor))
+
+            # frequency allocation if predecessor = start event always happens only once & we do not need to check suffixes but the whole variants of the log
+            elif isinstance(predecessor, pm4py.objects.bpmn.obj.BPMN.StartEvent):
+                # initialize dict frequencies for gateway encounter and every successor
+                encounter_frequencies = frequencies.setdefault(1, {})
+                for successor in gateway_successors[gateway]:
+                    encounter_frequencies.setdefault(successor, 0)
+                countings.append((count_start_predecessor, frequencies, task_successor_codes))
+
+    if countings:
+        for variant in range(variant_index.n_variants()):
+            for count, *arguments in countings:
+                count(variant_index, variant, *arguments)
+
+    for gateway, signature in counted_gateways:
+        if len(frequency_cache) >= FREQUENCY_CACHE_SIZE:
+            # the oldest signature goes first
+            del frequency_cache[next(iter(frequency_cache))]
+        frequency_cache[signature] = frequencies_to_cache(gateway_path_frequencies[gateway], gateway_predecessors[gateway], gateway_successors[gateway])
+
+    frequency_cache_statistics["hits"] += hits
+    frequency_cache_statistics["misses"] += len(counted_gateways)
+    print(f"Gateway frequency cache: {hits} hits, {len(counted_gateways)} misses ({frequency_cache_statistics['hits']} hits, {frequency_cache_statistics['misses']} misses in total)")
 
     return gateway_path_frequencies
 
@@ -341,12 +344,19 @@ def map_probabilities_to_arcs(gateway_probabilities, gateway_arc_successors, gat
     return gateway_arc_probabilities
 
 
-def get_gateway_probabilities(bpmn, log, new_activities):
+# frequencies of the successors of every gateway per predecessor and encounter in the log, with the gateways, predecessors and successors they refer to
+def get_gateway_path_frequencies(bpmn, log, new_activities):
+    graph = bpmn_graph.get_graph(bpmn)
+    is_new = graph.node_flags(new_activities)
     diverging_exclusive_gateways = get_diverging_exclusive_gateways(bpmn)
-    gateway_predecessors = get_predecessors_all_gateways(diverging_exclusive_gateways, new_activities)
-    gateway_arc_successors = get_successors_all_gateways(diverging_exclusive_gateways, new_activities)
+    gateway_predecessors = get_predecessors_all_gateways(graph, diverging_exclusive_gateways, is_new)
+    gateway_arc_successors = get_successors_all_gateways(graph, diverging_exclusive_gateways, is_new)
     start_events, gateway_path_frequencies, gateway_successors = prepare_successor_counting(log, diverging_exclusive_gateways, gateway_arc_successors, gateway_predecessors)
     gateway_path_frequencies = get_gateway_successor_frequencies(diverging_exclusive_gateways, log, gateway_predecessors, gateway_successors, start_events, gateway_path_frequencies)
+    return diverging_exclusive_gateways, gateway_predecessors, gateway_arc_successors, gateway_successors, gateway_path_frequencies
+
+def get_gateway_probabilities(bpmn, log, new_activities):
+    diverging_exclusive_gateways, gateway_predecessors, gateway_arc_successors, gateway_successors, gateway_path_frequencies = get_gateway_path_frequencies(bpmn, log, new_activities)
     gateway_probabilities = calculate_probabilities(diverging_exclusive_gateways, gateway_path_frequencies, gateway_predecessors, gateway_successors)
     gateway_arc_probabilities = map_probabilities_to_arcs(gateway_probabilities, gateway_arc_successors, gateway_predecessors)
     return gateway_arc_probabilities
\ No newline at end of file
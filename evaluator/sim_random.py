@@ -0,0 +1,93 @@
+import hashlib
+import numpy as np
+
+# uniform random numbers for the branch decisions, drawn from the generator in large blocks
+# a RandomState delivers the same numbers as with one draw per decision, so the legacy seed keeps its results
+class UniformBlocks:
+
+    def __init__(self, rng, block_size=4096):
+        self.rng = rng
+        self.block_size = block_size
+        self.block = []
+        self.position = 0
+
+    def next(self):
+        if self.position == len(self.block):
+            self.block = self.rng.random(self.block_size).tolist()
+            self.position = 0
+        uniform = self.block[self.position]
+        self.position += 1
+        return uniform
+
+    # the position of the decision is not needed for a plain stream
+    def draw(self, gateway, predecessor, encounter):
+        return self.next()
+
+# 64 bit hashing (splitmix64 finalizer) for counter-based uniforms
+MASK_64 = (1 << 64) - 1
+GOLDEN_64 = 0x9E3779B97F4A7C15
+
+def mix64(x):
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return x ^ (x >> 31)
+
+def mix64_array(x):
+    x = np.asarray(x, dtype=np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+# stable 64 bit key of a string (python's hash() changes between processes)
+def string_key(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+# common random numbers: the uniform of a branch decision only depends on (seed, case, decision context, encounter)
+# two models that share a decision context (same predecessor, same gateway signature) therefore take the same decisions in the same case
+# antithetic: the cases come in pairs, the second case of a pair uses 1 - u of the first one
+class CommonRandomNumbers:
+
+    def __init__(self, seed=42, antithetic=False):
+        self.seed = seed
+        self.antithetic = antithetic
+        self.next_case = 0
+
+    # reserve the ids of the next n cases, returns the id of the first one
+    def start_cases(self, n_cases):
+        first_case = self.next_case
+        self.next_case += n_cases
+        return first_case
+
+    # uniforms of many decisions at once (cases, context keys, encounters as arrays)
+    def uniforms(self, cases, contexts, encounters):
+        cases = np.asarray(cases, dtype=np.uint64)
+        streams = cases // np.uint64(2) if self.antithetic else cases
+        x = mix64_array(np.uint64(self.seed % 2 ** 64) + streams * np.uint64(GOLDEN_64))
+        x = mix64_array(x ^ np.asarray(contexts, dtype=np.uint64))
+        x = mix64_array(x + np.asarray(encounters, dtype=np.uint64) * np.uint64(GOLDEN_64))
+        # midpoints of 2^53 cells, so that u and 1 - u are both strictly inside (0, 1)
+        uniforms = ((x >> np.uint64(11)).astype(np.float64) + 0.5) * 2.0 ** -53
+        if self.antithetic:
+            uniforms = np.where(cases % np.uint64(2) == 1, 1 - uniforms, uniforms)
+        return uniforms
+
+    def uniform(self, case, context, encounter):
+        stream = case // 2 if self.antithetic else case
+        x = mix64((self.seed + stream * GOLDEN_64) & MASK_64)
+        x = mix64(x ^ context)
+        x = mix64((x + encounter * GOLDEN_64) & MASK_64)
+        uniform = ((x >> 11) + 0.5) * 2.0 ** -53
+        if self.antithetic and case % 2 == 1:
+            uniform = 1 - uniform
+        return uniform
+
+# common random numbers of one case in the simpy simulation (same interface as UniformBlocks)
+class CaseCommonRandom:
+
+    def __init__(self, common_random, case, decision_keys):
+        self.common_random = common_random
+        self.case = case
+        self.decision_keys = decision_keys
+
+    def draw(self, gateway, predecessor, encounter):
+        return self.common_random.uniform(self.case, self.decision_keys[gateway] ^ mix64(self.decision_keys[predecessor]), encounter)
@@ -0,0 +1,117 @@
+import copy
+import itertools
+import numpy as np
+import pandas as pd
+
+from evaluator import evaluator_simulation, sim_probabilities, sim_durations, sim_plan, sim_batch, sim_aggregate, sim_random
+
+# what-if scenarios of one prepared model: {"name": ..., "durations": {activity: factor}, "branches": {target: factor}}
+# durations: the duration of the activity is multiplied by the factor
+# branches: the probability of every gateway arc that leads to the target (task name or gateway id) is multiplied by the factor, the rest of the row is renormalized
+
+def scenario_name(scenario):
+    parts = [f"{activity} x{factor}" for activity, factor in scenario.get("durations", {}).items() if factor != 1]
+    parts += [f"branch {target} x{factor}" for target, factor in scenario.get("branches", {}).items() if factor != 1]
+    return ", ".join(parts) if parts else "baseline"
+
+# all combinations of the given scalings as scenarios, e.g. scenario_grid({"Send Fine": [1, 0.8]}, {"Payment": [1, 0.5]}) --> 4 scenarios
+def scenario_grid(duration_scalings=None, branch_scalings=None):
+    axes = [("durations", activity, factors) for activity, factors in (duration_scalings or {}).items()]
+    axes += [("branches", target, factors) for target, factors in (branch_scalings or {}).items()]
+
+    scenarios = []
+    for combination in itertools.product(*[factors for _, _, factors in axes]):
+        scenario = {"durations": {}, "branches": {}}
+        for (scaling, key, _), factor in zip(axes, combination):
+            scenario[scaling][key] = factor
+        scenario["name"] = scenario_name(scenario)
+        scenarios.append(scenario)
+    return scenarios
+
+# cumulative rows with the arc probabilities multiplied by the factors (rows without probability left keep the original row)
+def scaled_cumulative(cumulative_table, arc_factors):
+    probabilities = np.diff(cumulative_table, axis=1, prepend=0.0) * arc_factors
+    totals = probabilities.sum(axis=1, keepdims=True)
+    scaled = np.cumsum(probabilities, axis=1) / np.where(totals > 0, totals, 1.0)
+    return np.where(totals > 0, scaled, cumulative_table)
+
+# sweep plan: the compiled plan plus one duration row and one probability table per scenario (see sim_batch.simulate_batch)
+# the artificial fallback rows of unknown contexts stay uniform in every scenario
+def compile_scenarios(plan, scenarios):
+    names = plan["names"]
+    labels = plan["labels"]
+    successors = plan["successors"]
+    n_nodes = len(plan["kind"])
+
+    duration_table = np.tile(plan["duration"], (len(scenarios), 1))
+    cumulative_tables = np.tile(plan["cumulative_table"], (len(scenarios), 1, 1))
+    row_successors = successors[plan["probability_keys"] // ((plan["max_encounter"] + 1) * n_nodes)]
+
+    for index, scenario in enumerate(scenarios):
+        for activity, factor in scenario.get("durations", {}).items():
+            matching = names == activity
+            if not matching.any():
+                raise ValueError(f"Activity '{activity}' of scenario '{scenario_name(scenario)}' is not in the model")
+            duration_table[index, matching] *= factor
+
+        if scenario.get("branches"):
+            arc_factors = np.ones(row_successors.shape, dtype=np.float64)
+            for target, factor in scenario["branches"].items():
+                targets = labels == target
+                if not targets.any():
+                    raise ValueError(f"Branch target '{target}' of scenario '{scenario_name(scenario)}' is not in the model")
+                arc_factors *= np.where((row_successors >= 0) & targets[row_successors], factor, 1.0)
+            cumulative_tables[index] = scaled_cumulative(plan["cumulative_table"], arc_factors)
+
+    return {**plan, "scenario_duration": duration_table, "scenario_cumulative": cumulative_tables}
+
+# durations of a scenario for the adjusted duration (first row per activity is scaled like in the plan)
+def scenario_durations_df(sim_durations_df, scenario):
+    scaled_df = sim_durations_df.copy()
+    factors = scaled_df["activity"].map(scenario.get("durations", {})).fillna(1.0)
+    scaled_df["weighted_significant_duration"] = scaled_df["weighted_significant_duration"] * factors
+    return scaled_df
+
+# evaluate all scenarios of one prepared model (probabilities, new activities and sim_durations_df as for the simulation engines)
+# the model is compiled once and the scenarios are simulated together in batches of up to max_batch_cases cases,
+# case i of every scenario takes the same uniforms (common random numbers), so the differences between scenarios have little noise
+# kpis: kpi accumulators (e.g. kpi_accumulators.CostKPI), one column with the mean per kpi
+def run_scenario_sweep(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, scenarios, n_runs=10000, seed=42, kpis=(), max_batch_cases=500000):
+    if not scenarios:
+        raise ValueError("No scenarios given")
+
+    plan = compile_scenarios(sim_plan.compile_plan(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df), scenarios)
+    # every scenario gets its own copy of the kpis (they keep the durations of their run, see kpi_accumulators.DurationKPI.start)
+    aggregators = [sim_aggregate.VariantAggregator(scenario_durations_df(sim_durations_df, scenario), kpis=copy.deepcopy(kpis)) for scenario in scenarios]
+
+    chunk = max(1, max_batch_cases // n_runs)
+    for first in range(0, len(scenarios), chunk):
+        last = min(first + chunk, len(scenarios))
+        chunk_plan = {**plan, "scenario_duration": plan["scenario_duration"][first:last], "scenario_cumulative": plan["scenario_cumulative"][first:last]}
+        # a new stream per batch starts again at case 0, so that all batches take the same uniforms
+        durations, traces = sim_batch.simulate_batch(chunk_plan, n_runs, None, common_random=sim_random.CommonRandomNumbers(seed), scenarios=last - first)
+        for position, aggregator in enumerate(aggregators[first:last]):
+            aggregator.add_batch(durations[position * n_runs:(position + 1) * n_runs], traces[position * n_runs:(position + 1) * n_runs])
+        print(f"Simulated scenarios {first + 1}-{last} of {len(scenarios)}")
+
+    # tidy table: one row per scenario, the time saved is relative to the first scenario
+    scenario_results_df = pd.DataFrame({
+        "Scenario": [scenario.get("name") or scenario_name(scenario) for scenario in scenarios],
+        "Duration": [aggregator.mean_duration() for aggregator in aggregators],
+        "Adj. Duration": [aggregator.adjusted_mean_duration() for aggregator in aggregators],
+    })
+    for kpi in kpis:
+        scenario_results_df[kpi.column] = [aggregator.kpi_means()[kpi.column] for aggregator in aggregators]
+    scenario_results_df["Time Saved"] = (scenario_results_df["Duration"].iloc[0] - scenario_results_df["Duration"]) / scenario_results_df["Duration"].iloc[0]
+    scenario_results_df.attrs["simulation_info"] = {"engine": "batch", "replications": n_runs, "scenarios": len(scenarios), "seed": seed}
+
+    return scenario_results_df
+
+# prepare the model once (probabilities from the log, durations) and evaluate all scenarios
+def get_scenario_results(bpmn, log, log_activities, significant_durations_df, sim_durations_df, scenarios, n_runs=10000, seed=42, kpis=()):
+    new_activities = evaluator_simulation.get_new_activities(bpmn, log_activities)
+    gateway_arc_probabilities = sim_probabilities.get_gateway_probabilities(bpmn, log, new_activities)
+    sim_durations_df, unknown_durations_estimates = sim_durations.get_sim_durations(bpmn, significant_durations_df, sim_durations_df)
+
+    scenario_results_df = run_scenario_sweep(bpmn, gateway_arc_probabilities, new_activities, sim_durations_df, scenarios, n_runs=n_runs, seed=seed, kpis=kpis)
+    return scenario_results_df, unknown_durations_estimates, sim_durations_df
@@ -0,0 +1,89 @@
+import json
+import numpy as np
+
+# structured tracing of the simulation: counters for all cases and chrome trace events (chrome://tracing, ui.perfetto.dev) for a sampled subset
+# the simulations only call the tracer if one is given, without a tracer nothing is recorded
+class SimulationTracer:
+
+    # sample_every: every n-th case is traced, max_traced_cases: upper bound of traced cases, time_scale: trace microseconds per simulated time unit
+    def __init__(self, sample_every=100, max_traced_cases=100, time_scale=1000000):
+        self.sample_every = sample_every
+        self.max_traced_cases = max_traced_cases
+        self.time_scale = time_scale
+        self.trace_events = []
+        self.traced_cases = 0
+        self.counters = {"cases": 0, "events": 0, "max_events_per_case": 0, "gateway_decisions": 0, "artificial_fallbacks": 0}
+        self.next_case = 0
+
+    # reserve the ids of the next n cases, returns the id of the first one
+    def start_cases(self, n_cases):
+        first_case = self.next_case
+        self.next_case += n_cases
+        return first_case
+
+    def samples(self, case):
+        if case % self.sample_every != 0 or self.traced_cases >= self.max_traced_cases:
+            return False
+        self.traced_cases += 1
+        return True
+
+    # ids of the sampled cases of a batch starting at first_case
+    def sample_batch(self, first_case, n_cases):
+        cases = np.arange(first_case, first_case + n_cases)
+        sampled = cases[cases % self.sample_every == 0][:max(0, self.max_traced_cases - self.traced_cases)]
+        self.traced_cases += len(sampled)
+        return sampled
+
+    # counters of finished cases (number of events per case)
+    def count_cases(self, events_per_case):
+        events_per_case = np.asarray(events_per_case)
+        if len(events_per_case) == 0:
+            return
+        self.counters["cases"] += len(events_per_case)
+        self.counters["events"] += int(events_per_case.sum())
+        self.counters["max_events_per_case"] = max(self.counters["max_events_per_case"], int(events_per_case.max()))
+
+    def count_decisions(self, decisions, artificial_fallbacks):
+        self.counters["gateway_decisions"] += int(decisions)
+        self.counters["artificial_fallbacks"] += int(artificial_fallbacks)
+
+    # task of a traced case as complete event
+    def task(self, case, name, start, end):
+        self.trace_events.append({
+            "name": name,
+            "cat": "task",
+            "ph": "X",
+            "ts": start * self.time_scale,
+            "dur": (end - start) * self.time_scale,
+            "pid": 1,
+            "tid": int(case),
+        })
+
+    # branch decision of a traced case as instant event
+    def decision(self, case, gateway, time, predecessor, encounter, arc, target, artificial):
+        self.trace_events.append({
+            "name": gateway,
+            "cat": "gateway",
+            "ph": "i",
+            "s": "t",
+            "ts": time * self.time_scale,
+            "pid": 1,
+            "tid": int(case),
+            "args": {"predecessor": predecessor, "encounter": int(encounter), "arc": int(arc), "target": target, "artificial": bool(artificial)},
+        })
+
+    def summary(self):
+        summary = dict(self.counters)
+        summary["events_per_case"] = self.counters["events"] / self.counters["cases"] if self.counters["cases"] else 0.0
+        summary["traced_cases"] = self.traced_cases
+        return summary
+
+    # write the trace events as chrome trace json, the counters travel in the metadata
+    def write(self, path):
+        trace = {
+            "traceEvents": [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "simulation"}}] + self.trace_events,
+            "displayTimeUnit": "ms",
+            "otherData": self.summary(),
+        }
+        with open(path, "w") as file:
+            json.dump(trace, file)
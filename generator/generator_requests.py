@@ -6,7 +6,8 @@ from openai import AzureOpenAI
 from config import AZURE_OPENAI_API_KEY, AZURE_OPENAI_API_VERSION, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_MODEL, AZURE_OPENAI_REASONING_EFFORT
 
 
-def OpenAI_Call_Improvement(system_prompt: str, user_prompt: str):
+# reasoning_effort: overrides the configured reasoning effort (e.g. chosen by a latency budget)
+def OpenAI_Call_Improvement(system_prompt: str, user_prompt: str, reasoning_effort: Union[str, None] = None):
 
     # define the client
     client = AzureOpenAI(
@@ -22,7 +23,7 @@ def OpenAI_Call_Improvement(system_prompt: str, user_prompt: str):
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
-        reasoning_effort=AZURE_OPENAI_REASONING_EFFORT,
+        reasoning_effort=reasoning_effort or AZURE_OPENAI_REASONING_EFFORT,
         response_format={"type": "json_object"},
     )
 
@@ -80,11 +80,12 @@ def execute_code(code, output_path):
     return improved_bpmn
 
 
-def improve_process(input_bpmn, goal, output_path):
+# reasoning_effort: reasoning effort of the improvement call (None: as configured)
+def improve_process(input_bpmn, goal, output_path, reasoning_effort=None):
 
     system_prompt, user_prompt = create_prompts(goal, input_bpmn)
 
-    response_raw = generator_requests.OpenAI_Call_Improvement(system_prompt, user_prompt)
+    response_raw = generator_requests.OpenAI_Call_Improvement(system_prompt, user_prompt, reasoning_effort=reasoning_effort)
 
     try:
         response_json = json.loads(response_raw)
@@ -1,175 +1,173 @@
 import os
 import pandas as pd
-import pm4py
 import numpy as np
 
+from preparer import log_cache, log_encoding, log_update, xes_stream
+
 ### general preparation for the evaluation
 
-def load_vars_paths_durs(vars_paths_durs_path, log):
-    # check if the file exists first
-    if not os.path.exists(vars_paths_durs_path):
-        # get the dataframe with the variables, paths and durations
-        dataframe = pm4py.format_dataframe(log)
-        vars_paths_durs = pm4py.get_variants_paths_duration(dataframe)
-        vars_paths_durs.to_csv(vars_paths_durs_path, index=False)
+def get_unique_combinations(vars_paths_durs):
+    # get all unique combinations of activities and their global mean durations -> calculate using the variants_paths_duration
 
-    # load existing file
-    vars_paths_durs = pd.read_csv(vars_paths_durs_path, sep=',')
-    return vars_paths_durs
+    # make a df with every unique combination of concept:name and concept_name_2
+    unique_combinations = vars_paths_durs[['concept:name', 'concept:name_2']].drop_duplicates().reset_index(drop=True)
 
+    # group number of every row = position of its combination in unique_combinations (groups numbered in order of appearance)
+    combination_ids = vars_paths_durs.groupby(['concept:name', 'concept:name_2'], sort=False).ngroup().to_numpy()
 
-def load_unique_combinations(unique_combinations_path, vars_paths_durs):
-    # get all unique combinations of activities and their global mean durations -> calculate using the variants_paths_duration
-    # check if the file exists first
-    if not os.path.exists(unique_combinations_path):
-
-        # make a df with every unique combination of concept:name and concept_name_2
-        unique_combinations = vars_paths_durs[['concept:name', 'concept:name_2']].drop_duplicates()
-
-        # for every unique combination in unique_combinations: iterate through all of them in df and multiply the value in the column '@@flow_time' with the value in the column '@@variant_count'
-        for index, row in unique_combinations.iterrows():
-            weight = 0
-            acc_time = 0
-            # get the concept:name and concept_name_2
-            concept_name = row['concept:name']
-            concept_name_2 = row['concept:name_2']
-            # get the indices where the concept:name and concept_name_2 are equal to the current concept_name and concept_name_2
-            indices = vars_paths_durs.index[(vars_paths_durs['concept:name'] == concept_name) & (vars_paths_durs['concept:name_2'] == concept_name_2)].tolist()
-            # multiply the value in the column '@@flow_time' with the value in the column '@@variant_count' for every index in indices
-            for i in indices:
-                acc_time_position_current_case = vars_paths_durs.at[i, '@@flow_time'] * vars_paths_durs.at[i, '@@variant_count']
-                acc_time = acc_time + acc_time_position_current_case
-                weight = weight + vars_paths_durs.at[i, '@@variant_count']
-            mean_time_position_over_all_cases = acc_time / weight
-            unique_combinations.at[index, 'mean_time_position_over_all_cases'] = mean_time_position_over_all_cases
-            unique_combinations.at[index, 'frequency'] = weight
-
-        # save unique combinations to a csv file
-        unique_combinations.to_csv(unique_combinations_path, index=False)
-
-    # load existing file
-    unique_combinations = pd.read_csv(unique_combinations_path, sep=',')
+    # mean of '@@flow_time' weighted with '@@variant_count' per combination
+    # bincount adds the rows of a combination in row order, so the sums are the same as adding them one by one
+    variant_counts = vars_paths_durs['@@variant_count'].to_numpy(dtype=np.float64)
+    acc_time = np.bincount(combination_ids, weights=vars_paths_durs['@@flow_time'].to_numpy(dtype=np.float64) * variant_counts, minlength=len(unique_combinations))
+    weight = np.bincount(combination_ids, weights=variant_counts, minlength=len(unique_combinations))
+    unique_combinations['mean_time_position_over_all_cases'] = acc_time / weight
+    unique_combinations['frequency'] = weight
     return unique_combinations
     
     
-def get_log_statistics(log, vars_paths_durs_path, unique_combinations_path):
-    vars_paths_durs = load_vars_paths_durs(vars_paths_durs_path, log)
-    unique_combinations = load_unique_combinations(unique_combinations_path, vars_paths_durs)
-    return vars_paths_durs, unique_combinations
-    
-
 ### preparation for the simulation
 
-def create_durations_matrix(log_activities, unique_combinations):
-    # get durations from unique_combinations and put them in a matrix, thereby row from durations_matrix = source, column from durations_matrix = target
-    durations_matrix = pd.DataFrame(columns=log_activities, index=log_activities)
-    for index, row in unique_combinations.iterrows():
-        source = row["concept:name"]
-        target = row["concept:name_2"]
-        duration = row["mean_time_position_over_all_cases"]
-        durations_matrix.at[source, target] = duration
+# activity codes: position of the activity in the matrices (log activities first, then activities that only occur in unique_combinations)
+# returns the activities in code order and the codes of the sources and targets of unique_combinations
+def encode_activities(log_activities, unique_combinations):
+    activities = list(log_activities)
+    sources = unique_combinations["concept:name"].tolist()
+    targets = unique_combinations["concept:name_2"].tolist()
+    activity_codes = {activity: code for code, activity in enumerate(activities)}
+    for activity in sources + targets:
+        if activity not in activity_codes:
+            activity_codes[activity] = len(activities)
+            activities.append(activity)
+    source_codes = np.array([activity_codes[activity] for activity in sources], dtype=np.int64)
+    target_codes = np.array([activity_codes[activity] for activity in targets], dtype=np.int64)
+    return activities, source_codes, target_codes
+
+
+def create_durations_matrix(n_activities, source_codes, target_codes, unique_combinations):
+    # get durations from unique_combinations and put them in a matrix, thereby row from durations_matrix = source, column from durations_matrix = target (NaN = no sequence flow)
+    durations_matrix = np.full((n_activities, n_activities), np.nan)
+    durations_matrix[source_codes, target_codes] = unique_combinations["mean_time_position_over_all_cases"].to_numpy(dtype=np.float64)
     return durations_matrix
 
 
-def create_frequency_matrix(log_activities, unique_combinations):
-    frequency_matrix = pd.DataFrame(columns=log_activities, index=log_activities)
-    for index, row in unique_combinations.iterrows():
-        source = row["concept:name"]
-        target = row["concept:name_2"]
-        frequency = row["frequency"]
-        frequency_matrix.at[source, target] = frequency
-    # fill NaN values with 0 (NaN = no occurrences)
-    frequency_matrix = frequency_matrix.fillna(0)
+def create_frequency_matrix(n_activities, source_codes, target_codes, unique_combinations):
+    # 0 = no occurrences
+    frequency_matrix = np.zeros((n_activities, n_activities))
+    frequency_matrix[source_codes, target_codes] = unique_combinations["frequency"].to_numpy(dtype=np.float64)
     return frequency_matrix
 
 
-def create_significance_matrix(log_activities, frequency_matrix, output_path):
+def create_significance_matrix(frequency_matrix):
     # calculate the significance of every sequence flow using their frequency
-    significance_matrix = pd.DataFrame(columns=log_activities, index=log_activities)
-
-    for index, row in frequency_matrix.iterrows(): # index is row name, row is row data
-        for column in frequency_matrix.columns:
-            if not index == column:
-                # calculate the significance for different activities in source and target
-                frequency_source_target = abs(frequency_matrix.at[index, column])
-                frequency_target_source = abs(frequency_matrix.at[column, index])
-                significance = (frequency_source_target - frequency_target_source) / ((frequency_source_target + frequency_target_source) + 1)
-                significance_matrix.at[index, column] = significance
-            elif index == column:
-                # calculate the significance for the same activity in source and target
-                frequency_source_source = abs(frequency_matrix.at[index, column])
-                significance = frequency_source_source/(frequency_source_source + 1)
-                significance_matrix.at[index, column] = significance  
-    # save the significance matrix as a csv file in the temp folder
-    significance_matrix_path = os.path.join(output_path, "significance_matrix.csv")
-    significance_matrix.to_csv(significance_matrix_path, index=False)
+    # different activities in source and target: (source->target - target->source) / (source->target + target->source + 1)
+    frequency_matrix = np.abs(frequency_matrix)
+    significance_matrix = (frequency_matrix - frequency_matrix.T) / ((frequency_matrix + frequency_matrix.T) + 1)
+    # same activity in source and target: source->source / (source->source + 1)
+    self_frequencies = np.diagonal(frequency_matrix)
+    np.fill_diagonal(significance_matrix, self_frequencies / (self_frequencies + 1))
     return significance_matrix
 
 
-def create_significant_durations_df(significance_matrix, durations_matrix, frequency_matrix):
+def create_significant_durations_df(activities, significance_matrix, durations_matrix, frequency_matrix):
 
     # set the threshold for significance
     threshold = 0.7
 
-    # Calculate the weighted significant duration for each activity using the sequence flows with a significance above the threshold
-    weighted_significant_duration_df = pd.DataFrame(columns=["activity", "weighted_significant_duration"])
-
-    for index, column in enumerate(significance_matrix.columns):
-        # get the targets of all significant sequence flows (smaller than -0.7 or bigger than 0.7) for which a duration exists
-        significant_sequence_flows = significance_matrix[column][(significance_matrix[column].abs() > threshold) & durations_matrix[column].notna()]
-        # if there are significant sequence flows, calculate the weighted significant duration
-        if not significant_sequence_flows.empty:
-            numerator = sum([durations_matrix.at[row, column]*frequency_matrix.at[row, column] for row in significant_sequence_flows.index])
-        # if there are no significant sequence flows, the weighted significant duration is NaN --> therefore the weighted significant duration is NaN
-        else:
-            numerator = np.nan
-
-        denominator = frequency_matrix[column].sum()
-        if denominator == 0:
-            weighted_significant_duration = np.nan
-        else:
-            weighted_significant_duration = numerator/denominator
-
-        weighted_significant_duration_df = pd.concat([weighted_significant_duration_df, pd.DataFrame({"activity": column, "weighted_significant_duration": weighted_significant_duration}, index=[0])], ignore_index=True)
-
-        weighted_significant_duration_df_h = weighted_significant_duration_df.copy()
-        weighted_significant_duration_df_h["weighted_significant_duration"] = (
-            pd.to_numeric(
-                weighted_significant_duration_df_h["weighted_significant_duration"],
-                errors="coerce",
-            ) / 3600
-        ).round(2)
+    # Calculate the weighted significant duration for each activity (column = target) using the sequence flows with a significance above the threshold
+    # (smaller than -0.7 or bigger than 0.7) for which a duration exists
+    significant = (np.abs(significance_matrix) > threshold) & ~np.isnan(durations_matrix)
+    # cumulative sums add the rows one by one in row order (same sums as adding the sequence flows in a loop)
+    numerator = np.cumsum(np.where(significant, durations_matrix * frequency_matrix, 0.0), axis=0)[-1]
+    denominator = np.cumsum(frequency_matrix, axis=0)[-1]
+
+    # if there are no significant sequence flows or no occurrences, the weighted significant duration is NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weighted_significant_duration = np.where(significant.any(axis=0) & (denominator != 0), numerator / denominator, np.nan)
+
+    weighted_significant_duration_df_h = pd.DataFrame({"activity": pd.Series(activities, dtype=object), "weighted_significant_duration": weighted_significant_duration})
+    weighted_significant_duration_df_h["weighted_significant_duration"] = (weighted_significant_duration_df_h["weighted_significant_duration"] / 3600).round(2)
 
     return weighted_significant_duration_df_h
 
 
-def get_significant_durations_matrix(log_activities, unique_combinations, output_path):
-    durations_matrix = create_durations_matrix(log_activities, unique_combinations)
-    frequency_matrix = create_frequency_matrix(log_activities, unique_combinations)
-    significance_matrix = create_significance_matrix(log_activities, frequency_matrix, output_path)
-    significant_durations_matrix = create_significant_durations_df(significance_matrix, durations_matrix, frequency_matrix)
-    return significant_durations_matrix
+# returns the significance matrix (one column per activity) and the significant durations
+def get_significant_durations_matrix(log_activities, unique_combinations):
+    activities, source_codes, target_codes = encode_activities(log_activities, unique_combinations)
+    durations_matrix = create_durations_matrix(len(activities), source_codes, target_codes, unique_combinations)
+    frequency_matrix = create_frequency_matrix(len(activities), source_codes, target_codes, unique_combinations)
+    significance_matrix = create_significance_matrix(frequency_matrix)
+    significant_durations_matrix = create_significant_durations_df(activities, significance_matrix, durations_matrix, frequency_matrix)
+    return pd.DataFrame(significance_matrix, columns=activities), significant_durations_matrix
+
+# activities, variants and the tables for the evaluation from the statistics of a log (see xes_stream.read_log_statistics)
+def prepare_statistics(log_statistics):
+    log_activities = xes_stream.get_log_activities(log_statistics)
+    vars_path_durs = xes_stream.get_vars_paths_durs(log_statistics)
+    unique_combinations = get_unique_combinations(vars_path_durs)
+    significance_matrix, significant_durations_df = get_significant_durations_matrix(log_activities, unique_combinations)
+    return log_activities, vars_path_durs, unique_combinations, significance_matrix, significant_durations_df
+
+def store_prepared_log(entry_path, log, log_activities, vars_path_durs, unique_combinations, significance_matrix, significant_durations_df):
+    log_cache.store_tables(entry_path, {
+        **log.to_tables(),
+        "log_activities": pd.DataFrame({"activity": list(log_activities), "count": list(log_activities.values())}),
+        "vars_paths_durs": vars_path_durs,
+        "unique_combinations": unique_combinations,
+        "significance_matrix": significance_matrix,
+        "significant_durations": significant_durations_df,
+    })
+
+# cache_dir: directory of the prepared logs (see log_cache, default: .log_cache next to the log)
+# the returned log is the compact log_encoding.EncodedLog that all evaluator stages work on
+def prepare_log(log_path, output_path, cache_dir=None):
+
+    # the encoded log and the statistics are cached under the content hash of the log
+    entry_path = log_cache.cache_path(log_path, cache_dir)
+    tables = log_cache.load_tables(entry_path)
+
+    if tables is None:
+        # activities, variants and their mean durations in one streaming pass over the xes file, the encoded log is built in the same pass
+        log_builder = log_encoding.EncodedLogBuilder()
+        log_statistics = xes_stream.read_log_statistics(log_path, log_builder)
+        log = log_builder.encoded_log()
+        print(f"Read {log_statistics['cases']} cases with {log_statistics['events']} events and {len(log_statistics['variants'])} variants")
+
+        # get data needed for evaluation
+        log_activities, vars_path_durs, unique_combinations, significance_matrix, significant_durations_df = prepare_statistics(log_statistics)
+        store_prepared_log(entry_path, log, log_activities, vars_path_durs, unique_combinations, significance_matrix, significant_durations_df)
+    else:
+        print(f"Loading prepared log from cache {entry_path}")
+        log = log_encoding.from_tables(tables)
+        log_activities = dict(zip(tables["log_activities"]["activity"].tolist(), tables["log_activities"]["count"].tolist()))
+        vars_path_durs = tables["vars_paths_durs"]
+        unique_combinations = tables["unique_combinations"]
+        significance_matrix = tables["significance_matrix"]
+        significant_durations_df = tables["significant_durations"]
+        significant_durations_df["activity"] = significant_durations_df["activity"].astype(object)
+
+    # save the significance matrix as a csv file in the run folder
+    significance_matrix.to_csv(os.path.join(output_path, "significance_matrix.csv"), index=False)
+
+    return log, log_activities, vars_path_durs, unique_combinations, significant_durations_df
 
-# main function to prepare the evaluation
-def prepare_evaluation(log, vars_paths_durs_path, unique_combinations_path, log_activities, output_path):
-    vars_path_durs, unique_combinations = get_log_statistics(log, vars_paths_durs_path, unique_combinations_path)
-    significant_durations_matrix = get_significant_durations_matrix(log_activities, unique_combinations, output_path)
-    return vars_path_durs, unique_combinations, significant_durations_matrix
+# update a prepared log (the results of prepare_log) with the new or changed cases of update_log_path (an xes file with only these cases, changed cases complete)
+# the historical log is not read again: its statistics come from the prepared tables, the previous versions of changed cases from the encoded log
+# log_path: the complete new log (e.g. the next nightly export), the updated log is cached under its content hash, so prepare_log finds it
+def update_prepared_log(prepared_log, update_log_path, output_path, log_path=None, cache_dir=None):
+    log, log_activities, vars_path_durs, unique_combinations, _ = prepared_log
 
-def prepare_log(log_path, output_path):
+    log_builder = log_encoding.EncodedLogBuilder()
+    for case_id, activities, timestamps in xes_stream.iter_traces(update_log_path):
+        log_builder.add_trace(case_id, activities, timestamps)
 
-    # paths to files needed for the evaluation --> they will be saved in the same directory as the log file
-    log_name = os.path.splitext(os.path.basename(log_path))[0] # name of the bpmn input file (before the file extension)
-    # define path for vars_paths_durs file --> same directory as the log file
-    vars_paths_durs_path = os.path.join(os.path.dirname(log_path), f'{log_name}_vars_paths_durs.csv')
-    # define path for unique_combinations file --> same directory as the log file
-    unique_combinations_path = os.path.join(os.path.dirname(log_path), f'{log_name}_unique_combinations.csv')
+    log_statistics = log_update.prepared_log_statistics(log, log_activities, vars_path_durs, unique_combinations)
+    log, log_statistics = log_update.update_log_statistics(log_statistics, log, log_builder.encoded_log())
 
-    # read the log and get the activities
-    log = pm4py.read_xes(log_path)
-    log_activities = pm4py.get_event_attribute_values(log, "concept:name")
+    log_activities, vars_path_durs, unique_combinations, significance_matrix, significant_durations_df = prepare_statistics(log_statistics)
+    if log_path is not None:
+        store_prepared_log(log_cache.cache_path(log_path, cache_dir), log, log_activities, vars_path_durs, unique_combinations, significance_matrix, significant_durations_df)
 
-    # get data needed for evaluation
-    vars_path_durs, unique_combinations, significant_durations_df = prepare_evaluation(log, vars_paths_durs_path, unique_combinations_path, log_activities, output_path)
+    # save the significance matrix as a csv file in the run folder
+    significance_matrix.to_csv(os.path.join(output_path, "significance_matrix.csv"), index=False)
 
     return log, log_activities, vars_path_durs, unique_combinations, significant_durations_df
@@ -0,0 +1,50 @@
+import hashlib
+import os
+import shutil
+import uuid
+import pandas as pd
+import pyarrow
+
+from preparer import log_encoding
+
+# version of the cached tables, a new version never reads the entries of an old one
+CACHE_VERSION = 2
+
+# tables of a prepared log (the encoded log and the statistics), one parquet file each
+CACHED_TABLES = log_encoding.ENCODED_TABLES + ["log_activities", "vars_paths_durs", "unique_combinations", "significance_matrix", "significant_durations"]
+
+# sha256 of the log file, read in chunks
+def file_hash(path, chunk_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+# cache entry of a log: keyed by the content of the file, so a changed log gets a new entry and a renamed or copied log finds its old one
+# without cache_dir the entries are kept in .log_cache next to the log
+def cache_path(log_path, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(log_path)), ".log_cache")
+    return os.path.join(cache_dir, f"v{CACHE_VERSION}-{file_hash(log_path)}")
+
+# tables of a cache entry, None if the log is not cached yet
+def load_tables(entry_path):
+    if not os.path.isdir(entry_path):
+        return None
+    return {table: pd.read_parquet(os.path.join(entry_path, table + ".parquet")) for table in CACHED_TABLES}
+
+# write the tables into a temporary directory and rename it to the entry: readers see either no entry or a complete one
+# if another session stored the same log in the meantime, its entry is kept
+# the cache is only an optimisation: a cache directory that cannot be written (read-only, no permission) is reported, never raised
+def store_tables(entry_path, tables):
+    temporary_path = f"{entry_path}.tmp-{uuid.uuid4().hex}"
+    try:
+        os.makedirs(temporary_path)
+        for table in CACHED_TABLES:
+            tables[table].to_parquet(os.path.join(temporary_path, table + ".parquet"), index=False)
+        os.rename(temporary_path, entry_path)
+    except (OSError, ValueError, TypeError, pyarrow.ArrowException) as error:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        if not os.path.isdir(entry_path):
+            print(f"Prepared log could not be cached ({error})")
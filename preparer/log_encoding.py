@@ -0,0 +1,284 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from array import array
+from bisect import bisect_right
+
+### compact event log, built once in prepare_log and used by every evaluator stage
+### activities as small integer codes, timestamps as int64 microseconds since the epoch, the events of a case as a slice of the event arrays
+### and a variant table (activity codes and number of cases per variant), so the stages need no groupby or string comparison over the events
+
+# tables of an encoded log in the log cache
+ENCODED_TABLES = ["log_activity_names", "log_events", "log_cases", "log_variants", "log_variant_events"]
+
+class EncodedLog:
+
+    def __init__(self, activities, case_ids, activity_codes, timestamps, case_offsets, case_variants, variant_codes, variant_offsets, variant_counts):
+        # activity name per code and case id per case
+        self.activities = list(activities)
+        self.case_ids = list(case_ids)
+        # per event (the events of a case one after another, ordered by timestamp): activity code, microseconds since the epoch
+        self.activity_codes = activity_codes
+        self.timestamps = timestamps
+        # events of case i: case_offsets[i]:case_offsets[i + 1]
+        self.case_offsets = case_offsets
+        # variant per case (variants numbered in order of their first case)
+        self.case_variants = case_variants
+        # activity codes of variant v: variant_codes[variant_offsets[v]:variant_offsets[v + 1]], cases per variant
+        self.variant_codes = variant_codes
+        self.variant_offsets = variant_offsets
+        self.variant_counts = variant_counts
+        # VariantIndex, built on first use
+        self.cached_variant_index = None
+
+    # number of events, as len of the log dataframe
+    def __len__(self):
+        return len(self.activity_codes)
+
+    def n_cases(self):
+        return len(self.case_ids)
+
+    def n_variants(self):
+        return len(self.variant_counts)
+
+    # code of every activity name (names that are not in the log are missing)
+    def activity_code_map(self):
+        return {activity: code for code, activity in enumerate(self.activities)}
+
+    def variant_activities(self, variant):
+        return tuple(self.activities[code] for code in self.variant_codes[self.variant_offsets[variant]:self.variant_offsets[variant + 1]].tolist())
+
+    # activities and timestamps of a case
+    def case_trace(self, case):
+        events = slice(self.case_offsets[case], self.case_offsets[case + 1])
+        return [self.activities[code] for code in self.activity_codes[events].tolist()], self.timestamps[events]
+
+    # positions of every activity in every variant (see VariantIndex), built once per log
+    def variant_index(self):
+        if self.cached_variant_index is None:
+            self.cached_variant_index = VariantIndex(self)
+        return self.cached_variant_index
+
+    # hours between the first and the last event of every case, only the events in event_mask count (nan for cases without such events)
+    def case_durations(self, event_mask=None):
+        case_of_event = np.repeat(np.arange(self.n_cases()), np.diff(self.case_offsets))
+        timestamps = self.timestamps
+        if event_mask is not None:
+            case_of_event = case_of_event[event_mask]
+            timestamps = timestamps[event_mask]
+        first = np.full(self.n_cases(), np.iinfo(np.int64).max, dtype=np.int64)
+        last = np.full(self.n_cases(), np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(first, case_of_event, timestamps)
+        np.maximum.at(last, case_of_event, timestamps)
+        has_events = np.bincount(case_of_event, minlength=self.n_cases()) > 0
+        spans = np.where(has_events, last, 0) - np.where(has_events, first, 0)
+        return np.where(has_events, spans / 10**6 / 3600, np.nan)
+
+    # variants with their number of cases, as pm4py.get_variants
+    def get_variants(self):
+        return {self.variant_activities(variant): count for variant, count in enumerate(self.variant_counts.tolist())}
+
+    # start activities with their number of cases, as pm4py.get_start_activities
+    def get_start_activities(self):
+        start_counts = np.bincount(self.variant_codes[self.variant_offsets[:-1]], weights=self.variant_counts, minlength=len(self.activities))
+        return {self.activities[code]: int(count) for code, count in enumerate(start_counts.tolist()) if count > 0}
+
+    # log of the given cases (indices in the order they should keep), the variants are numbered again
+    def select_cases(self, case_indices):
+        case_indices = np.asarray(case_indices, dtype=np.int64)
+        starts = self.case_offsets[case_indices]
+        lengths = self.case_offsets[case_indices + 1] - starts
+        case_offsets = offsets_from_lengths(lengths)
+        event_indices = np.arange(case_offsets[-1], dtype=np.int64) + np.repeat(starts - case_offsets[:-1], lengths)
+
+        # variants of the selected cases in order of their first case
+        variants, first_cases, case_variants = np.unique(self.case_variants[case_indices], return_index=True, return_inverse=True)
+        order = np.argsort(first_cases, kind="stable")
+        renumbered = np.empty(len(order), dtype=np.int64)
+        renumbered[order] = np.arange(len(order))
+        variants = variants[order]
+        variant_lengths = self.variant_offsets[variants + 1] - self.variant_offsets[variants]
+        variant_offsets = offsets_from_lengths(variant_lengths)
+        variant_events = np.arange(variant_offsets[-1], dtype=np.int64) + np.repeat(self.variant_offsets[variants] - variant_offsets[:-1], variant_lengths)
+
+        return EncodedLog(
+            self.activities,
+            [self.case_ids[case] for case in case_indices.tolist()],
+            self.activity_codes[event_indices],
+            self.timestamps[event_indices],
+            case_offsets,
+            renumbered[case_variants],
+            self.variant_codes[variant_events],
+            variant_offsets,
+            np.bincount(renumbered[case_variants], minlength=len(variants)),
+        )
+
+    # event log dataframe of the cases (all if None) for the pm4py algorithms (case id, activity and timestamp columns)
+    def to_dataframe(self, case_indices=None):
+        log = self if case_indices is None else self.select_cases(case_indices)
+        lengths = np.diff(log.case_offsets)
+        return pd.DataFrame({
+            "case:concept:name": np.repeat(np.array(log.case_ids, dtype=object), lengths),
+            "concept:name": np.array(log.activities, dtype=object)[log.activity_codes],
+            "time:timestamp": pd.to_datetime(log.timestamps, unit="us", utc=True),
+        })
+
+    # event log dataframe with one case per variant (case id = number of the variant, events one second apart), for the algorithms
+    # that only look at the order of the activities (e.g. token-based replay) and give the same result for every case of a variant
+    def variants_to_dataframe(self, variant_indices=None):
+        variant_indices = np.arange(self.n_variants()) if variant_indices is None else np.asarray(variant_indices, dtype=np.int64)
+        starts = self.variant_offsets[variant_indices]
+        lengths = self.variant_offsets[variant_indices + 1] - starts
+        event_indices = np.arange(lengths.sum(), dtype=np.int64) + np.repeat(starts - offsets_from_lengths(lengths)[:-1], lengths)
+        return pd.DataFrame({
+            "case:concept:name": np.repeat(variant_indices.astype(str).astype(object), lengths),
+            "concept:name": np.array(self.activities, dtype=object)[self.variant_codes[event_indices]],
+            "time:timestamp": pd.to_datetime(np.arange(len(event_indices)), unit="s", utc=True),
+        })
+
+    # one table per array for the log cache
+    def to_tables(self):
+        return {
+            "log_activity_names": pd.DataFrame({"activity": pd.Series(self.activities, dtype=object)}),
+            "log_events": pd.DataFrame({"activity_code": self.activity_codes, "timestamp": self.timestamps}),
+            "log_cases": pd.DataFrame({"case_id": pd.Series(self.case_ids, dtype=object), "variant": self.case_variants, "events": np.diff(self.case_offsets)}),
+            "log_variants": pd.DataFrame({"count": self.variant_counts, "events": np.diff(self.variant_offsets)}),
+            "log_variant_events": pd.DataFrame({"activity_code": self.variant_codes}),
+        }
+
+# log with the cases of new_log appended, a case of new_log with the case id of a case of log replaces it (changed cases come complete)
+# only the variant table and the activity names of log are looked at, its events are copied as arrays
+def replace_cases(log, new_log):
+    new_case_ids = set(new_log.case_ids)
+    kept_log = log.select_cases([case for case, case_id in enumerate(log.case_ids) if case_id not in new_case_ids])
+
+    # activity codes of new_log in the codes of log, activities that are new to the log get the next codes
+    activities = list(log.activities)
+    activity_codes = log.activity_code_map()
+    for activity in new_log.activities:
+        if activity not in activity_codes:
+            activity_codes[activity] = len(activities)
+            activities.append(activity)
+    new_codes = np.array([activity_codes[activity] for activity in new_log.activities], dtype=np.int64)
+    dtype = code_dtype(len(activities))
+
+    # variants of new_log in the variant table of the kept cases, variants that are new to the log are appended
+    variant_numbers = {tuple(kept_log.variant_codes[start:end].tolist()): variant for variant, (start, end) in enumerate(zip(kept_log.variant_offsets[:-1].tolist(), kept_log.variant_offsets[1:].tolist()))}
+    variant_codes = [kept_log.variant_codes.astype(dtype)]
+    variant_lengths = np.diff(kept_log.variant_offsets).tolist()
+    variant_counts = kept_log.variant_counts.tolist()
+    new_variants = []
+    for variant in range(new_log.n_variants()):
+        codes = tuple(new_codes[new_log.variant_codes[new_log.variant_offsets[variant]:new_log.variant_offsets[variant + 1]]].tolist())
+        number = variant_numbers.setdefault(codes, len(variant_numbers))
+        if number == len(variant_counts):
+            variant_codes.append(np.array(codes, dtype=dtype))
+            variant_lengths.append(len(codes))
+            variant_counts.append(0)
+        variant_counts[number] += int(new_log.variant_counts[variant])
+        new_variants.append(number)
+
+    return EncodedLog(
+        activities,
+        kept_log.case_ids + new_log.case_ids,
+        np.concatenate((kept_log.activity_codes.astype(dtype), new_codes[new_log.activity_codes].astype(dtype))),
+        np.concatenate((kept_log.timestamps, new_log.timestamps)),
+        offsets_from_lengths(np.concatenate((np.diff(kept_log.case_offsets), np.diff(new_log.case_offsets)))),
+        np.concatenate((kept_log.case_variants, np.array(new_variants, dtype=np.int64)[new_log.case_variants])),
+        np.concatenate(variant_codes),
+        offsets_from_lengths(variant_lengths),
+        np.array(variant_counts, dtype=np.int64),
+    )
+
+# variant table of a log with the positions of every activity in every variant, so the stages that follow the activities
+# through the variants (e.g. the successor counting of sim_probabilities) look positions up instead of searching the variants
+class VariantIndex:
+
+    def __init__(self, log):
+        self.activity_codes = log.activity_code_map()
+        self.variant_counts = log.variant_counts.tolist()
+        # sha256 of the variant table, two logs with the same variants and counts have the same fingerprint
+        fingerprint = hashlib.sha256(json.dumps(log.activities).encode("utf-8"))
+        for values in (log.variant_codes.astype(np.int64), log.variant_offsets.astype(np.int64), log.variant_counts.astype(np.int64)):
+            fingerprint.update(values.tobytes())
+        self.fingerprint = fingerprint.hexdigest()
+        # per variant: activity code -> positions of the activity in the variant (ascending)
+        self.positions = []
+        for variant in range(log.n_variants()):
+            positions = {}
+            for position, code in enumerate(log.variant_codes[log.variant_offsets[variant]:log.variant_offsets[variant + 1]].tolist()):
+                positions.setdefault(code, []).append(position)
+            self.positions.append(positions)
+
+    def n_variants(self):
+        return len(self.variant_counts)
+
+    # first position of the activity (code) in the variant after the position, None if it does not occur there
+    def next_position(self, variant, code, after=-1):
+        positions = self.positions[variant].get(code)
+        if positions is None:
+            return None
+        index = bisect_right(positions, after)
+        return positions[index] if index < len(positions) else None
+
+def offsets_from_lengths(lengths):
+    return np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+def from_tables(tables):
+    return EncodedLog(
+        tables["log_activity_names"]["activity"].tolist(),
+        tables["log_cases"]["case_id"].tolist(),
+        tables["log_events"]["activity_code"].to_numpy(),
+        tables["log_events"]["timestamp"].to_numpy(dtype=np.int64),
+        offsets_from_lengths(tables["log_cases"]["events"].to_numpy()),
+        tables["log_cases"]["variant"].to_numpy(dtype=np.int64),
+        tables["log_variant_events"]["activity_code"].to_numpy(),
+        offsets_from_lengths(tables["log_variants"]["events"].to_numpy()),
+        tables["log_variants"]["count"].to_numpy(dtype=np.int64),
+    )
+
+# smallest integer type for the activity codes
+def code_dtype(n_activities):
+    return np.int16 if n_activities <= np.iinfo(np.int16).max else np.int32
+
+# builds an encoded log trace by trace (e.g. from xes_stream.iter_traces), the events are kept in compact arrays while the log is read
+class EncodedLogBuilder:
+
+    def __init__(self):
+        self.activity_codes = {}
+        self.variant_numbers = {}
+        self.case_ids = []
+        self.case_lengths = array("q")
+        self.case_variants = array("q")
+        self.codes = array("i")
+        self.timestamps = array("q")
+        self.variant_counts = array("q")
+
+    def add_trace(self, case_id, activities, timestamps):
+        codes = tuple(self.activity_codes.setdefault(activity, len(self.activity_codes)) for activity in activities)
+        variant = self.variant_numbers.setdefault(codes, len(self.variant_numbers))
+        if variant == len(self.variant_counts):
+            self.variant_counts.append(0)
+        self.variant_counts[variant] += 1
+
+        self.case_ids.append(case_id)
+        self.case_lengths.append(len(codes))
+        self.case_variants.append(variant)
+        self.codes.extend(codes)
+        self.timestamps.extend(timestamps.tolist() if isinstance(timestamps, np.ndarray) else timestamps)
+
+    def encoded_log(self):
+        dtype = code_dtype(len(self.activity_codes))
+        variants = list(self.variant_numbers)
+        return EncodedLog(
+            list(self.activity_codes),
+            self.case_ids,
+            np.frombuffer(self.codes, dtype=np.int32).astype(dtype),
+            np.frombuffer(self.timestamps, dtype=np.int64).copy(),
+            offsets_from_lengths(np.frombuffer(self.case_lengths, dtype=np.int64)),
+            np.frombuffer(self.case_variants, dtype=np.int64).copy(),
+            np.fromiter((code for variant in variants for code in variant), dtype=dtype),
+            offsets_from_lengths([len(variant) for variant in variants]),
+            np.frombuffer(self.variant_counts, dtype=np.int64).copy(),
+        )
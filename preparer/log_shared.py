@@ -0,0 +1,123 @@
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from preparer import log_encoding
+
+### encoded log in shared memory for process pool workers: the log is published once, the workers attach to it by name
+### and get an EncodedLog whose arrays are views of the shared block (no copy and no pickling of the log per task)
+
+# alignment of the arrays in the block (bytes)
+ALIGNMENT = 64
+
+# arrays of an encoded log in the shared block
+SHARED_ARRAYS = ["activity_codes", "timestamps", "case_offsets", "case_variants", "variant_codes", "variant_offsets", "variant_counts", "case_id_offsets", "case_id_bytes"]
+
+# attached logs of this process by block name (a worker attaches once, however many tasks it runs)
+attached_logs = {}
+
+def aligned(position):
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+# shared block of a published log, the publishing process owns it and frees it with close (or at the end of the with block)
+class SharedLog:
+
+    def __init__(self, shared_block):
+        self.shared_block = shared_block
+        self.name = shared_block.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.shared_block is not None:
+            attached_logs.pop(self.name, None)
+            self.shared_block.close()
+            self.shared_block.unlink()
+            self.shared_block = None
+
+# layout of the block: 8 bytes header length, json header (activity names and position, dtype and length of every array), the arrays
+# python strings cannot be shared, so the case ids are in the block as utf-8 bytes with offsets and are decoded once per attaching process
+def publish_log(log, name=None):
+    encoded_case_ids = [case_id.encode("utf-8") for case_id in map(str, log.case_ids)]
+    arrays = {
+        "activity_codes": log.activity_codes,
+        "timestamps": log.timestamps,
+        "case_offsets": log.case_offsets,
+        "case_variants": log.case_variants,
+        "variant_codes": log.variant_codes,
+        "variant_offsets": log.variant_offsets,
+        "variant_counts": log.variant_counts,
+        "case_id_offsets": log_encoding.offsets_from_lengths([len(case_id) for case_id in encoded_case_ids]),
+        "case_id_bytes": np.frombuffer(b"".join(encoded_case_ids), dtype=np.uint8),
+    }
+    arrays = {field: np.ascontiguousarray(arrays[field]) for field in SHARED_ARRAYS}
+
+    # positions of the arrays behind the header (the header length depends on the positions, so they are counted from the end of the header)
+    layout = {}
+    position = 0
+    for field, values in arrays.items():
+        layout[field] = [values.dtype.str, position, len(values)]
+        position = aligned(position + values.nbytes)
+    header = json.dumps({"activities": log.activities, "arrays": layout}).encode("utf-8")
+    data_start = aligned(8 + len(header))
+
+    shared_block = shared_memory.SharedMemory(name=name, create=True, size=max(data_start + position, 1))
+    shared_block.buf[:8] = len(header).to_bytes(8, "little")
+    shared_block.buf[8:8 + len(header)] = header
+    for field, values in arrays.items():
+        start = data_start + layout[field][1]
+        np.ndarray(len(values), dtype=values.dtype, buffer=shared_block.buf, offset=start)[:] = values
+    print(f"Published the log in shared memory '{shared_block.name}' ({(data_start + position) / 2**20:.1f} MB)")
+    return SharedLog(shared_block)
+
+# encoded log of a published block, its arrays are read-only views of the block
+# the block stays open as long as the log (log.shared_block), the owner frees it
+def attach_log(name):
+    if name in attached_logs:
+        return attached_logs[name]
+
+    shared_block = shared_memory.SharedMemory(name=name)
+    header_length = int.from_bytes(shared_block.buf[:8], "little")
+    header = json.loads(bytes(shared_block.buf[8:8 + header_length]).decode("utf-8"))
+    data_start = aligned(8 + header_length)
+    arrays = {}
+    for field, (dtype, position, length) in header["arrays"].items():
+        arrays[field] = np.ndarray(length, dtype=np.dtype(dtype), buffer=shared_block.buf, offset=data_start + position)
+        arrays[field].flags.writeable = False
+
+    case_id_bytes = arrays["case_id_bytes"].tobytes()
+    case_id_offsets = arrays["case_id_offsets"].tolist()
+    case_ids = [case_id_bytes[start:end].decode("utf-8") for start, end in zip(case_id_offsets[:-1], case_id_offsets[1:])]
+
+    log = log_encoding.EncodedLog(
+        header["activities"],
+        case_ids,
+        arrays["activity_codes"],
+        arrays["timestamps"],
+        arrays["case_offsets"],
+        arrays["case_variants"],
+        arrays["variant_codes"],
+        arrays["variant_offsets"],
+        arrays["variant_counts"],
+    )
+    log.shared_block = shared_block
+    attached_logs[name] = log
+    return log
+
+# runs in the worker process: function(log, items, *args) on the items start:stop (e.g. cases or variants) of the published log
+def run_on_chunk(function, name, start, stop, args):
+    return function(attach_log(name), range(start, stop), *args)
+
+# split n_items (e.g. the cases or the variants of the log) into one contiguous chunk per worker and run function(log, items, *args) on every chunk
+# in a process pool, the log is published once for all workers, the results come back in the order of the chunks
+def map_chunks(function, log, n_items, args=(), workers=None):
+    workers = max(1, min(workers or 1, n_items))
+    bounds = np.linspace(0, n_items, workers + 1).astype(np.int64).tolist()
+    with publish_log(log) as shared_log, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_on_chunk, function, shared_log.name, start, stop, args) for start, stop in zip(bounds[:-1], bounds[1:])]
+        return [future.result() for future in futures]
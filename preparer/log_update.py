@@ -0,0 +1,50 @@
+import numpy as np
+from collections import Counter
+
+from preparer import log_encoding, xes_stream
+
+### incremental update of a prepared log with new or changed cases (e.g. the cases of the nightly export that are new or got new events)
+### the statistics of the prepared log are taken back from its tables, only the cases of the update are read
+
+# statistics of a prepared log (see xes_stream.empty_log_statistics) from the encoded log and the prepared tables
+# the summed flow times are the mean flow times times the number of cases
+def prepared_log_statistics(log, log_activities, vars_paths_durs, unique_combinations):
+    # variant (as text) -> position -> mean flow time
+    mean_flow_times = {}
+    for variant, index, flow_time in zip(vars_paths_durs["@@variant_column"].tolist(), vars_paths_durs["@@index_in_trace"].tolist(), vars_paths_durs["@@flow_time"].tolist()):
+        mean_flow_times.setdefault(variant, {})[index] = flow_time
+
+    variants = {}
+    for variant, count in log.get_variants().items():
+        positions = mean_flow_times.get(str(variant), {})
+        summed = np.array([positions[index] for index in range(len(positions))], dtype=np.float64) * count
+        variants[variant] = [count, summed, np.zeros(len(summed))]
+
+    frequencies = unique_combinations["frequency"].to_numpy(dtype=np.float64)
+    summed_durations = unique_combinations["mean_time_position_over_all_cases"].to_numpy(dtype=np.float64) * frequencies
+    directly_follows = {
+        (source, target): [int(frequency), summed_duration]
+        for source, target, frequency, summed_duration in zip(unique_combinations["concept:name"].tolist(), unique_combinations["concept:name_2"].tolist(), frequencies.tolist(), summed_durations.tolist())
+    }
+
+    return {
+        "activity_counts": Counter(log_activities),
+        "start_activities": Counter(log.get_start_activities()),
+        "directly_follows": directly_follows,
+        "variants": variants,
+        "cases": log.n_cases(),
+        "events": len(log),
+    }
+
+# apply the cases of new_log (encoded log of the new and changed cases) to the statistics and the encoded log of the prepared log
+# the previous versions of changed cases are taken out of the statistics, then every case of new_log is added
+def update_log_statistics(log_statistics, log, new_log):
+    new_case_ids = set(new_log.case_ids)
+    changed_cases = [case for case, case_id in enumerate(log.case_ids) if case_id in new_case_ids]
+    for case in changed_cases:
+        xes_stream.update_trace_statistics(log_statistics, *log.case_trace(case), sign=-1)
+    for case in range(new_log.n_cases()):
+        xes_stream.update_trace_statistics(log_statistics, *new_log.case_trace(case))
+
+    print(f"Log update: {new_log.n_cases() - len(changed_cases)} new and {len(changed_cases)} changed cases")
+    return log_encoding.replace_cases(log, new_log), log_statistics
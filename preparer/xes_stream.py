@@ -0,0 +1,134 @@
+import gzip
+import numpy as np
+import pandas as pd
+from collections import Counter
+from datetime import datetime, timezone
+from lxml import etree
+
+### streaming ingestion of xes logs: the statistics of the preparation in one pass over the file, trace by trace
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# key attribute of an xes element (string, date, ...) -> value
+def element_attributes(element):
+    return {child.get("key"): child.get("value") for child in element if child.get("key") is not None}
+
+# microseconds since the epoch (timestamps without time zone are taken as utc)
+def timestamp_microseconds(value):
+    timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+
+# traces of an xes file (also .xes.gz) one at a time: (case id, activities, timestamps in microseconds), the events ordered by timestamp
+# (equal timestamps keep the order of the file, as in pm4py.format_dataframe)
+# every trace is freed after it was yielded, so the memory is bounded by the longest trace
+# events without activity or timestamp and traces without case id are skipped, as pm4py.format_dataframe drops them
+def iter_traces(log_path):
+    with (gzip.open(log_path, "rb") if log_path.endswith(".gz") else open(log_path, "rb")) as file:
+        for _, trace in etree.iterparse(file, events=("end",), tag="{*}trace"):
+            case_id = element_attributes(trace).get("concept:name")
+            activities = []
+            timestamps = []
+            for event in trace.iterfind("{*}event"):
+                attributes = element_attributes(event)
+                if attributes.get("concept:name") is not None and attributes.get("time:timestamp") is not None:
+                    activities.append(attributes["concept:name"])
+                    timestamps.append(timestamp_microseconds(attributes["time:timestamp"]))
+
+            # free the trace and the traces before it (the log element keeps its children otherwise)
+            trace.clear()
+            while trace.getprevious() is not None:
+                del trace.getparent()[0]
+
+            if case_id is None or not activities:
+                continue
+            timestamps = np.array(timestamps, dtype=np.int64)
+            order = np.argsort(timestamps, kind="stable")
+            yield case_id, [activities[position] for position in order], timestamps[order]
+
+# seconds between two timestamps in microseconds, as pm4py gets them from the timedelta components (same floats)
+def flow_times(timestamps):
+    days, rest = np.divmod(np.diff(timestamps), 86400 * 10**6)
+    seconds, microseconds = np.divmod(rest, 10**6)
+    return (86400 * days + seconds).astype(np.float64) + 10**-6 * microseconds.astype(np.float64)
+
+# statistics of a log without traces
+# activity_counts: events per activity (in order of appearance), start_activities: cases per start activity
+# directly_follows: (source, target) -> [frequency, summed flow time in seconds]
+# variants: variant -> [cases, summed flow time per position, compensation of the sums]
+def empty_log_statistics():
+    return {
+        "activity_counts": Counter(),
+        "start_activities": Counter(),
+        "directly_follows": {},
+        "variants": {},
+        "cases": 0,
+        "events": 0,
+    }
+
+# add (sign 1) or remove (sign -1) the statistics of one trace, entries without cases left are dropped
+# the flow times of a variant are added with kahan summation like the group means of pandas, so the means hardly depend on the order of the cases
+def update_trace_statistics(log_statistics, activities, timestamps, sign=1):
+    log_statistics["cases"] += sign
+    log_statistics["events"] += sign * len(activities)
+    if sign > 0:
+        log_statistics["activity_counts"].update(activities)
+    else:
+        log_statistics["activity_counts"].subtract(activities)
+    log_statistics["start_activities"][activities[0]] += sign
+
+    durations = sign * flow_times(timestamps)
+    directly_follows = log_statistics["directly_follows"]
+    for source, target, duration in zip(activities, activities[1:], durations.tolist()):
+        frequency_duration = directly_follows.setdefault((source, target), [0, 0.0])
+        frequency_duration[0] += sign
+        frequency_duration[1] += duration
+        if frequency_duration[0] == 0:
+            del directly_follows[(source, target)]
+
+    variant = log_statistics["variants"].setdefault(tuple(activities), [0, np.zeros(len(durations)), np.zeros(len(durations))])
+    summed = variant[1] + (durations - variant[2])
+    variant[2] = (summed - variant[1]) - (durations - variant[2])
+    variant[1] = summed
+    variant[0] += sign
+    if variant[0] == 0:
+        del log_statistics["variants"][tuple(activities)]
+
+    if sign < 0:
+        for counts in (log_statistics["activity_counts"], log_statistics["start_activities"]):
+            for activity in set(activities):
+                if counts.get(activity) == 0:
+                    del counts[activity]
+
+# statistics of a log in one pass (see empty_log_statistics)
+# log_builder: log_encoding.EncodedLogBuilder that gets every trace as well (the compact log is built in the same pass)
+def read_log_statistics(log_path, log_builder=None):
+    log_statistics = empty_log_statistics()
+    for case_id, activities, timestamps in iter_traces(log_path):
+        if log_builder is not None:
+            log_builder.add_trace(case_id, activities, timestamps)
+        update_trace_statistics(log_statistics, activities, timestamps)
+    return log_statistics
+
+# activities with their number of events, most frequent first (as pm4py.get_event_attribute_values)
+def get_log_activities(log_statistics):
+    return dict(sorted(log_statistics["activity_counts"].items(), key=lambda item: -item[1]))
+
+# variants, paths and mean durations in the format of pm4py.get_variants_paths_duration (variant column as text)
+# one row per directly-follows pair of a variant: position, mean flow time over the cases of the variant and earlier occurrences of the pair in the variant
+def get_vars_paths_durs(log_statistics):
+    rows = []
+    for variant, (count, summed, _) in log_statistics["variants"].items():
+        mean_flow_times = (summed / count).tolist()
+        occurrences = Counter()
+        for index, path in enumerate(zip(variant, variant[1:])):
+            rows.append((index, mean_flow_times[index], occurrences[path], path[0], path[1], variant, count))
+            occurrences[path] += 1
+
+    # most frequent variants first, then the variants and positions in descending order
+    rows.sort(key=lambda row: (row[6], row[5], -row[0]), reverse=True)
+    vars_paths_durs = pd.DataFrame(rows, columns=["@@index_in_trace", "@@flow_time", "@@cumulative_occ_path_column", "concept:name", "concept:name_2", "@@variant_column", "@@variant_count"])
+    vars_paths_durs["@@variant_column"] = vars_paths_durs["@@variant_column"].astype(str)
+    return vars_paths_durs
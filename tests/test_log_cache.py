@@ -0,0 +1,16 @@
+import os
+import pandas as pd
+
+from preparer import log_cache
+
+# a cache directory that cannot be created makes the entry fail quietly instead of raising
+def test_store_tables_without_writable_cache_directory(tmp_path, capsys):
+    blocking_file = tmp_path / "not_a_directory"
+    blocking_file.write_text("")
+    entry_path = os.path.join(blocking_file, "v2-hash")
+    tables = {table: pd.DataFrame({"value": [1]}) for table in log_cache.CACHED_TABLES}
+
+    log_cache.store_tables(entry_path, tables)
+
+    assert not os.path.exists(entry_path)
+    assert "could not be cached" in capsys.readouterr().out
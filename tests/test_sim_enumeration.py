@@ -0,0 +1,44 @@
+import pandas as pd
+import pm4py
+from pm4py.objects.conversion.powl.converter import apply as powl_to_petri_net
+
+from generator.model_generator import ModelGenerator
+from preparer import bpmn_preparation
+from evaluator import sim_enumeration, sim_plan
+
+# A, then one of three branches: C, or B on two different branches (two tasks with the same name, so the variant A B has two paths)
+def duplicate_branch_plan(probabilities, durations=(1.0, 1.0, 1.0)):
+    generator = ModelGenerator()
+    model = generator.partial_order(dependencies=[(generator.activity("A"), generator.xor(generator.activity("B"), generator.activity("B"), generator.activity("C")))])
+    net, im, fm = powl_to_petri_net(model)
+    bpmn = bpmn_preparation.prepare_bpmn(pm4py.convert.convert_to_bpmn(net, im, fm))
+
+    gateway = [node for node in bpmn.get_nodes() if isinstance(node, pm4py.objects.bpmn.obj.BPMN.ExclusiveGateway) and len(node.get_out_arcs()) == 3][0]
+    task_a = [node for node in bpmn.get_nodes() if node.name == "A"][0]
+    remaining = list(probabilities["B"])
+    arc_probabilities = {}
+    for arc in gateway.get_out_arcs():
+        arc_probabilities[arc] = probabilities["C"] if arc.get_target().name == "C" else remaining.pop(0)
+    sim_durations_df = pd.DataFrame({"activity": ["A", "B", "C"], "weighted_significant_duration": list(durations)})
+    return sim_plan.compile_plan(bpmn, {gateway: {task_a: {1: arc_probabilities}}}, [], sim_durations_df), sim_durations_df
+
+# C (0.4) and the first path of A B (0.35) are found first, the second path of A B (0.25) makes it the most probable variant
+def test_top_k_waits_for_variant_that_overtakes_the_kth():
+    plan, _ = duplicate_branch_plan({"B": [0.35, 0.25], "C": 0.4})
+    variants, _ = sim_enumeration.enumerate_variants(plan, top_k=1)
+
+    top_variant = max(variants, key=lambda trace: variants[trace][0])
+    assert top_variant == ("A", "B")
+    assert abs(variants[("A", "B")][0] - 0.6) < 1e-12
+
+# top_k stops the walk after C (0.7), but the means still cover the B paths (A 1 + 0.3 * B 5 + 0.7 * C 2 = 3.9)
+def test_top_k_keeps_the_means_of_the_full_enumeration():
+    plan, sim_durations_df = duplicate_branch_plan({"B": [0.2, 0.1], "C": 0.7}, durations=(1.0, 5.0, 2.0))
+    full_results_df, full_mean, full_adjusted_mean, _ = sim_enumeration.get_enumeration_results(plan, sim_durations_df)
+    top_results_df, top_mean, top_adjusted_mean, top_info = sim_enumeration.get_enumeration_results(plan, sim_durations_df, top_k=1)
+
+    assert top_info["variants"] < len(full_results_df)
+    assert top_results_df["Trace"].tolist() == [["A", "C"]]
+    assert abs(top_mean - full_mean) < 1e-9
+    assert abs(top_adjusted_mean - full_adjusted_mean) < 1e-9
+    assert abs(full_mean - 3.9) < 1e-9
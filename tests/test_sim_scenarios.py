@@ -0,0 +1,24 @@
+import pandas as pd
+import pm4py
+from pm4py.objects.conversion.powl.converter import apply as powl_to_petri_net
+
+from generator.model_generator import ModelGenerator
+from preparer import bpmn_preparation
+from evaluator import sim_scenarios, kpi_accumulators
+
+# bpmn of the sequence A -> B (no gateways, so no probabilities are needed)
+def sequence_bpmn():
+    generator = ModelGenerator()
+    model = generator.partial_order(dependencies=[(generator.activity("A"), generator.activity("B"))])
+    net, im, fm = powl_to_petri_net(model)
+    return bpmn_preparation.prepare_bpmn(pm4py.convert.convert_to_bpmn(net, im, fm))
+
+# every scenario has its own work duration, not the one of the last scenario
+def test_scenario_sweep_duration_kpi_per_scenario():
+    sim_durations_df = pd.DataFrame({"activity": ["A", "B"], "weighted_significant_duration": [1.0, 2.0]})
+    scenarios = [{"name": "baseline"}, {"name": "slow A", "durations": {"A": 2.0}}]
+
+    scenario_results_df = sim_scenarios.run_scenario_sweep(sequence_bpmn(), {}, [], sim_durations_df, scenarios, n_runs=100, kpis=[kpi_accumulators.DurationKPI()])
+
+    assert scenario_results_df["Work Duration"].tolist() == [3.0, 4.0]
+    assert scenario_results_df["Duration"].tolist() == [3.0, 4.0]
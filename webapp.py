@@ -12,7 +12,7 @@ import shutil
 import uuid
 
 from generator import improvement_generator
-from evaluator import improvement_evaluator
+from evaluator import improvement_evaluator, kpi_accumulators, latency_budget
 from evaluator.cost import cost_evaluator
 from preparer import bpmn_preparation, evaluator_preparation
 
@@ -100,6 +100,17 @@ with st.sidebar:
         standard_goal = "reduce process execution cost"
     custom_goal = st.text_input("Enter custom optimization goal")
 
+    # optional latency budget: the pipeline lowers reasoning effort, replications and log sample to answer in time (0 = no budget)
+    budget_seconds = st.number_input("Latency budget [s]", min_value=0, value=0, step=10, help="0 runs the full evaluation without a time limit.")
+
+    # optional approximate evaluation for very large logs: the evaluation runs on a part of the cases and reports error bounds
+    approximation_mode = st.selectbox("Approximate evaluation", ("Off", "Stratified case sample", "Top variants"), help="Evaluate on a part of the log and report error bounds.")
+    approximation = None
+    if approximation_mode == "Stratified case sample":
+        approximation = {"mode": "sample", "fraction": st.slider("Share of the cases of every variant", min_value=0.01, max_value=1.0, value=0.1, step=0.01)}
+    elif approximation_mode == "Top variants":
+        approximation = {"mode": "top_variants", "coverage": st.slider("Share of the cases covered by the top variants", min_value=0.5, max_value=1.0, value=0.9, step=0.01)}
+
     # button to start the process improvement
     start = st.button("Start", type="primary", help="Start the process improvement.")
 
@@ -108,6 +119,9 @@ with st.sidebar:
         # check if all required inputs are provided
         if st.session_state.input_bpmn_path and ((standard_goal or custom_goal) or (standard_goal and custom_goal)) and event_log_path:
 
+            # the latency budget starts with the click, the measured stage costs are kept across runs
+            budget = latency_budget.LatencyBudget(budget_seconds, costs_path=os.path.join(output_path_prefix, "stage_costs.json")) if budget_seconds > 0 else None
+
             # create the run-specific output directory once at start
             if not st.session_state.output_path:
                 st.session_state.output_path = os.path.join(output_path_prefix, datetime.now().strftime("%Y%m%d_%H%M%S"))
@@ -161,11 +175,26 @@ with st.sidebar:
                     elif standard_goal and custom_goal:
                     # concatenate both goals to one string
                         goal = standard_goal + " and " + custom_goal
-                    explanation, improved_bpmn = improvement_generator.improve_process(input_bpmn, goal, st.session_state.output_path)
+                    if budget is not None:
+                        reasoning_effort = budget.plan_reasoning_effort(len(log))
+                        with budget.timed("improvement", "improvement_" + reasoning_effort):
+                            explanation, improved_bpmn = improvement_generator.improve_process(input_bpmn, goal, st.session_state.output_path, reasoning_effort=reasoning_effort)
+                    else:
+                        reasoning_effort = None
+                        explanation, improved_bpmn = improvement_generator.improve_process(input_bpmn, goal, st.session_state.output_path)
                     # persist improvement info for display after reruns
                     st.session_state.improved_bpmn = True
                     st.session_state.explanation = explanation
 
+                    # if cost information is available: the costs are computed in the same pass as the durations
+                    kpis = []
+                    if cost_information:
+                        defined_costs = cost_evaluator.get_defined_costs()
+                        unknown_costs = cost_evaluator.get_unknown_costs(improved_bpmn, defined_costs)
+                        if unknown_costs:
+                            defined_costs, unknown_costs_estimates = cost_evaluator.request_unknown_costs(unknown_costs, defined_costs, reasoning_effort=reasoning_effort)
+                        kpis = [kpi_accumulators.CostKPI(defined_costs)]
+
                     # evaluation of old process --> significant durations als sim durations df übergeben
                     if "fitting_traces_percentage_df" not in st.session_state:
                         (
@@ -176,7 +205,7 @@ with st.sidebar:
                             st.session_state.adjusted_mean_duration,
                             st.session_state.unknown_durations_estimates,
                             st.session_state.sim_durations_df
-                        ) = improvement_evaluator.evaluate_old_process(input_bpmn, log, log_activities, significant_durations_df, significant_durations_df)
+                        ) = improvement_evaluator.evaluate_old_process(input_bpmn, log, log_activities, significant_durations_df, significant_durations_df, kpis=kpis, budget=budget, approximation=approximation)
 
                     fitting_traces_percentage_df = st.session_state.fitting_traces_percentage_df
                     mean_duration_traces = st.session_state.mean_duration_traces
@@ -187,19 +216,15 @@ with st.sidebar:
                     sim_durations_df = st.session_state.sim_durations_df
                     
                     # evaluation of new process
-                    new_simulation_results_df, new_mean_duration, new_adjusted_mean_duration, new_unknown_durations_estimates, time_saved_percentage = improvement_evaluator.evaluate_new_process(improved_bpmn, log, log_activities, significant_durations_df, sim_durations_df, mean_duration_simulation)
+                    new_simulation_results_df, new_mean_duration, new_adjusted_mean_duration, new_unknown_durations_estimates, time_saved_percentage = improvement_evaluator.evaluate_new_process(improved_bpmn, log, log_activities, significant_durations_df, sim_durations_df, mean_duration_simulation, kpis=kpis, budget=budget, approximation=approximation)
                     st.session_state.new_simulation_results_df = new_simulation_results_df
                     st.session_state.new_mean_duration = new_mean_duration
                     st.session_state.new_adjusted_mean_duration = new_adjusted_mean_duration
                     st.session_state.new_unknown_durations_estimates = new_unknown_durations_estimates
                     st.session_state.time_saved_percentage = time_saved_percentage
 
-                    # if cost information is available: also evaluate costs
+                    # if cost information is available: mean costs (uses the cost columns of the evaluation)
                     if cost_information:
-                        defined_costs = cost_evaluator.get_defined_costs()
-                        unknown_costs = cost_evaluator.get_unknown_costs(improved_bpmn, defined_costs)
-                        if unknown_costs:
-                            defined_costs, unknown_costs_estimates = cost_evaluator.request_unknown_costs(unknown_costs, defined_costs)
                         fitting_traces_percentage_df, mean_cost_traces = cost_evaluator.evaluate_costs(defined_costs, fitting_traces_percentage_df)
                         simulation_results_df, mean_cost_simulation = cost_evaluator.evaluate_costs(defined_costs, simulation_results_df)
                         new_simulation_results_df, new_mean_cost = cost_evaluator.evaluate_costs(defined_costs, new_simulation_results_df)
@@ -207,6 +232,20 @@ with st.sidebar:
                         st.session_state.new_mean_cost = new_mean_cost
                         st.session_state.unknown_costs_estimates = unknown_costs_estimates
 
+                # error bounds of the approximate evaluation
+                st.session_state.approximation_report = None
+                if approximation is not None:
+                    st.session_state.approximation_report = {
+                        "traces": fitting_traces_percentage_df.attrs.get("error_bounds"),
+                        "old_gateways": simulation_results_df.attrs.get("gateway_error_bounds"),
+                        "new_gateways": new_simulation_results_df.attrs.get("gateway_error_bounds"),
+                    }
+
+                # fidelity settings the latency budget ended up with
+                st.session_state.fidelity_report = budget.report() if budget is not None else None
+                if budget is not None:
+                    print("Latency budget report:", st.session_state.fidelity_report)
+
                 st.success("Process improved!")
 
         elif not st.session_state.input_bpmn_path:
@@ -252,6 +291,18 @@ if st.session_state.get("improved_bpmn"):
     with st.expander("Improvement Explanation", icon=":material/question_mark:", expanded=False):
         st.write(st.session_state.get("explanation", ""))
 
+    if st.session_state.get("fidelity_report"):
+        with st.expander("Latency Budget Fidelity", icon=":material/timer:", expanded=False):
+            st.json(st.session_state.fidelity_report)
+
+    if st.session_state.get("approximation_report"):
+        with st.expander("Approximation Error Bounds", icon=":material/query_stats:", expanded=False):
+            st.json(st.session_state.approximation_report["traces"])
+            st.markdown("Gateway probabilities of the original model")
+            st.dataframe(st.session_state.approximation_report["old_gateways"], hide_index=True)
+            st.markdown("Gateway probabilities of the improved model")
+            st.dataframe(st.session_state.approximation_report["new_gateways"], hide_index=True)
+
 # summary of the evaluation results
 col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
 